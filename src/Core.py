@@ -1,7 +1,7 @@
 # Core.py
 # This file contains all core functions and classes used throughout the game
 # This file is a dependency of Creatures.py, Items.py, Menu.py, and Interpreter.py
-# and is dependent on Data.py
+# and is dependent on Data.py and Formatting.py
 
 # It consists of three main parts;
 # 1. Core functions			(used throughout gameplay)
@@ -11,20 +11,28 @@
 
 import sys, os, re, subprocess
 import tempfile
+import threading, queue, codecs
 import subprocess
 import atexit
+import weakref
 try:
 	import msvcrt
 	sys.stdout.reconfigure(encoding='utf-8')
 except:
 	import termios, select, tty, shlex
 
-from time import sleep
-from random import choice,choices,randint,sample,shuffle
+from time import sleep, perf_counter
+from random import choice,choices,randint,random,sample,shuffle
 from math import floor, sqrt
 from bisect import insort
+from operator import attrgetter
+from abc import ABC, abstractmethod
+from heapq import heapify, heappush, heappop
 
 import Data
+# formatColorCodes isn't used here, it is re-exported so callers of
+# Core.formatColorCodes don't change now that it lives in Formatting.py
+from Formatting import ANSI_ESCAPE, displayLength, formatColorCodes, tinge, tingeName
 
 
 
@@ -81,6 +89,8 @@ def getRoomKey(room,world):
 
 # clear screen on windows or unix systems
 def clearScreen(delay=0.1):
+	if not outputSink.terminal:
+		return
 	if os.name == "nt":
 		os.system("cls")
 		# ensure screen isn't being cleared during subsequent output
@@ -91,6 +101,11 @@ def clearScreen(delay=0.1):
 
 # clears pending keyboard input. strategy varies by operating system.
 def flushInput():
+	if inputReader.isRunning():
+		inputReader.flush()
+	# a headless sink may be reading piped input, which has no terminal to flush
+	if not outputSink.terminal:
+		return
 	try:
 		while msvcrt.kbhit():
 			msvcrt.getch()
@@ -102,7 +117,10 @@ def flushInput():
 
 
 # checks for any keyboard input in buffer
+# if the input reader is running, this is just a flag check rather than a syscall
 def kbInput():
+	if inputReader.isRunning():
+		return inputReader.hasInput()
 	try:
 		dr,dw,de = select.select([sys.stdin], [], [], 0.00001)
 		return dr != []
@@ -110,87 +128,77 @@ def kbInput():
 		return msvcrt.kbhit()
 
 
-# color text using ANSI formatting
-def tinge(color,*args):
-	if len(args) > 0 and color is not None:
-		args = list(args)
-		c = Data.colorCodes[color]
-		args[0] = f"\033[{c}m" + args[0]
-		args[-1] = args[-1] + f"\033[0m"
-	return tuple(args)
-
-
-# calculate lengths of displaying string by ignoring formatting chars
-def displayLength(text):
-	# Regular expression to match ANSI escape sequences
-	# ansi_escape = re.compile(r"\033\[[0-9;]*m")
-	l = len(ANSI_ESCAPE.sub("", text.replace("\n","")))
-	return l
-
-
-def formatColorCodes(text):
-	for color,code in Data.colorCodes.items():
-		text = text.replace(f"<{color}>",f"\033[{code}m")
-	text = text.replace("<x>","\033[37m")
-	return text
-
-
 # print text to user, with options for color, delay, sep, end, and outfile
 # also manipulates the output based on player status effects
 def Print(*args,end="\n",sep=None,delay=None,color=None,allowSilent=True,outfile=None):
 	if (game.silent or player.hasStatus("asleep")) and allowSilent:
 		return 0
+	# a headless sink pays nothing for text that is never shown
+	if outputSink.discards and (outfile is None or outfile is sys.stdout):
+		return 0
 
-	# preprocessing to handle conditions that affect text content
+	# preprocessing to handle conditions that affect text content and color
 	args = [str(arg) for arg in args]
-	if not player.canNavigate():
-		args = [ambiguateDirections(arg) for arg in args]
-	if player.hasStatus("stupidity") and color not in ("k","y"):
-		args = [ambiguateNumbers(arg,grammatical=True) for arg in args]
-		# don't misspell in stats sidepanel
-		if outfile in (None,sys.stdout):
-			args = [misspell(arg) for arg in args]
-
-	# set outfile, color, delay, sep
-	if outfile is None:
-		outfile = sys.stdout
-	if player.hasStatus("apathy") and color != "k":
-		color = "w"
-	elif player.hasStatus("insanity") and color != "k" and outfile is sys.stdout:
-		color = choices(list(Data.colorCodes.keys()),[1]*7 + [28])[0]
-	if delay is None:
-		if player.hasAnyStatus("dead","slowness"): delay = 0.03
-		else: delay = 0.001
+	args, color = outputFilters.apply(args,color,outfile)
 	if sep is None:
 		sep=" " if len(args) > 1 else ""
 
-	# save printLength for return, add color formatting
-	printLength = sum(displayLength(s) for s in args) + \
-		displayLength(sep)*(len(args)-1) + displayLength(end)
+	# terminal output is handled by the selected OutputSink
+	if outfile is None or outfile is sys.stdout:
+		return outputSink.write(args,sep,end,color,delay)
+
+	# other files, like the sidepanel, are written to directly
+	printLength = printedLength(args,sep,end)
 	if color is not None:
 		args = tinge(color,*args)
+	print(*args,end=end,sep=sep,file=outfile)
+	return printLength
 
-	# output text
-	if game.mode == 1 or delay is None or outfile is not sys.stdout:
-		print(*args,end=end,sep=sep,file=outfile)
-		return printLength
-	sleep(delay)
-	outfile.flush()
-	for arg in args:
-		for char in str(arg):
-			# user keyboard input speeds up text output
-			if kbInput() and not player.hasStatus("slowness"):
-				delay = 0
-			outfile.write(char)
+
+# the number of characters Print() shows for args, not counting formatting
+def printedLength(args,sep,end):
+	return sum(displayLength(s) for s in args) + \
+		displayLength(sep)*(len(args)-1) + displayLength(end)
+
+
+# matches the units that typewrite() draws; escape sequences count as one unit
+TYPEWRITER_UNIT = re.compile(r"\x1b\[[0-9;?]*[ -/]*[A-Za-z]|.",re.DOTALL)
+
+# writes text at one character per delay seconds, drawing it in frames
+# each frame is a single write and flush, and input is only polled once per frame
+# if skippable and a key is pressed, the rest of the text is written at once
+def typewrite(text,delay,outfile=None,skippable=True):
+	if outfile is None:
+		outfile = sys.stdout
+	if delay <= 0:
+		outfile.write(text)
+		outfile.flush()
+		return
+	units = TYPEWRITER_UNIT.findall(text)
+	charsPerFrame = max(1,round(1 / (Data.FRAME_RATE*delay)))
+	start = perf_counter()
+	shown = 0
+	i = 0
+	while i < len(units):
+		if skippable and kbInput():
+			outfile.write("".join(units[i:]))
 			outfile.flush()
-			sleep(delay)
-		outfile.write(sep)
+			return
+		frame = []
+		n = 0
+		while i < len(units) and n < charsPerFrame:
+			# escape sequences take no time to show
+			if len(units[i]) == 1:
+				n += 1
+			frame.append(units[i])
+			i += 1
+		outfile.write("".join(frame))
 		outfile.flush()
-	sleep(delay)
-	outfile.write(end)
-	outfile.flush()
-	sleep(delay)
-	return printLength
+		shown += n
+		# pace by the total shown so far, so slow writes don't accumulate delay
+		wait = start + shown*delay - perf_counter()
+		if wait > 0:
+			sleep(wait)
 
 
 # waits for any keyboard input on windows and unix
@@ -198,11 +206,14 @@ def waitInput(text=None,end="\n",delay=None,color=None):
 	sys.stdout.flush
 	if text is not None:
 		Print(text,end=end,delay=delay,color=color,allowSilent=False)
-	# just pass if in test mode
-	if game.mode == 1:
+	sidepanel.refresh()
+	# just pass if in test mode, or if there is no terminal to press a key in
+	if game.mode == 1 or not outputSink.terminal:
 		return True
 	flushInput()
-	if os.name == 'nt':  # For Windows
+	if inputReader.isRunning() and os.name != 'nt':
+		inputReader.waitKey()
+	elif os.name == 'nt':  # For Windows
 		msvcrt.getch()
 	else:  # For Unix-based systems
 		fd = sys.stdin.fileno()
@@ -218,6 +229,8 @@ def waitInput(text=None,end="\n",delay=None,color=None):
 def movePrintCursor(nlines,clear=False,clearLast=True,outfile=None):
 	if outfile is None:
 		outfile = sys.stdout
+	if outfile is sys.stdout and not outputSink.terminal:
+		return
 	step = 1 if nlines > 0 else -1  # direction
 	for i in range(abs(nlines)):
 		# Move one line in the desired direction
@@ -238,12 +251,18 @@ def movePrintCursor(nlines,clear=False,clearLast=True,outfile=None):
 
 
 # print prompt, print cue, and read in user input
+# functions called with each line the player enters, such as the event transcript
+inputListeners = []
+
 def Input(prompt="",cue="\n> ",low=True,delay=None,color=None):
 	sys.stdout.flush()
 	# should never be silent when asking for input
 	Print(prompt,end="",delay=delay,color=color,allowSilent=False)
 	Print(cue,end="",delay=0,color=color,allowSilent=False)
+	sidepanel.refresh()
 	ret = input()
+	for listener in inputListeners:
+		listener(ret)
 	if low:
 		ret = ret.lower()
 	return ret
@@ -258,8 +277,9 @@ def InputLock(prompt="",cue="\n> ",acceptKey=None,low=True,delay=None,color=None
 	Print(prompt,end="",delay=delay,color=color,allowSilent=False)
 
 	# leave an aesthetic buffer so the cue is never at the very bottom of the screen
-	print("\n"*cueLines,end="")
-	movePrintCursor(cueLines,clear=True,clearLast=False)
+	if outputSink.terminal:
+		print("\n"*cueLines,end="")
+		movePrintCursor(cueLines,clear=True,clearLast=False)
 
 	while True:
 		sys.stdout.flush()
@@ -327,42 +347,49 @@ def ellipsis(n=3,color=None):
 	delay(1)
 
 
-# prints a list of strings, l, into n columns of width w characters
+# arranges a list of strings, l, into rows of n columns of width w characters
 # if an element is longer than one column, it takes up as many columns as needed
 # b is the number of buffer spaces between columns
-def columnPrint(l,n,w=None,b=1,delay=0,color=None,inplace=False,outfile=None):
-	# automatically set column width based on longest item
+# returns the list of rows, each padded so that columns stay aligned
+def columnLayout(l,n,w=None,b=1):
+	l = [str(term) for term in l]
+	# measure each term once, trailed by b buffer spaces
 	termLengths = [displayLength(term)+b for term in l]
+	# automatically set column width based on longest item
 	if w is None:
 		w = max(termLengths)+b
 	assert w > 1
 
-	nRowsPrinted = 1
-	# k is the number of characters that have been printed in the current row
+	buf = " "*b
+	rows = [[]]
+	# k is the number of characters in the current row
 	k = 0
-	# for each string element in l
 	for term, length in zip(l,termLengths):
-		# all terms are trailed by b buffer spaces
-		buf = (" "*b)
-		# if the string is longer than remaining row width
-		# print on a new row
+		# if the string is longer than remaining row width, start a new row
 		if length > (n*w) - k:
-			if inplace:
-				movePrintCursor(-1,outfile=outfile)
-				newline=""
-			else:
-				newline="\n"
-				nRowsPrinted += 1
-			k = Print(newline+term+buf,end="",delay=delay,color=color,outfile=outfile)
-		# if the string is short enough, print it, increment k
-		else:
-			k += Print(term+buf,end="",delay=delay,color=color,outfile=outfile)
-		# to preserve column alignment, print spaces until k is divisble by w
+			rows.append([])
+			k = 0
+		k += length
+		# to preserve column alignment, pad with spaces until k is divisible by w
 		spaces = (-k % w)
-		k += Print(spaces * ' ',end="",delay=delay,color=color,outfile=outfile)
-	if not inplace:
-		Print(outfile=outfile)
-	return nRowsPrinted
+		k += spaces
+		rows[-1].append(term + buf + " "*spaces)
+	return ["".join(row) for row in rows]
+
+
+# prints a list of strings, l, into n columns of width w characters
+# the whole grid is laid out first, then shown with a single Print()
+# if inplace, rows are drawn by moving the cursor down instead of with newlines,
+# overwriting what was there
+# returns the number of rows printed
+def columnPrint(l,n,w=None,b=1,delay=0,color=None,inplace=False,outfile=None):
+	rows = columnLayout(l,n,w=w,b=b)
+	if inplace:
+		# move down one line and return to its start, as movePrintCursor(-1) does
+		Print("\033[1B\r".join(rows),end="",delay=delay,color=color,outfile=outfile)
+		return 1
+	Print("\n".join(rows),delay=delay,color=color,outfile=outfile)
+	return len(rows)
 
 
 # capitalizes the first letter of all the words in a string
@@ -472,27 +499,40 @@ def subsume(lst,idx):
 	lst.pop(idx)
 
 
+# the vocabulary used by ambiguateDirections(), built once at import
+DIRECTIONS = frozenset(Data.cardinals) # north, northeast, southeast etc.
+WARDS = frozenset(dir+"ward" for dir in Data.cardinals) | \
+	frozenset(dir+"wards" for dir in Data.cardinals)
+ERNS = frozenset(dir+"ern" for dir in Data.cardinals)
+DIRECTIONAL_TERMS = DIRECTIONS | WARDS | ERNS
+UNKNOWN_DIRS = ("some direction","one way","in a certain direction","up ahead",
+"a ways away","far off","over yonder","elsewhere")
+ADDITIONAL_UNKNOWN_DIRS = ("another direction","some other way","the other way",
+"behind","also ahead")
+ADJECTIVAL_UNKNOWN_DIRS = ("the nearby","the far","the left","the right")
+# prepositions that precede directions, e.g. "from the north"
+DIR_PREPS = frozenset({"of","from","to","toward","into","on","in","at","by","across",
+"along"})
+# words that follow directional nouns, e.g. "Eastward, stands a window"
+FOLLOWS_NOUN_DIR = frozenset({"there","theres","is","are","lie","stand","rise","begin",
+"stretch","extend","run","rest","reach","flow"}) | DIR_PREPS
+
+
 # replaces directional terms in text with ambiguous alternatives
 def ambiguateDirections(text):
-	directions = Data.cardinals # north, northeast, southeast etc.
-	wards = tuple(dir+"ward" for dir in directions) + \
-		tuple(dir+"wards" for dir in directions)
-	erns = tuple(dir+"ern" for dir in directions)
-	unknownDirs = ("some direction","one way","in a certain direction","up ahead",
-	"a ways away","far off","over yonder","elsewhere")
-	additionalUnknownDirs = ("another direction","some other way","the other way",
-	"behind","also ahead")
-	adjectivalUnknownDirs = ("the nearby","the far","the left","the right")
-	# prepositions that precede directions, e.g. "from the north"
-	dirPreps = {"of","from","to","toward","into","on","in","at","by","across","along"}
-	# words that follow directional nouns, e.g. "Eastward, stands a window"
-	followsNounDir = {"there","theres","is","are","lie","stand","rise","begin","stretch",
-	"extend","run","rest","reach","flow"}
+	# no direction to replace, don't bother tokenizing
+	if not any(term in text.lower() for term in Data.cardinals):
+		return text
+	directions, wards, erns = DIRECTIONS, WARDS, ERNS
+	dirPreps = DIR_PREPS
+	unknownDirs = UNKNOWN_DIRS
+	additionalUnknownDirs = ADDITIONAL_UNKNOWN_DIRS
+	adjectivalUnknownDirs = ADJECTIVAL_UNKNOWN_DIRS
 
 	# Assume a token t1 is a noun if it ends with punctuation or t2 is a relevant verb
 	def dirIsNoun(t1,t2):
 		return t1[-1] in Data.symbols or clean(t2).endswith("s") or \
-			clean(t2) in followsNounDir|dirPreps
+			clean(t2) in FOLLOWS_NOUN_DIR
 
 	lastChoice = None
 	replacedYet = False
@@ -530,7 +570,7 @@ def ambiguateDirections(text):
 		t2 = tokens[i+2] if i+2 < len(tokens) else None
 		# print(i,t0,t1,t2)
 		# 0. Remove adjectives; "the far northern" -> "the northern"
-		if clean(t0) == "the" and clean(t2) in directions+wards+erns:
+		if clean(t0) == "the" and clean(t2) in DIRECTIONAL_TERMS:
 			subsume(tokens,i+1)
 			i -= 1
 		# 1. Simplify terms; "northward(s)" -> "north"
@@ -568,24 +608,25 @@ def ambiguateDirections(text):
 	return " ".join([t for t in tokens if t is not None])
 
 
+# capture the number and the preceding non-whitespace character (if any)
+# don't match ordinals (1st, 2nd, 3rd, 4th, etc)
+NUMBER_PATTERN = re.compile(r'(?:(?P<prev>[^\d\s]))?\s*(?P<num>\d+)(?!st|nd|rd|th)')
+NUMBER_REPLACEMENTS = {
+	"none": ("no","zero","not any"),
+	"two": ("two","a couple","a pair of"),
+	"few": ("a few","not many","a small amount of"),
+	"some": ("some","several","an amount of"),
+	"many": ("many","a lot of","a bunch of","a big amount of"),
+	"a ton": ("a ton of","a whole lot of","a really big amount of")
+}
+# when printing stats, don't use random selections
+PLAIN_NUMBER_REPLACEMENTS = {k:(k,) for k in NUMBER_REPLACEMENTS}
+
+
 # replaces numbers in text with ambiguous alternative words
 def ambiguateNumbers(text,grammatical=False):
 	text = str(text)
-	# capture the number and the preceding non-whitespace character (if any)
-	# don't match ordinals (1st, 2nd, 3rd, 4th, etc)
-	pattern = r'(?:(?P<prev>[^\d\s]))?\s*(?P<num>\d+)(?!st|nd|rd|th)'
-
-	replacementMap = {
-		"none": ("no","zero","not any"),
-		"two": ("two","a couple","a pair of"),
-		"few": ("a few","not many","a small amount of"),
-		"some": ("some","several","an amount of"),
-		"many": ("many","a lot of","a bunch of","a big amount of"),
-		"a ton": ("a ton of","a whole lot of","a really big amount of")
-	}
-	# when printing stats, don't use random selections
-	if not grammatical:
-		replacementMap = {k:(k,) for k in replacementMap}
+	replacementMap = NUMBER_REPLACEMENTS if grammatical else PLAIN_NUMBER_REPLACEMENTS
 
 	def repl(match):
 		prev = match.group("prev")
@@ -622,16 +663,19 @@ def ambiguateNumbers(text,grammatical=False):
 		replacement = textBeforeNum + replacement
 		return replacement
 
-	return re.sub(pattern, repl, text)
+	return NUMBER_PATTERN.sub(repl, text)
+
+
+MISSPELLINGS = {
+	"to":"too", "too":"to", "there":"their", "where":"wear", "sword":"sord",
+	"library":"libary", "higher":"hire", "break":"brake", "window":"windo",
+	"above":"abuv", "python":"pithon"
+}
 
 
 # introduces common misspellings into text
 def misspell(text):
-	replacementMap = {
-		"to":"too", "too":"to", "there":"their", "where":"wear", "sword":"sord",
-		"library":"libary", "higher":"hire", "break":"brake", "window":"windo",
-		"above":"abuv", "python":"pithon"
-	}
+	replacementMap = MISSPELLINGS
 	def getReplacement(oldToken):
 		newToken = replacementMap[clean(oldToken)]
 		if oldToken[0].isupper():
@@ -644,7 +688,7 @@ def misspell(text):
 	tokens = text.split(" ")
 	i = 0
 	while i < len(tokens):
-		if clean(tokens[i]) in replacementMap and randint(0,3) == 0:
+		if clean(tokens[i]) in replacementMap and random() < 0.25:
 			tokens[i] = getReplacement(tokens[i])
 		i += 1
 	text = " ".join(tokens)
@@ -657,14 +701,14 @@ def misspell(text):
 	i = 0
 	while i < len(text):
 		if i < 0: i = 0
+		# 25% chance of misspelling
+		if random() >= 0.25:
+			i += 1
+			continue
 		t0 = text[i]
 		t1 = text[i+1] if i+1 < len(text) else None
 		t2 = text[i+2] if i+2 < len(text) else None
 
-		# 25% chance of misspelling
-		if randint(0,3) != 0:
-			i += 1
-			continue
 		# print(text+"\n",i,t0,t1,t2,"\n")
 		match (t0,t1,t2):
 			# double letter -> single letter
@@ -728,6 +772,203 @@ def misspell(text):
 	return text
 
 
+# An OutputFilter rewrites the text or color of everything Print() shows,
+# as a consequence of one of the player's conditions.
+# isActive(player) decides whether the filter is part of the active chain.
+# if static, isActive depends only on the player's status conditions, so it is
+# only reevaluated when they change. otherwise it is evaluated on every Print.
+# accepts(color,outfile) can exempt particular output, such as the side panel.
+class OutputFilter():
+	def __init__(self,name,isActive,text=None,color=None,accepts=None,static=True):
+		self.name = name
+		self.isActive = isActive
+		self.text = text
+		self.color = color
+		self.accepts = accepts if accepts else lambda color, outfile: True
+		self.static = static
+
+
+	def __repr__(self):
+		return f"<OutputFilter {self.name}>"
+
+
+
+# the registered OutputFilters, applied in order of registration by Print()
+class OutputPipeline():
+	def __init__(self):
+		self.filters = []
+		# the chain is cached along with the status names it was computed for
+		self.statusKey = None
+		self.chain = []
+
+
+	def register(self,outputFilter):
+		self.filters.append(outputFilter)
+		self.statusKey = None
+		return outputFilter
+
+
+	def unregister(self,name):
+		self.filters = [f for f in self.filters if f.name != name]
+		self.statusKey = None
+
+
+	def activeChain(self):
+		statusKey = (id(player), frozenset(cond[0] for cond in player.status))
+		if statusKey != self.statusKey:
+			self.statusKey = statusKey
+			self.chain = [f for f in self.filters if not f.static or f.isActive(player)]
+		return [f for f in self.chain if f.static or f.isActive(player)]
+
+
+	# apply the active text filters to each arg, then the color filters
+	# filters see the color as it was given, before any color filter changed it
+	def apply(self,args,color,outfile):
+		chain = self.activeChain()
+		if not chain:
+			return args, color
+		givenColor = color
+		for f in chain:
+			if f.text and f.accepts(givenColor,outfile):
+				args = [f.text(arg) for arg in args]
+		for f in chain:
+			if f.color and f.accepts(givenColor,outfile):
+				color = f.color(color)
+		return args, color
+
+
+outputFilters = OutputPipeline()
+
+# the color palette for insanity, weighted heavily toward no change
+INSANE_COLORS = list(Data.colorCodes.keys())
+INSANE_WEIGHTS = [1]*7 + [28]
+
+outputFilters.register(OutputFilter("disorientation",
+	lambda p: not p.canNavigate(),
+	text=ambiguateDirections,static=False))
+outputFilters.register(OutputFilter("innumeracy",
+	lambda p: p.hasStatus("stupidity"),
+	text=lambda text: ambiguateNumbers(text,grammatical=True),
+	accepts=lambda color, outfile: color not in ("k","y")))
+# don't misspell in stats sidepanel
+outputFilters.register(OutputFilter("misspelling",
+	lambda p: p.hasStatus("stupidity"),
+	text=misspell,
+	accepts=lambda color, outfile: color not in ("k","y") and outfile in (None,sys.stdout)))
+outputFilters.register(OutputFilter("apathy",
+	lambda p: p.hasStatus("apathy"),
+	color=lambda color: "w",
+	accepts=lambda color, outfile: color != "k"))
+outputFilters.register(OutputFilter("insanity",
+	lambda p: p.hasStatus("insanity") and not p.hasStatus("apathy"),
+	color=lambda color: choices(INSANE_COLORS,INSANE_WEIGHTS)[0],
+	accepts=lambda color, outfile: color != "k" and outfile in (None,sys.stdout)))
+
+
+# An OutputSink receives everything Print() shows on the terminal.
+# One is selected at startup with setOutput(); write() returns the printed length.
+class OutputSink(ABC):
+	# if True, Print() returns before doing any formatting
+	discards = False
+	# if True, the sink is an interactive terminal which may be cleared and redrawn
+	terminal = False
+
+	@abstractmethod
+	def write(self,args,sep,end,color,delay):
+		pass
+
+
+	def close(self):
+		return
+
+
+
+# colors the text and typewrites it to stdout, or prints it at once in test mode
+class TerminalSink(OutputSink):
+	terminal = True
+
+	def write(self,args,sep,end,color,delay):
+		if delay is None:
+			if player.hasAnyStatus("dead","slowness"): delay = 0.03
+			else: delay = 0.001
+		# save printLength for return, add color formatting
+		printLength = printedLength(args,sep,end)
+		if color is not None:
+			args = tinge(color,*args)
+		if game.mode == 1:
+			print(*args,end=end,sep=sep)
+			return printLength
+		# user keyboard input speeds up text output, unless slowed
+		typewrite(sep.join(args)+end,delay,sys.stdout,
+		skippable=not player.hasStatus("slowness"))
+		return printLength
+
+
+
+# writes plain text to a log file only, without color or delays
+class TranscriptSink(OutputSink):
+	def __init__(self,logFile):
+		os.makedirs(os.path.dirname(logFile) or ".",exist_ok=True)
+		self.log = open(logFile,"w",encoding="utf-8",errors="replace")
+
+
+	def write(self,args,sep,end,color,delay):
+		self.log.write(sep.join(args)+end)
+		return printedLength(args,sep,end)
+
+
+	def close(self):
+		self.log.close()
+
+
+
+# keeps each printed text as an event, which the caller collects with drain()
+class StructuredSink(OutputSink):
+	def __init__(self):
+		self.events = []
+
+
+	def write(self,args,sep,end,color,delay):
+		text = sep.join(args)+end
+		self.events.append({"text": text, "color": color, "time": game.time})
+		return printedLength(args,sep,end)
+
+
+	def drain(self):
+		events, self.events = self.events, []
+		return events
+
+
+
+# shows nothing at all, for tests and headless simulations
+class NullSink(OutputSink):
+	discards = True
+
+	def write(self,args,sep,end,color,delay):
+		return 0
+
+
+outputSink = TerminalSink()
+
+# replace the current output sink with a new one of the given kind
+# kind may be 'terminal', 'transcript' (which requires a logFile), 'structured', or 'null'
+def setOutput(kind,logFile=None):
+	global outputSink
+	sinks = {
+		"terminal": TerminalSink,
+		"transcript": lambda: TranscriptSink(logFile),
+		"structured": StructuredSink,
+		"null": NullSink
+	}
+	if kind not in sinks:
+		raise ValueError(f"Unknown output sink '{kind}'")
+	if kind == "transcript" and logFile is None:
+		raise ValueError("A transcript sink requires a logFile")
+	outputSink.close()
+	outputSink = sinks[kind]()
+	return outputSink
+
+
 # returns an abbreviated direction into an expanded one
 # for example, converts 'nw' -> 'northwest' or 'u' -> 'up'
 def expandDir(term):
@@ -886,27 +1127,50 @@ def assignRefsRecur(parent):
 		assignRefsRecur(obj)
 
 
-# removes any room links pointing to rooms which don't exist in the world,
-# to prevent errors if the world file was written incorrectly
-# also assigns references for all world objects (parent, occupants, cover, carrying etc.)
-# also assigns dialogue trees for speakers and validates them
-def buildWorld():
-	# assign all room links to existing rooms
-	# ensure all room names are stored as lowercase
-	for roomName in list(world.keys()):
-		room = world[roomName]
-		del world[roomName]
-		assert room.name.lower() == roomName, f"Room name {room.name.lower()} does not " \
-		f"match its key in world dict {roomName}"
-		assert room.name.lower() not in world, f"Room name {room.name.lower()} " \
-		"already exists in world"
-		world[room.name.lower()] = room
+# in a world file, a link between Portals is an int ID or a "port:<name>" string,
+# which the two Portals it pairs both have in their links
+def isPortalLinkID(dest):
+	return isinstance(dest,int) or (isinstance(dest,str) and dest.startswith("port:"))
+
+
+# adds portal to the list of Portals under each of its link IDs in portalLinks
+def indexPortalLinks(portal,portalLinks):
+	for dest in portal.links.values():
+		if isPortalLinkID(dest):
+			portals = portalLinks.setdefault(dest,[])
+			if portal not in portals:
+				portals.append(portal)
 
-	# register all objects that already have an ID
-	for room in world.values():
-		for obj in room.objTree():
+
+# links each pair of Portals in portalLinks to eachother in place of their link ID
+# any link IDs that don't pair exactly two Portals are all reported together
+def linkPortalPairs(portalLinks):
+	problems = [f"'{linkId}' is shared by {len(portals)} portals: " + \
+	", ".join(portal.name for portal in portals)
+	for linkId, portals in portalLinks.items() if len(portals) != 2]
+	if problems:
+		raise Exception("Portals have ambiguous or unpaired connections:\n" + \
+		"\n".join(problems))
+	for linkId, (portal, pairedPortal) in portalLinks.items():
+		portal.pair(pairedPortal,linkId)
+
+
+# builds rooms which have just been read from a world file or the room store
+# registers their objects, giving IDs to those without one, and links their Portals
+# also assigns references for all their objects (parent, occupants, cover, carrying etc.)
+# also assigns dialogue trees for speakers and validates them
+def buildRooms(rooms):
+	objTrees = [room.objTree() for room in rooms]
+
+	# register all objects that already have an ID,
+	# and index Portals by the link IDs that pair them
+	portalLinks = {}
+	for objTree in objTrees:
+		for obj in objTree:
 			if obj.id is not None:
 				game.registerItem(obj)
+			if isinstance(obj,Portal):
+				indexPortalLinks(obj,portalLinks)
 
 	# assign IDs to global celestial objects
 	for celestial in celestials:
@@ -915,14 +1179,17 @@ def buildWorld():
 			game.registerItem(celestial)
 
 	# assign IDs to all Items and Creatures that don't have one
-	for room in world.values():
-		for obj in room.objTree():
+	for objTree in objTrees:
+		for obj in objTree:
 			if obj.id is None:
 				obj.id = game.getNextID()
 				game.registerItem(obj)
 
+	# link paired Portals, so they don't each have to search the world for their pair
+	linkPortalPairs(portalLinks)
+
 	# assign references for all rooms and objects, and assign dialogue trees
-	for room in world.values():
+	for room in rooms:
 		assert isinstance(room, Room)
 		room.assignRefs()
 		assignRefsRecur(room)
@@ -932,10 +1199,172 @@ def buildWorld():
 			creature.buildDialogue()
 
 	# ensure all containers with liquid floors have a 'down' direction
-	for item in game.itemRegistry.values():
-		if getattr(getattr(item,"floor",None),"composition",None) in Data.liquids:
-			assert "down" in item.dirs, f"Item {item} has a liquid floor " \
-			"but no down direction"
+	for objTree in objTrees:
+		for item in objTree:
+			if getattr(getattr(item,"floor",None),"composition",None) in Data.liquids:
+				assert "down" in item.dirs, f"Item {item} has a liquid floor " \
+				"but no down direction"
+
+
+# removes any room links pointing to rooms which don't exist in the world,
+# to prevent errors if the world file was written incorrectly
+# then builds all the rooms which are loaded; if there is a room store,
+# only the rooms within render distance are loaded now, and the rest as needed
+def buildWorld():
+	# assign all room links to existing rooms
+	# ensure all room names are stored as lowercase
+	for roomName in list(world.keys()):
+		room = world[roomName]
+		if not room.isLoaded():
+			continue
+		del world[roomName]
+		assert room.name.lower() == roomName, f"Room name {room.name.lower()} does not " \
+		f"match its key in world dict {roomName}"
+		assert room.name.lower() not in world, f"Room name {room.name.lower()} " \
+		"already exists in world"
+		world[room.name.lower()] = room
+
+	# celestials are shared by every game, so their IDs from any previous game
+	# are cleared, and they are given new ones and registered by buildRooms
+	for celestial in celestials:
+		celestial.id = None
+	# new IDs must not be taken by objects in rooms which aren't loaded yet
+	if roomStore is not None:
+		roomStore.open(game)
+	buildRooms([room for room in world.values() if room.isLoaded()])
+	# the rooms within render distance are loaded as they're found
+	game.renderedRooms()
+
+
+####################
+## INPUT HANDLING ##
+####################
+
+
+# Reads user input on a background thread and pushes it onto a queue.
+# kbInput() then only has to check a flag, rather than polling the terminal
+# for every printed character.
+# On Unix the thread is the sole reader of the terminal; it reads raw bytes,
+# so single keystrokes (in raw mode) and complete lines are both reported.
+# On Windows, lines are read as usual and the thread only watches for keystrokes.
+class InputReader:
+	def __init__(self):
+		self.stream = None
+		self.thread = None
+		self.lines = queue.Queue()
+		self.pending = threading.Event()
+		self.lock = threading.Lock()
+		self.partial = ""
+		self.eof = False
+
+
+	### Thread Handling ###
+
+	def isRunning(self):
+		return self.thread is not None and self.thread.is_alive()
+
+
+	# start reading from the given stream, if it is an interactive terminal
+	def start(self,stream):
+		if self.isRunning():
+			return True
+		try:
+			if not stream.isatty():
+				return False
+		except (AttributeError,ValueError):
+			return False
+		self.stream = stream
+		target = self.watchWindows if os.name == "nt" else self.readUnix
+		self.thread = threading.Thread(target=target,name="InputReader",daemon=True)
+		self.thread.start()
+		return True
+
+
+	# push whole lines onto the queue, any keystroke at all sets the pending flag
+	def readUnix(self):
+		fd = self.stream.fileno()
+		decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+		while True:
+			try:
+				ready,_,_ = select.select([fd],[],[],0.1)
+				if not ready:
+					continue
+				data = os.read(fd,4096)
+			except (OSError,ValueError):
+				data = b""
+			with self.lock:
+				if data == b"":
+					# end of input, any reader waiting for a line will receive ""
+					self.eof = True
+					self.lines.put(self.partial)
+					self.partial = ""
+					self.pending.set()
+					return
+				self.partial += decoder.decode(data)
+				while "\n" in self.partial:
+					line, self.partial = self.partial.split("\n",1)
+					self.lines.put(line + "\n")
+				self.pending.set()
+
+
+	# windows consoles read lines themselves; only report when keys are pressed
+	def watchWindows(self):
+		while True:
+			if not self.pending.is_set() and msvcrt.kbhit():
+				self.pending.set()
+			sleep(0.01)
+
+
+	### I/O Handling ###
+
+	def hasInput(self):
+		return self.pending.is_set()
+
+
+	# discard all input that has been typed so far
+	def flush(self):
+		with self.lock:
+			while not self.lines.empty():
+				self.lines.get_nowait()
+			self.partial = ""
+			self.pending.clear()
+
+
+	# block until a line is entered
+	def readline(self):
+		if os.name == "nt":
+			line = self.stream.readline()
+			self.pending.clear()
+			return line
+		while True:
+			try:
+				line = self.lines.get(timeout=0.05)
+				break
+			except queue.Empty:
+				if self.eof:
+					return ""
+		with self.lock:
+			if self.lines.empty() and not self.partial:
+				self.pending.clear()
+		return line
+
+
+	# block until any single key is pressed
+	def waitKey(self):
+		self.flush()
+		fd = self.stream.fileno()
+		oldSettings = termios.tcgetattr(fd)
+		try:
+			tty.setraw(fd)
+			while not self.pending.wait(0.1) and not self.eof:
+				continue
+		finally:
+			termios.tcsetattr(fd,termios.TCSADRAIN,oldSettings)
+		self.flush()
+
+
+inputReader = InputReader()
+
 
 
 #############
@@ -944,6 +1373,11 @@ def buildWorld():
 
 
 # A secondary text window used to display static text which can be updated
+# Text written to the panel is collected into a frame. Rather than redrawing the
+# whole window, the panel keeps the lines it last showed and only sends those
+# that changed, addressed by row. Callers mark the panel stale with invalidate()
+# and it renders at most once, when the game next waits for input.
+# On Unix the window reads from a named pipe, on Windows it polls a temp file.
 class SidePanel:
 	# store OS type ('nt' for Windows, 'posix' for Linux/Mac)
 	OSname = os.name
@@ -955,6 +1389,14 @@ class SidePanel:
 		self.pipePath = None
 		self.pipe = None
 		self.process = None
+		# text written since the frame began
+		self.buffer = []
+		# the lines currently visible in the window
+		self.shown = None
+		# the end of a frame the window wasn't ready for, sent before the next one
+		self.unsent = b""
+		# function which writes the panel's contents, set while the panel is stale
+		self.renderer = None
 
 
 	### Process Handling ###
@@ -968,6 +1410,8 @@ class SidePanel:
 			Print(f"{self.title} side panel is already open.",color="k")
 			return False
 		self.title = title
+		self.shown = None
+		self.unsent = b""
 		if SidePanel.OSname == "nt":
 			self.openWindows()
 		elif sys.platform.startswith("linux") or sys.platform.startswith("darwin"):
@@ -1006,25 +1450,50 @@ class SidePanel:
 		)
 
 
+	# the window copies a named pipe to its terminal, so frames arrive as they're sent
+	# the pipe is written without blocking, so a window that stops reading, such as
+	# one being dragged, never holds up the game
 	def openUnix(self):
 		self.pipePath = os.path.join(tempfile.gettempdir(), 
-		f"sidepanel_{os.getpid()}.txt")
-		self.pipe = open(self.pipePath, "w", buffering=1, encoding="utf-8")
+		f"sidepanel_{os.getpid()}.fifo")
+		if os.path.exists(self.pipePath):
+			os.remove(self.pipePath)
+		os.mkfifo(self.pipePath)
 
 		cmd = (
 			f"xterm -T {shlex.quote(self.title)} "
 			f"-geometry {self.width}x{self.height} "
-			f"-e bash -c 'clear; tail -f {shlex.quote(self.pipePath)}'"
+			f"-e bash -c 'clear; cat {shlex.quote(self.pipePath)}'"
 		)
 		self.process = subprocess.Popen(cmd, shell=True)
-		sleep(0.5)
+		# opening the pipe fails until the window has opened it for reading
+		fd = None
+		for _ in range(50):
+			try:
+				fd = os.open(self.pipePath, os.O_WRONLY | os.O_NONBLOCK)
+				break
+			except OSError:
+				if self.process.poll() is not None:
+					break
+				sleep(0.1)
+		if fd is None:
+			self.process.terminate()
+			self.process = None
+			os.remove(self.pipePath)
+			Print("The side panel could not be opened.",color="k")
+			return
+		self.pipe = os.fdopen(fd, "wb", buffering=0)
 
 
+	# also cleans up after a window the user closed, whose pipe is then broken
 	def close(self):
-		if not self.isOpen():
+		if not self.isOpen() and self.pipe is None:
 			return False
 		if self.pipe:
-			self.pipe.close()
+			try:
+				self.pipe.close()
+			except OSError:
+				pass
 			self.pipe = None
 		if self.process:
 			if SidePanel.OSname == "nt":
@@ -1040,30 +1509,99 @@ class SidePanel:
 				os.remove(self.pipePath)
 			except Exception:
 				pass
+		self.shown = None
+		self.unsent = b""
 
 
 	### I/O Handling ###
 
+	# collects text into the frame being rendered
 	def write(self, text=""):
-		if self.pipe:
-			self.pipe.write(str(text))
+		self.buffer.append(str(text))
 
 
 	def flush(self):
 		return
-		# if self.pipe:
-		# 	self.pipe.flush()
 
 
 	def clear(self):
-		if SidePanel.OSname == "nt":
-			if self.pipe:
-				self.pipe.seek(0)
-				self.pipe.truncate()
+		self.buffer = []
+
+
+	# mark the panel as needing to be redrawn by renderer before the next input
+	def invalidate(self,renderer):
+		self.renderer = renderer
+
+
+	# if the panel is stale and open, render a frame and send what changed
+	def refresh(self):
+		if self.renderer is None or not self.isOpen() or self.pipe is None:
+			return False
+		renderer, self.renderer = self.renderer, None
+		self.buffer = []
+		# the panel shows state, so it is drawn even while the game is silent
+		silent, game.silent = game.silent, False
+		try:
+			renderer()
+		finally:
+			game.silent = silent
+		lines = "".join(self.buffer).split("\n")
+		self.buffer = []
+		if lines and lines[-1] == "":
+			lines.pop()
+		try:
+			if SidePanel.OSname == "nt":
+				self.emitWindows(lines)
+			elif not self.emitUnix(lines):
+				# the window is behind, so this frame is dropped, and the panel stays
+				# stale until the window catches up and can be sent a whole new frame
+				self.renderer = renderer
+				self.shown = None
+				return False
+		except (BrokenPipeError,OSError):
+			# the window was closed by the user
+			self.close()
+			return False
+		self.shown = lines
+		return True
+
+
+	# write the changed rows of the frame, using ANSI cursor addressing
+	# returns False if the window hasn't yet read the end of the last frame
+	def emitUnix(self,lines):
+		if self.unsent and not self.send(b""):
+			return False
+		shown = self.shown
+		# a line wider than the window wraps and shifts the rows below it
+		if shown is None or any(displayLength(line) >= self.width for line in lines):
+			out = ["\033[?25l\033[H\033[2J"]
+			out += [f"\033[{row};1H{line}\033[0m" for row, line in enumerate(lines,1)]
 		else:
-			if self.pipe:
-				self.pipe.seek(0)
-				self.pipe.truncate()
+			out = [f"\033[{row};1H{line}\033[0m\033[K" for row, line in
+			enumerate(lines,1) if row > len(shown) or shown[row-1] != line]
+			out += [f"\033[{row};1H\033[K" for row in range(len(lines)+1,len(shown)+1)]
+		if out:
+			self.send("".join(out).encode("utf-8"))
+		return True
+
+
+	# write as much of data as the pipe will take, after any of the last frame left
+	# unsent, and keep the rest; returns True if nothing is left unsent
+	def send(self,data):
+		self.unsent += data
+		n = self.pipe.write(self.unsent)
+		self.unsent = self.unsent[n or 0:]
+		return not self.unsent
+
+
+	# the window redraws the whole file each second, so rewrite it only on change
+	def emitWindows(self,lines):
+		if lines == self.shown:
+			return
+		self.pipe.seek(0)
+		self.pipe.truncate()
+		self.pipe.write("\n".join(lines) + "\n")
+		self.pipe.flush()
 
 
 sidepanel = SidePanel()
@@ -1073,19 +1611,49 @@ def cleanup():
         sidepanel.close()
 atexit.register(cleanup)
 
-ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[ -/]*[A-Za-z]')
 
 
 # Descriptor that will write both to the terminal and to a log file
+# Writing to the terminal happens immediately, but the log is decoupled from it;
+# text is appended to an in-memory buffer which a background thread drains,
+# stripping ANSI escape sequences from the whole batch at once.
+# The log is written and fsynced when flushSize characters are pending or every
+# flushInterval seconds, and is always drained when the logger closes at exit.
 class TeeLogger:
-	def __init__(self,logFile,inputFile=None):
+	def __init__(self,logFile,inputFile=None,flushInterval=0.5,flushSize=8192):
 		self.terminal = sys.stdout
 		self.originalStdin = sys.stdin
 		self.errorTerminal = sys.stderr
 		os.makedirs(os.path.dirname(logFile),exist_ok=True)
 		self.log = open(logFile,"w",encoding="utf-8", errors="replace")
 		self.stdin = open(inputFile,"r") if inputFile else self.originalStdin
-		self.logbuffer = ""
+		# interactive input is read by the background input reader
+		if inputFile is None:
+			inputReader.start(self.originalStdin)
+
+		self.flushInterval = flushInterval
+		self.flushSize = flushSize
+		# text waiting to be logged; the writer swaps it out for an empty list
+		self.pending = []
+		self.pendingSize = 0
+		# an escape sequence left incomplete at the end of the last batch
+		self.carry = ""
+		self.bufferLock = threading.Lock()
+		self.drainLock = threading.Lock()
+		self.wake = threading.Event()
+		self.closed = False
+		self.writer = threading.Thread(target=self.writeLoop,name="TeeLogger",daemon=True)
+		self.writer.start()
+		atexit.register(self.close)
+
+
+	# the logger stands in for stdin, so terminal calls use the original's descriptor
+	def fileno(self):
+		return self.originalStdin.fileno()
+
+
+	def isatty(self):
+		return self.stdin is self.originalStdin and self.originalStdin.isatty()
 
 
 	def setInputFile(self, inputFilename):
@@ -1094,56 +1662,87 @@ class TeeLogger:
 		self.stdin = open(inputFilename,"r")
 
 
-	# if the buffer gets too long for whatever reason, we try to clean it and drain
-	def forceDrainBuffer(self):
-		cleanBuffer = ANSI_ESCAPE.sub('', self.logbuffer)
-		self.log.write(cleanBuffer)
-		self.log.flush()
-		self.logbuffer = ""
+	### Log Writing ###
+
+	# accumulate text to be logged, waking the writer if enough has built up
+	def buffer(self,text):
+		with self.bufferLock:
+			self.pending.append(text)
+			self.pendingSize += len(text)
+			full = self.pendingSize >= self.flushSize
+		if full:
+			self.wake.set()
 
 
-	# in this game, text is typically printed one-character-at-a-time
-	# we don't want ansi escape sequences appearing in the log, 
-	# so we accumulate characters in a buffer and flush it at every newline
-	def drainBufferToNewline(self):
-		newline = self.logbuffer.find('\n')
-		if newline == -1:
+	# write everything pending to the log, without any ANSI escape sequences
+	def drain(self,final=False):
+		with self.drainLock:
+			with self.bufferLock:
+				batch, self.pending = self.pending, []
+				self.pendingSize = 0
+			text = self.carry + "".join(batch)
+			self.carry = ""
+			if not text or self.log.closed:
+				return
+			# hold back an escape sequence that was cut off, unless this is the last batch
+			esc = text.rfind("\x1b")
+			if esc != -1 and not final and not ANSI_ESCAPE.match(text,esc):
+				text, self.carry = text[:esc], text[esc:]
+			self.log.write(ANSI_ESCAPE.sub("",text))
+			self.log.flush()
+			try:
+				os.fsync(self.log.fileno())
+			except OSError:
+				pass
+
+
+	def writeLoop(self):
+		while not self.closed:
+			self.wake.wait(self.flushInterval)
+			self.wake.clear()
+			self.drain()
+
+
+	# stop the writer and write everything that remains, called at exit
+	def close(self):
+		if self.closed:
 			return
-		line = self.logbuffer[:newline]
-		cleanLine = ANSI_ESCAPE.sub('', line)
-		self.log.write(cleanLine + '\n')
-		self.log.flush()
-		self.logbuffer = self.logbuffer[newline + 1:]
+		self.closed = True
+		self.wake.set()
+		self.writer.join(timeout=2)
+		self.drain(final=True)
+		self.log.close()
+
 
+	### Descriptor Methods ###
 
-	# write text to terminal, accumulate text in log buffer, flush at newlines
+	# write text to terminal, the log catches up in the background
 	def write(self, message):
-		self.logbuffer += message
-		while '\n' in self.logbuffer:
-			self.drainBufferToNewline()
-		if len(self.logbuffer) > 3000:
-			self.forceDrainBuffer()
 		self.terminal.write(message)
 		self.terminal.flush()
+		self.buffer(message)
 
 
 	def write_error(self,message):
-		self.forceDrainBuffer()
+		self.drain()
 		self.errorTerminal.write(message)
 
 
 	def readline(self):
-		self.forceDrainBuffer()
-		input_text = self.stdin.readline()
+		if self.stdin is self.originalStdin and inputReader.isRunning():
+			input_text = inputReader.readline()
+		else:
+			input_text = self.stdin.readline()
 		if len(input_text.strip()) > 0:
-			self.log.write(input_text)
-			self.log.flush()
+			self.buffer(input_text)
+		# the log can catch up while the player reads the result
+		self.wake.set()
 		return input_text
 
 
+	# only the terminal is flushed here, so output isn't held up by the disk
 	def flush(self):
 		self.terminal.flush()
-		self.log.flush()
 
 
 
@@ -1647,10 +2246,22 @@ class DialogueTree():
 ############################
 
 
+# the names of the slots of each GameObject class and its parents, their descriptors,
+# and a function which gets them all, found when first needed by GameObject.attributes()
+slotNames = {}
+
+
 # base class for all "physical objects" in the world
 # the three main types are Room, Item, and Creature (which is a subclass of Item)
 # the methods herein are mostly for representing objects or for handling basic interactions
+# Items keep their attributes in __slots__ rather than a __dict__, which makes them
+# smaller and quicker to access. Each class lists the attributes it adds to its parents
+# Rooms have a __dict__, which they swap to load and unload in place (see Room.stored)
+# and so do classes with attributes named at runtime, such as Items.Controller
+# the Item registry refers to them weakly, so they can be collected once unreachable
 class GameObject():
+	__slots__ = ("__weakref__",)
+
 	def __init__(self):
 		self.name = "[GAME OBJECT]"
 		self.weight = 0
@@ -1750,6 +2361,41 @@ class GameObject():
 		return None
 
 
+	### File I/O ###
+
+	# the attributes which are set on the object, as its __dict__ would hold them
+	def attributes(self):
+		cls = type(self)
+		slots = slotNames.get(cls)
+		if slots is None:
+			names = tuple(name for c in reversed(cls.__mro__)
+			for name in c.__dict__.get("__slots__",()) if name not in ("__dict__","__weakref__"))
+			# classes which redirect attribute access, like Projectile, read each slot directly
+			getter = None
+			if len(names) > 1 and cls.__getattribute__ is object.__getattribute__:
+				getter = attrgetter(*names)
+			slots = slotNames[cls] = (names, [getattr(cls,name) for name in names], getter)
+		names, descriptors, getter = slots
+		# usually every slot is set, so they can all be read at once
+		if getter is not None:
+			try:
+				attributes = dict(zip(names,getter(self)))
+			except AttributeError:
+				getter = None
+		if getter is None:
+			attributes = {}
+			for name, slot in zip(names,descriptors):
+				try:
+					attributes[name] = slot.__get__(self)
+				except AttributeError:
+					pass
+		try:
+			attributes.update(object.__getattribute__(self,"__dict__"))
+		except AttributeError:
+			pass
+		return attributes
+
+
 	### Operation ###
 
 	# if possible merge another item into this one
@@ -1949,6 +2595,152 @@ class EmptyGear(GameObject):
 
 
 
+# attributes which copies of a Prototype share with it, although they are lists
+# they are never changed in place, only replaced, so sharing them is safe
+sharedAttributes = {"aliases"}
+
+
+# returns a copy of value, with its own copies of any lists, dicts, and sets within it
+def copyState(value):
+	if isinstance(value,list):
+		return [copyState(elem) for elem in value]
+	if isinstance(value,dict):
+		return {key: copyState(elem) for key, elem in value.items()}
+	if isinstance(value,set):
+		return set(value)
+	return value
+
+
+# marks a factory function whose objects differ each time it is called, such as with
+# a random weight, so each one is made by calling it rather than copied from a Prototype
+def varies(make):
+	make.varies = True
+	return make
+
+
+# an object made once from a factory function, which is then copied for each object
+# spawned from that factory. The copies share its strings, numbers, and aliases, and
+# only get their own copies of the lists, dicts, and sets they may change. Objects
+# spawned from a Prototype know its name, so they are saved as the name and the
+# attributes which differ from it (see Menu.prototypeOverrides)
+class Prototype():
+	def __init__(self,name,make):
+		self.name = name
+		self.make = make
+		self.template = make()
+		# objects holding other objects are made anew, so those aren't shared either
+		self.varies = getattr(make,"varies",False) or len(self.template.objTree()) > 0
+		attributes = self.template.attributes()
+		self.shared = [(key,value) for key, value in attributes.items()
+		if key in sharedAttributes or not isinstance(value,(list,dict,set))]
+		self.state = [(key,value) for key, value in attributes.items()
+		if key not in sharedAttributes and isinstance(value,(list,dict,set))]
+		# the template as it is saved, found when first needed by Menu.prototypeOverrides
+		self.saved = None
+
+
+	def instantiate(self):
+		if self.varies:
+			obj = self.make()
+		else:
+			obj = object.__new__(type(self.template))
+			for key, value in self.shared:
+				setattr(obj,key,value)
+			for key, value in self.state:
+				setattr(obj,key,copyState(value))
+		obj.prototype = self.name
+		return obj
+
+
+# the Prototype of each factory object, made when it is first spawned
+prototypes = {}
+
+
+# returns the Prototype of the object named name in factory, making it if needed
+def getPrototype(name,factory):
+	prototype = prototypes.get(name)
+	if prototype is None:
+		prototype = prototypes[name] = Prototype(name,factory[name])
+	return prototype
+
+
+
+# maps IDs to registered Items without keeping them alive, so an Item that is no longer
+# anywhere in the world is collected and leaves the registry. An ID of None always maps
+# to None, so unset references, such as an empty carrying slot, can be looked up too.
+# Each Item is held by its plain weakref, which Python shares between every caller and
+# which needs no callback, so registering is nearly as cheap as with a dict. The entries
+# of collected Items are treated as missing, and are dropped whenever the registry is
+# iterated over
+class ItemRegistry():
+	__slots__ = ("refs",)
+
+	def __init__(self):
+		self.refs = {}
+
+
+	def __contains__(self,id):
+		if id is None:
+			return True
+		ref = self.refs.get(id)
+		return ref is not None and ref() is not None
+
+
+	def __getitem__(self,id):
+		if id is None:
+			return None
+		obj = self.refs[id]()
+		if obj is None:
+			raise KeyError(id)
+		return obj
+
+
+	def get(self,id,default=None):
+		ref = self.refs.get(id)
+		if ref is None:
+			return default
+		obj = ref()
+		return default if obj is None else obj
+
+
+	def __setitem__(self,id,obj):
+		self.refs[id] = weakref.ref(obj)
+
+
+	def __delitem__(self,id):
+		del self.refs[id]
+
+
+	def __len__(self):
+		return sum(1 for _ in self.items())
+
+
+	def __iter__(self):
+		return (id for id, obj in self.items())
+
+
+	def values(self):
+		return (obj for id, obj in self.items())
+
+
+	def items(self):
+		items = []
+		for id, ref in list(self.refs.items()):
+			obj = ref()
+			if obj is None:
+				del self.refs[id]
+			else:
+				items.append((id,obj))
+		return items
+
+
+	# returns True if obj is registered, under its ID
+	def holds(self,obj):
+		ref = self.refs.get(obj.id)
+		return ref is not None and ref() is obj
+
+
+
 # The Game class stores a series of global data about the game that is not
 # contained in the global world dict, W, including things like the time,
 # a pointer to the current room and previous room, and a pointer to the
@@ -1980,6 +2772,18 @@ class Game():
 		self.time = time
 		# the time of the last save made
 		self.lastSave = time
+		# rooms which may have changed since the last save, see Menu.quickSave()
+		# only rendered rooms are simulated, so these are all that autosaves rewrite
+		self.dirtyRooms = set()
+		# rooms which may have changed since the last checkpoint, see Menu.CheckpointRing
+		self.changedRooms = set()
+		# counts objects spawned, added, or removed anywhere; object trees cached by
+		# Interpreter.ScopeContext are rebuilt when it changes
+		self.treeChanges = 0
+		# the name of the save which holds this game, apart from its dirty rooms
+		self.journalSave = None
+		# the number of entries journaled to that save since it was written in full
+		self.journalLength = 0
 		# the creature who is currently acting
 		self.whoseTurn = None
 		# set of important events that have transpired in the game's progression
@@ -1997,7 +2801,9 @@ class Game():
 		self.creatureFactory = creatureFactory
 		self.itemFactory = itemFactory
 		# references to all Items in the world, each item.id should be its key here
-		self.itemRegistry = {None: None}
+		self.itemRegistry = ItemRegistry()
+		# IDs of destroyed Items, given out again (lowest first) before any new IDs
+		self.freeIDs = []
 		self.nextObjId = 0
 		# counter for portal link ids (distinct from Item ids)
 		# used for saving portals in the world with unique links
@@ -2025,15 +2831,23 @@ class Game():
 
 	# clear Item registry between runs of the game
 	def clearRegistry(self):
-		self.itemRegistry = {None: None}
+		self.itemRegistry = ItemRegistry()
+		self.freeIDs = []
 		self.nextObjId = 0
 
 
-	# get next id to give an Item
+	# get next id to give an Item, reusing the IDs of destroyed Items first
+	# other IDs are only given out once, since an Item in an unloaded room keeps its ID
+	# while it is out of the registry
 	def getNextID(self):
+		while self.freeIDs:
+			id = heappop(self.freeIDs)
+			if id not in self.itemRegistry:
+				return id
 		while self.nextObjId in self.itemRegistry:
 			self.nextObjId += 1
-		return self.nextObjId
+		self.nextObjId += 1
+		return self.nextObjId - 1
 
 
 	# Give Item an ID if it doesn't have one and add it to registry
@@ -2047,37 +2861,85 @@ class Game():
 		self.itemRegistry[obj.id] = obj
 
 
+	# remove Item from the registry, keeping its ID, such as when its room is unloaded
+	def unregisterItem(self,obj):
+		assert self.itemRegistry.holds(obj), f"{obj} ID{obj.id} not in Item registry"
+		del self.itemRegistry[obj.id]
+
+
+	# remove Item from the registry when it is destroyed, so its ID can be reused
+	def releaseID(self,obj):
+		assert self.itemRegistry.holds(obj), f"{obj} ID{obj.id} not in Item registry"
+		del self.itemRegistry[obj.id]
+		heappush(self.freeIDs,obj.id)
+
+
 	# replace one Item with another in the registry
 	# should only be called after lender has been removed from the world
 	def replaceID(self,lender,borrower):
 		assert isinstance(lender,Item) and isinstance(borrower,Item)
-		assert lender not in self.itemRegistry.values(), \
-		f"lender {lender} still in registry values when trying to give ID to {borrower}"
-		# in case borrower already registered with ID, delete it
-		if borrower.id is not None and borrower.id in self.itemRegistry:
-			registryObj = self.itemRegistry[borrower.id]
-			assert registryObj is borrower, f"ID conflict with {registryObj}" \
-			f" when trying to replace {lender} with {borrower}"
-			del self.itemRegistry[borrower.id]
+		assert not self.itemRegistry.holds(lender), \
+		f"lender {lender} still in registry when trying to give ID to {borrower}"
+		# lender is usually destroyed first, which frees its ID
+		if lender.id in self.freeIDs:
+			self.freeIDs.remove(lender.id)
+			heapify(self.freeIDs)
+		# in case borrower already registered with ID, release it
+		if self.itemRegistry.holds(borrower):
+			self.releaseID(borrower)
 		self.itemRegistry[lender.id] = borrower
 		borrower.id = lender.id
 
 
-	# spawn a new item (may instantiate it from a string) and register it
+	# check that each registered Item is registered under its own ID, and that no
+	# free ID is in use. Called after each turn when
+	# Data.VALIDATE_REGISTRY is set; raises an Exception listing any problems
+	def validateRegistry(self):
+		problems = []
+		for id, obj in self.itemRegistry.items():
+			if obj.id != id:
+				problems.append(f"{obj} has ID {obj.id} but is registered as {id}")
+		for id in self.freeIDs:
+			if id in self.itemRegistry:
+				problems.append(f"free ID {id} is registered to {self.itemRegistry[id]}")
+		if len(set(self.freeIDs)) != len(self.freeIDs):
+			problems.append("free IDs are repeated")
+		if problems:
+			raise Exception("Item registry is inconsistent:\n" + "\n".join(problems))
+
+
+	# find registered Items which can't be reached from the loaded rooms, the player,
+	# or the celestials, and Items which can be reached but aren't registered
+	# unreachable Items are only collected once nothing refers to them, so a lasting
+	# one is leaked by some reference, and an unregistered one can't be found by ID
+	def registryLeaks(self):
+		reachable = set(celestials)
+		reachable.update(player.objTree(includeSelf=True))
+		for room in world.values():
+			if room.isLoaded():
+				reachable.update(room.objTree())
+		unreachable = [obj for obj in self.itemRegistry.values() if obj not in reachable]
+		unregistered = [obj for obj in reachable if not self.itemRegistry.holds(obj)]
+		return unreachable, unregistered
+
+
+	# spawn a new item (may instantiate it from the prototype of a factory object)
+	# and register it
 	def spawn(self,obj):
 		if isinstance(obj,str):
 			if obj in self.creatureFactory:
-				obj = self.creatureFactory[obj]()
+				obj = getPrototype(obj,self.creatureFactory).instantiate()
 			elif obj in self.itemFactory:
-				obj = self.itemFactory[obj]()
+				obj = getPrototype(obj,self.itemFactory).instantiate()
 			else:
 				raise Exception(f"Cannot spawn unknown factory object {obj}")
 		else:
 			assert isinstance(obj,Item)
 
-		assert obj.id is None or obj.id not in self.itemRegistry
+		assert obj.id is None or not self.itemRegistry.holds(obj)
 		obj.id = self.getNextID()
 		self.registerItem(obj)
+		self.treeChanges += 1
 		return obj
 
 
@@ -2115,6 +2977,19 @@ class Game():
 		self.him = None
 
 
+	# rooms which may have changed are rewritten by the next autosave and checkpoint
+	def markDirty(self,*rooms):
+		self.dirtyRooms.update(rooms)
+		self.changedRooms.update(rooms)
+
+
+	# the world may have changed anywhere, such as by a cheatcode, so the next autosave
+	# is written in full and the next checkpoint compares every loaded room
+	def markAllDirty(self):
+		self.journalSave = None
+		self.markDirty(*(room for room in world.values() if room.isLoaded()))
+
+
 	# passes time for each room, and each creature in each room
 	# important for decrementing the duration counter on all status conditions
 	def passTime(self,t=1):
@@ -2125,9 +3000,14 @@ class Game():
 
 		# objs can change location during passTime;
 		# flatten all object trees so we don't call passtime twice on any object
-		roomObjTrees = (room.objTree(includeSelf=True) for room in self.renderedRooms())
+		rendered = self.renderedRooms()
+		self.markDirty(*rendered)
+		roomObjTrees = (room.objTree(includeSelf=True) for room in rendered)
 		for obj in {o for objTree in roomObjTrees for o in objTree}:
 			obj.passTime(t)
+		# unload rooms far from the player if too many are loaded
+		if roomStore is not None:
+			roomStore.unloadDistant()
 
 		# probably not necessary, celestials don't have status conditions
 		# for celestial in celestials:
@@ -2165,7 +3045,8 @@ class Game():
 		adjacentRooms = (dest for dest in Sroom.allDests() if isinstance(dest,Room))
 
 		for room in adjacentRooms:
-			foundrooms.add(room)
+			# rooms are loaded as they come within render distance
+			foundrooms.add(room.room())
 			self.roomFinder(n,room,pathlen+1,foundrooms)
 
 
@@ -2174,7 +3055,7 @@ class Game():
 		# constant render distance of rooms in world
 		REND_DIST = 3
 		# the set of found rooms initially includes only the current room
-		R = {self.currentroom}
+		R = {self.currentroom.room()}
 		# add all rooms within a distance of REND_DIST to R
 		self.roomFinder(REND_DIST,self.currentroom,0,R)
 		return R
@@ -2385,7 +3266,8 @@ class Game():
 # the edges from a given node to its neighboring nodes.
 class Room(GameObject):
 	def __init__(self,name,domain,desc,links,fixtures,items,creatures,capacity=1000,
-	passprep=None,composition=None,ceiling=None,walls=None,floor=None,status=None):
+	passprep=None,composition=None,ceiling=None,walls=None,floor=None,status=None,
+	surfaceIDs=None):
 		# name serves as the Room's unique id
 		self.name = name
 		# domains are regions within the world, used for determining creatures to spawn
@@ -2439,16 +3321,41 @@ class Room(GameObject):
 			self.floor = Surface("ground",f"A floor of {floor}.",capacity//3,floor,
 			aliases=["floor"],determiner="the")
 		self.surfaces = (self.ceiling,self.walls,self.floor)
+		# saved rooms keep their surfaces' IDs, which objects refer to as platforms
+		if surfaceIDs:
+			for surface, id in zip(self.surfaces,surfaceIDs):
+				if surface is not None:
+					surface.id = id
+
+
+	# an empty placeholder for the Room stored under key in store (see Menu.RoomStore)
+	# it has none of a Room's attributes until it is loaded with room()
+	@classmethod
+	def stored(cls,key,store):
+		room = cls.__new__(cls)
+		room.__dict__.update(storedAs=key,store=store)
+		return room
 
 
 	### Dunder Methods ###
 
 	def __repr__(self):
+		if not self.isLoaded():
+			return f"Room({self.storedAs}, unloaded)"
 		return f"Room({self.name})"
 
 
 	### File I/O ###
 
+	def isLoaded(self):
+		return "storedAs" not in self.__dict__
+
+
+	# the Room's key in the world dict, without loading it
+	def worldKey(self):
+		return self.storedAs if not self.isLoaded() else self.name.lower()
+
+
 	# after all objects instantiated from json, assign room links to actual Room objects
 	# uses the string names in the links to get Room objects from world dict
 	def assignRefs(self):
@@ -2464,13 +3371,16 @@ class Room(GameObject):
 
 	# restore links dict to using strings as values for saving to json
 	# restore surfaces to using strings representing their composition
+	# an unloaded Room is saved as it is stored
 	def convertToJSON(self):
+		if not self.isLoaded():
+			return self.store.data(self.storedAs)
 		jsonDict = self.__dict__.copy()
 		jsonDict["links"] = {}
 		for dir, dest in self.links.items():
-			assert isinstance(dest, Room), f"Trying to save room {self.name} "
+			assert isinstance(dest, Room), f"Trying to save room {self.name} " \
 			f"with exit to non-Room '{dest}'"
-			jsonDict["links"][dir] = dest.name.lower()
+			jsonDict["links"][dir] = dest.worldKey()
 
 		del jsonDict["pronoun"]
 		if self.ceiling:
@@ -2479,6 +3389,7 @@ class Room(GameObject):
 			jsonDict["walls"] = self.walls.composition
 		if self.floor:
 			jsonDict["floor"] = self.floor.composition
+		jsonDict["surfaceIDs"] = [s.id if s else None for s in self.surfaces]
 
 		del jsonDict["surfaces"], jsonDict["determiner"]
 		return jsonDict
@@ -2492,6 +3403,8 @@ class Room(GameObject):
 		if isinstance(O,str) or O.id is None:
 			O = game.spawn(O)
 
+		game.markDirty(self)
+		game.treeChanges += 1
 		# check if object can be added to room, displace it if not
 		# displacing it out of a room will probably destroy it
 		if not self.canAdd(O):
@@ -2595,6 +3508,8 @@ class Room(GameObject):
 
 	# Try to remove object from contents, ignore if not present
 	def remove(self,O):
+		game.markDirty(self)
+		game.treeChanges += 1
 		if isinstance(O,Creature):
 			if O in self.creatures:
 				self.creatures.remove(O)
@@ -2716,7 +3631,7 @@ class Room(GameObject):
 
 
 	def getNewLocation(self,dir=None):
-		return self.links[dir]
+		return self.links[dir].room()
 
 
 	# given a direction (like 'north' or 'down)
@@ -2754,7 +3669,10 @@ class Room(GameObject):
 
 	# useful for determining what room ultimately contains an object
 	# exists in this class for compatibility with other objects
+	# an unloaded Room is loaded in place first, so this is how Rooms are loaded
 	def room(self):
+		if "storedAs" in self.__dict__:
+			self.store.load(self)
 		return self
 
 
@@ -2822,6 +3740,11 @@ class Room(GameObject):
 # Items are the heart of the game. Everything in a room should be an Item
 # All items come with a name, description, weight, durability, and composition
 class Item(GameObject):
+	__slots__ = ("name","desc","weight","durability","composition","rarity","descname","fixed",
+	"mention","longevity","despawnTimer","scent","flavor","texture","plural",
+	"determiner","pronoun","occupyprep","aliases","id","parent","status",
+	"platform","occupants","covering","prototype")
+
 	def __init__(self,name,desc,weight,durability,composition,aliases=None,rarity=1,
 	status=None,plural=None,descname=None,determiner=None,pronoun="it",occupyprep="on",
 	fixed=False,mention=True,longevity=None,despawnTimer=None,scent=None,flavor=None,
@@ -2864,6 +3787,7 @@ class Item(GameObject):
 		self.pronoun = pronoun
 		self.occupyprep = occupyprep
 		# used for identifying object from player input
+		# aliases may be shared with other objects, so they are replaced, not changed
 		self.aliases = list(set(aliases)) if aliases else []
 
 		### World Properties -- may be reassigned during assignRefs() 
@@ -2872,6 +3796,8 @@ class Item(GameObject):
 		self.id = id
 		# the parent object containing this object (usually a Room or Container)
 		self.parent = None
+		# self.prototype, the name of the Prototype this was copied from, is only set
+		# on objects spawned from a factory (see Prototype)
 
 		### Status Effects
 
@@ -2934,7 +3860,7 @@ class Item(GameObject):
 
 	# convert these references back into integer IDs
 	def convertToJSON(self):
-		jsonDict = self.__dict__.copy()
+		jsonDict = self.attributes()
 		jsonDict["occupants"] = [o.id for o in self.occupants] if self.occupants else None
 		jsonDict["covering"] = [c.id for c in self.covering] if self.covering else None
 		jsonDict["platform"] = self.platform.id if self.platform else None
@@ -2966,6 +3892,8 @@ class Item(GameObject):
 
 	# change location to a new Room/Container
 	def changeLocation(self,newparent):
+		if isinstance(newparent,Room):
+			newparent = newparent.room()
 		if not newparent.canAdd(self):
 			self.Print(f"Something prevents entering {-newparent}.")
 			return False
@@ -3085,9 +4013,7 @@ class Item(GameObject):
 			self.parent.remove(self)
 
 		# TODO: first drop all items from contents? or just some important ones?
-		assert game.itemRegistry[self.id] is self, \
-		f"{self} ID{self.id} holds wrong Item in registry {game.itemRegistry[self.id]}"
-		del game.itemRegistry[self.id]
+		game.releaseID(self)
 
 
 	# if an Item is too small for its parent, repeatedly move it to parent's parent
@@ -3235,6 +4161,8 @@ class Item(GameObject):
 
 	# remove occupants and cover and change location
 	def teleport(self,newParent):
+		if isinstance(newParent,Room):
+			newParent = newParent.room()
 		if newParent is self.parent:
 			return False
 		self.clearCovering()
@@ -3335,7 +4263,7 @@ class Item(GameObject):
 		while "down" in room.links and (room.floor is None or \
 		(room.floor.composition in Data.liquids and verb == "sink")):
 			height += room.capacity // 5 # approximate vertical height of room
-			room = room.links["down"]
+			room = room.links["down"].room()
 		if room != self.room():
 			self.changeLocation(room)
 			# could enter a room which submergees
@@ -3602,7 +4530,7 @@ class Item(GameObject):
 		if player.hasStatus("apathy"): color = "w"
 		displayName = self.name
 		if count > 1: displayName = self.plural + f" ({count})"
-		return tinge(color,displayName)[0]
+		return tingeName(color,displayName)
 
 
 	# intelligently get name of this item in various grammatical forms
@@ -3696,6 +4624,11 @@ class Item(GameObject):
 # For their contents, Creatures have an Inventory and a gear dict of equipped items
 # In addition to platform anchor, Creatures can be carried or riding another Creature
 class Creature(Item):
+	__slots__ = ("str","skl","spd","stm","con","cha","int","wis","fth","lck","hp","mp","money",
+	"inv","gear","weapon","weapon2","shield","shield2","memories","appraisal",
+	"love","fear","riding","carrying","carrier","cover","regenTimer","lastAte",
+	"lastSlept","lastBreathed","alert","lastSawPlayer")
+
 	def __init__(self,name,desc,weight,traits,hp=None,mp=0,money=0,inv=None,gear=None,
 	love=0,fear=0,carrying=None,carrier=None,riding=None,platform=None,
 	cover=None,composition="flesh",memories=None,appraisal=None,lastAte=0,lastSlept=0,
@@ -3895,6 +4828,7 @@ class Creature(Item):
 		alphabetical = lambda x: (x.name.lower(), x.name)
 		insort(self.inv,I,key=alphabetical)
 		I.parent = self
+		game.treeChanges += 1
 		I.nullDespawn()
 		if self is player:
 			self.display()
@@ -3944,6 +4878,8 @@ class Creature(Item):
 	# change location to a new Room/Container, return True on success
 	def changeLocation(self,newparent):
 		assert not isinstance(newparent,Creature)
+		if isinstance(newparent,Room):
+			newparent = newparent.room()
 		# shouldn't be changing rooms alone if riding or being carried
 		if self.carrier and self.carrier.parent is not newparent:
 			return False
@@ -4090,7 +5026,7 @@ class Creature(Item):
 		self.removeCarry(silent=True)
 
 		self.descname = f"dead {self.descname}"
-		self.aliases.extend(["dead "+a for a in self.aliases])
+		self.aliases = self.aliases + ["dead "+a for a in self.aliases]
 
 		n = diceRoll(3,player.LOOT(),-2)
 		self.parent.add(Serpens(n))
@@ -4209,6 +5145,7 @@ class Creature(Item):
 			self.removeCarry(silent=silent)
 		if I in self.inv:
 			self.inv.remove(I)
+			game.treeChanges += 1
 		if hasMethod(I,"Drop"):
 			I.Drop(self)
 		if not silent:
@@ -4633,7 +5570,7 @@ class Creature(Item):
 		while "down" in room.links and (room.floor is None or \
 		(room.floor.composition in Data.liquids and verb == "sink")):
 			height += room.capacity // 5 # approximate height of room
-			room = room.links["down"]
+			room = room.links["down"].room()
 		if room != self.room():
 			if self.carrying:
 				self.carrying.fall(height,room)
@@ -4790,6 +5727,8 @@ class Creature(Item):
 
 	# sever tethers and change location to new Container or Room
 	def teleport(self,newParent):
+		if isinstance(newParent,Room):
+			newParent = newParent.room()
 		if newParent is self.parent:
 			self.Print("You are already there.",color="w")
 			return
@@ -5534,6 +6473,8 @@ class Creature(Item):
 # The Player mostly behaves like a normal Humanoid Creature,
 # but it has an xp to track leveling up, and RP to track reputation
 class Player(Creature):
+	__slots__ = ("xp","rp","spells")
+
 	def __init__(self,name,desc,weight,traits,xp,rp,spells=None,**kwargs):
 		self.xp = xp
 		self.rp = rp
@@ -5847,8 +6788,12 @@ class Player(Creature):
 	### User Output ###
 
 	# takes args because interpreter passes them
+	# the panel is drawn once, the next time the game waits for input
 	def display(self,*args):
-		sidepanel.clear()
+		sidepanel.invalidate(self.renderDisplay)
+
+
+	def renderDisplay(self):
 		if self.hasStatus("asleep"):
 			return self.Print("...",color="k",outfile=sidepanel)
 		self.printStats(outfile=sidepanel)
@@ -5903,6 +6848,7 @@ class Player(Creature):
 		if not sidepanel.isOpen():
 			sidepanel.open(self.name)
 			self.display()
+			sidepanel.refresh()
 		else:
 			self.display()
 			self.Print(f"Your stats panel is already open.",color="k")
@@ -6112,6 +7058,8 @@ class Player(Creature):
 
 
 class Humanoid(Creature):
+	__slots__ = ()
+
 	### Operation ###
 
 	# attack another creature
@@ -6244,6 +7192,8 @@ class Humanoid(Creature):
 # upon meeting the player they will take a firstImpression()
 # and every encounter with them after that they will perform appraise()
 class Speaker(Creature):
+	__slots__ = ("dlogName","dlogTree","rapport","lastParley")
+
 	def __init__(self,name,desc,weight,traits,dlogName=None,dlogTree=None,rapport=0,
 	lastParley=None,**kwargs):
 		super().__init__(name,desc,weight,traits,**kwargs)
@@ -6316,6 +7266,8 @@ class Speaker(Creature):
 
 # People are Speakers that are Humanoid
 class Person(Speaker,Humanoid):
+	__slots__ = ("spells",)
+
 	def __init__(self,name,descname,weight,traits,pronoun,spells=None,desc=None,
 	isChild=False,**kwargs):
 		super().__init__(name,"",weight,traits,descname=descname,pronoun=pronoun,**kwargs)
@@ -6421,6 +7373,8 @@ class Person(Speaker,Humanoid):
 
 # Animals can only speak when player has 'wildspeaking' status
 class Animal(Speaker):
+	__slots__ = ("species",)
+
 	def __init__(self,name,desc,weight,traits,species=None,dlogName=None,**kwargs):
 		super().__init__(name,desc,weight,traits,**kwargs)
 		self.species = name if species is None else species
@@ -6571,6 +7525,8 @@ Set status
 
 # Item that is fixed and not mentioned by default
 class Fixture(Item):
+	__slots__ = ()
+
 	def __init__(self,name,desc,weight,composition,durability=-1,mention=False,fixed=True,
 	**kwargs):
 		super().__init__(name,desc,weight,durability,composition,mention=mention,
@@ -6591,6 +7547,8 @@ class Fixture(Item):
 
 # Surfaces are Fixtures that surround a Room or Container
 class Surface(Fixture):
+	__slots__ = ()
+
 	def __init__(self,name,desc,weight,composition,**kwargs):
 		super().__init__(name,desc,weight,composition,**kwargs)
 		if any("water" in alias for alias in self.aliases):
@@ -6612,6 +7570,8 @@ class Surface(Fixture):
 
 # Celestials are Fixtures that can be in Room contents depending on the time
 class Celestial(Fixture):
+	__slots__ = ()
+
 	def __init__(self,name,desc,weight,composition,**kwargs):
 		super().__init__(name,desc,weight,composition,**kwargs)
 		self.determiner = "the"
@@ -6644,6 +7604,8 @@ celestials = (sky,sun,moon,stars,eclipse,meteorshower,aurora)
 # But a Portal can link to another Portals as well 
 # They have traverse(), transfer(), a links dict and a passprep
 class Portal(Item):
+	__slots__ = ("links","capacity","passprep","compressedLinks")
+
 	def __init__(self,name,desc,weight,durability,composition,links,capacity=None,
 	passprep="into",**kwargs):
 		super().__init__(name,desc,weight,durability,composition,**kwargs)
@@ -6663,6 +7625,7 @@ class Portal(Item):
 	# In JSON, Portals' links eachother are represented by a unique link ID
 	# search in the World for the Portal that has a link with the same link ID
 	# and link that portal to self
+	# buildWorld() pairs all Portals at once instead, see linkPortalPairs()
 	def linkPortals(self,linkId):
 		# find paired portal in world
 		pairedPortals = set()
@@ -6672,8 +7635,11 @@ class Portal(Item):
 		pairedPortals.remove(self)
 		assert len(pairedPortals) == 1, f"Portal {self.name} has an ambiguous" \
 		f" connection for '{linkId}'. Found {len(pairedPortals)} matches."
-		pairedPortal = list(pairedPortals)[0]
+		self.pair(list(pairedPortals)[0],linkId)
+
 
+	# replace the links with linkId in self and pairedPortal with eachother
+	def pair(self,pairedPortal,linkId):
 		# link paired portal to self
 		for dir, dest in self.links.items():
 			if dest == linkId:
@@ -6694,11 +7660,8 @@ class Portal(Item):
 			# set one-way link to Room
 			if isinstance(dest,str) and dest in world:
 				self.links[dir] = world[dest]
-			# set two-way link to Portal with string pair ID
-			elif isinstance(dest,str) and dest.startswith("port:"):
-				self.linkPortals(dest)
-			# set two-way link to Portal with int pair ID
-			elif isinstance(dest,int):
+			# set two-way link to Portal with string or int pair ID
+			elif isPortalLinkID(dest):
 				self.linkPortals(dest)
 			# link is an object, so its already assigned
 			elif isinstance(dest,Room) or isinstance(dest,Portal):
@@ -6735,13 +7698,13 @@ class Portal(Item):
 		# convert Room links to unique name strings
 		for dir, dest in self.compressedLinks.items():
 			if isinstance(dest,Room):
-				self.compressedLinks[dir] = dest.name.lower()
+				self.compressedLinks[dir] = dest.worldKey()
 
 		# all links should now be either strings or ints
 		for dir,dest in self.compressedLinks.items():
 			assert isinstance(dest,(str,int)), f"Portal {self.name} failed to convert" \
 			f" link {dest} at direction {dir} into string or int"
-		jsonDict = self.__dict__.copy()
+		jsonDict = self.attributes()
 		jsonDict["links"] = jsonDict["compressedLinks"]
 		del jsonDict["compressedLinks"]
 		return jsonDict
@@ -6863,7 +7826,9 @@ class Portal(Item):
 		if dir is None:
 			dir = self.getDefaultDir()
 		newloc = self.links[dir]
-		if isinstance(newloc,(Room,Container)):
+		if isinstance(newloc,Room):
+			return newloc.room()
+		elif isinstance(newloc,Container):
 			return newloc
 		else:
 			newloc = newloc.parent
@@ -6971,6 +7936,8 @@ class ContainerLinks(dict):
 # Containers special Portals. they have traverse and transfer methods
 # but they link to themselves, adding traversers into their items list
 class Container(Portal):
+	__slots__ = ("exitprep","items","ceiling","walls","floor","surfaces")
+
 	def __init__(self,name,desc,weight,durability,composition,items,capacity=None,
 	passprep=None,exitprep="out",links=None,**kwargs):
 		Item.__init__(self,name,desc,weight,durability,composition,**kwargs)
@@ -7032,6 +7999,7 @@ class Container(Portal):
 		insort(self.items,I)
 		I.parent = self
 		I.nullDespawn()
+		game.treeChanges += 1
 		return I
 
 
@@ -7073,6 +8041,7 @@ class Container(Portal):
 	# remove Item
 	def remove(self,I):
 		self.items.remove(I)
+		game.treeChanges += 1
 
 
 	# try to remove an area condition from all affected objs in the Container
@@ -7266,6 +8235,8 @@ class Container(Portal):
 
 # used as shorthand to make a Portal that is fixed and not mentioned by default
 class Passage(Portal):
+	__slots__ = ()
+
 	def __init__(self,name,desc,weight,composition,links,passprep="into",mention=False,
 	durability=-1,fixed=True,**kwargs):
 		super().__init__(name,desc,weight,durability,composition,links,passprep=passprep,
@@ -7276,6 +8247,8 @@ class Passage(Portal):
 # Serpens are piles of gold coins
 # they must be merged together if they're in the same contents
 class Serpens(Item):
+	__slots__ = ("value",)
+
 	def __init__(self,value,**kwargs):
 		desc = f"{str(value)} glistening coins made of an ancient metal."
 		Item.__init__(self,"gold",desc,value,-1,"gold",**kwargs)
@@ -7337,6 +8310,8 @@ class Serpens(Item):
 # __getattribute__ and __setattr__ pass through any attribute access to self.item first
 # if it exists, otherwise to self
 class Projectile(Item):
+	__slots__ = ("item","might","sharpness","type","speed","aim")
+
 	def __init__(self,name,desc,weight,durability,composition,might,sharpness,type,speed=0,item=None,**kwargs):
 		# must be first or setattr will fail
 		object.__setattr__(self,"item",item)
@@ -7511,6 +8486,8 @@ class Projectile(Item):
 # Weapons are Items that can be used to attack
 # they have might, sleight, sharpness, range, type and twohanded attributes
 class Weapon(Item):
+	__slots__ = ("might","sleight","sharpness","range","twohanded","type")
+
 	def __init__(self,name,desc,weight,durability,composition,might,sleight,sharpness,
 	range,type,twohanded=False,**kwargs):
 		Item.__init__(self,name,desc,weight,durability,composition,**kwargs)
@@ -7570,6 +8547,8 @@ class Weapon(Item):
 
 
 class Shield(Item):
+	__slots__ = ("prot",)
+
 	def __init__(self,name,desc,weight,durability,composition,prot,**kwargs):
 		Item.__init__(self,name,desc,weight,durability,composition,**kwargs)
 		self.prot = prot
@@ -7577,6 +8556,8 @@ class Shield(Item):
 
 
 class Armor(Item):
+	__slots__ = ("prot","slots")
+
 	def __init__(self,name,desc,weight,durability,composition,prot,slots=None,**kwargs):
 		Item.__init__(self,name,desc,weight,durability,composition,**kwargs)
 		self.prot = prot
@@ -7595,6 +8576,8 @@ class Armor(Item):
 
 
 class Compass(Item):
+	__slots__ = ()
+
 	def orient(self):
 		Print("Orienting you northward!")
 
@@ -7609,4 +8592,6 @@ class Compass(Item):
 player = Player("","",0,[0]*10,0,0)
 defaultRoom = Room("","","",{},[],[],[])
 game = Game(-1,defaultRoom,defaultRoom,-1,set(),{},{},{})
-world = {}
\ No newline at end of file
+world = {}
+# the store that rooms which aren't loaded yet are read from, see Menu.RoomStore
+roomStore = None
\ No newline at end of file
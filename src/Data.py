@@ -12,6 +12,31 @@
 
 TERMINAL_HEIGHT = 32
 TERMINAL_WIDTH = 128
+# number of times per second that typewritten text is drawn to the terminal
+FRAME_RATE = 60
+# number of autosaves journaled onto a save before it is rewritten in full
+JOURNAL_LENGTH = 10
+# format full saves are written in; 'binary' for a compact save.bin (see SaveFile.py),
+# or 'json' for readable world.json, player.json, and game.txt files
+SAVE_FORMAT = "binary"
+# compression full saves are written with; 'zlib', 'lzma', or None to write them as is
+# saves are read in any of these, whatever this is set to
+SAVE_COMPRESSION = "zlib"
+# World.json is compiled into this file, a save file with a section for each room, so
+# that its rooms can be read as they're needed; it is rebuilt when World.json changes
+WORLD_CACHE = "./saves/world.bin"
+# whether the fields of each object loaded are checked against its class's constructor
+VALIDATE_SAVE_FIELDS = False
+# whether the Item registry is checked for consistency after each turn (see Game.validateRegistry)
+VALIDATE_REGISTRY = False
+# once more than this many rooms are loaded, rooms are unloaded from memory if they
+# are further than ROOM_KEEP_DISTANCE from the player (rooms are rendered up to 3 away)
+MAX_LOADED_ROOMS = 64
+ROOM_KEEP_DISTANCE = 5
+# number of turns kept in memory which can be undone, and the most memory they can use
+# older turns are forgotten first when either is exceeded (see Menu.CheckpointRing)
+CHECKPOINTS = 20
+CHECKPOINT_MEMORY = 1024*1024
 
 
 ####################
@@ -38,7 +63,7 @@ vowels = "aeiouAEIOU"
 
 superfluous = {"a","again","an","hers","his","i","ill","i'll","its","of","some","that","the","then","their","this","will"}
 
-shortactions = {"cast","here","room","clear","cls","quit"}
+shortactions = {"cast","here","room","clear","cls","quit","undo"}
 
 cancels = {"cancel","done","end","nevermind","no","nvm","undo"}
 
@@ -0,0 +1,69 @@
+# Formatting.py
+# This file contains the functions used to color text and measure how it displays
+# This file is dependent on Data.py and is a dependency of Core.py
+
+# These are called for nearly every string that is printed, so they avoid repeated work;
+# color tags are replaced with one precompiled substitution, color prefixes are built
+# once, and the display widths and colored names of recurring strings are cached.
+
+import re
+from functools import lru_cache
+
+import Data
+
+
+
+##########################
+## FORMATTING FUNCTIONS ##
+##########################
+
+
+# matches ANSI escape sequences, such as color codes and cursor movement
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[ -/]*[A-Za-z]')
+
+# the escape sequence that starts each color, and the one that resets it
+COLOR_PREFIXES = {color: f"\033[{code}m" for color, code in Data.colorCodes.items()}
+COLOR_RESET = "\033[0m"
+
+# color tags are written like <r> or <g>, and <x> returns to the default color
+TAG_CODES = {f"<{color}>": prefix for color, prefix in COLOR_PREFIXES.items()}
+TAG_CODES["<x>"] = "\033[37m"
+COLOR_TAG = re.compile("|".join(re.escape(tag) for tag in TAG_CODES))
+
+
+# color text using ANSI formatting
+def tinge(color,*args):
+	if len(args) > 0 and color is not None:
+		prefix = COLOR_PREFIXES[color]
+		if len(args) == 1:
+			return (prefix + args[0] + COLOR_RESET,)
+		args = list(args)
+		args[0] = prefix + args[0]
+		args[-1] = args[-1] + COLOR_RESET
+	return tuple(args)
+
+
+# a colored name, such as an item's displayName, which is reused often
+@lru_cache(maxsize=1024)
+def tingeName(color,name):
+	return COLOR_PREFIXES[color] + name + COLOR_RESET
+
+
+# calculate lengths of displaying string by ignoring formatting chars
+# text without escape sequences is simply counted
+def displayLength(text):
+	if "\x1b" not in text:
+		return len(text) - text.count("\n")
+	return escapedLength(text)
+
+
+@lru_cache(maxsize=2048)
+def escapedLength(text):
+	return len(ANSI_ESCAPE.sub("", text.replace("\n","")))
+
+
+# replace color tags in text with their escape sequences
+def formatColorCodes(text):
+	if "<" not in text:
+		return text
+	return COLOR_TAG.sub(lambda m: TAG_CODES[m.group()], text)
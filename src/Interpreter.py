@@ -11,8 +11,8 @@
 from random import choice,randint
 from bisect import insort
 import traceback
-import sys
 import gc
+import tracemalloc
 
 import Data
 import Core
@@ -20,16 +20,102 @@ import Menu
 import Items
 import Creatures
 import Effects
+import Memory
+import Profiler
+import Transcript
 
 
 helpCounter = 0
 commandQueue = []
+# the ScopeContext of the command currently being interpreted, see below
+scope = None
 
 ###########################
 ## INTERPRETER FUNCTIONS ##
 ###########################
 
 
+# a ScopeContext is created once per interpreted command
+# it lazily caches the object trees that findObject() and enforceVerbScope() consult,
+# so scope checks on the direct and indirect object are set lookups, not tree walks
+# trees are keyed by their root and query degree (see Core.objQuery)
+# since the caches are a snapshot of the world, they are discarded if the player
+# changes location or anchor, if any object is spawned, added, or removed (counted
+# by Core.game.treeChanges), or if invalidate() is called
+class ScopeContext():
+	def __init__(self):
+		self.invalidate()
+
+
+	def invalidate(self):
+		self.location = (Core.player.parent, Core.player.anchor(), Core.game.treeChanges)
+		self.trees = {}
+		self._surroundings = None
+
+
+	# ensures the cached trees still reflect where the player and the objects are
+	def validate(self):
+		if self.location != (Core.player.parent, Core.player.anchor(), Core.game.treeChanges):
+			self.invalidate()
+
+
+	# get the set of all objects in the tree of root (including root) at degree d
+	def tree(self,root,d=3):
+		self.validate()
+		if root is None:
+			return set()
+		key = (id(root),d)
+		if key not in self.trees:
+			self.trees[key] = Core.objQuery(root,d=d)
+		return self.trees[key]
+
+
+	@property
+	def surroundings(self):
+		self.validate()
+		if self._surroundings is None:
+			self._surroundings = Core.player.surroundings()
+		return self._surroundings
+
+
+	@property
+	def parentTree(self):
+		return self.tree(Core.player.parent)
+
+
+	# tree of the player's anchor, or of the parent if the player is on its surface
+	@property
+	def anchorTree(self):
+		anchor = Core.player.anchor()
+		if anchor in Core.player.parent.surfaces + (None,):
+			anchor = Core.player.parent
+		return self.tree(anchor)
+
+
+	@property
+	def ceilingTree(self):
+		return self.tree(getattr(Core.player.parent,"ceiling",None))
+
+
+	@property
+	def surroundingsTree(self):
+		return self.tree(self.surroundings)
+
+
+	@property
+	def invTree(self):
+		return self.tree(Core.player)
+
+
+# returns the ScopeContext of the current command, creating one if there is none
+# (for instance when an action function is called outside of interpret())
+def currentScope():
+	global scope
+	if scope is None:
+		scope = ScopeContext()
+	return scope
+
+
 # this is used to disambiguate user input when object name given is not specific enough
 # takes the object name and list of matching objects
 # prints the list of objects with labels to help the user distinguish them
@@ -65,7 +151,7 @@ def chooseObject(name,objects,verb=None):
 			labels.append("riding")
 		elif obj in Core.player.gear.values():
 			labels.append("equipped")
-		elif obj in Core.player.objTree():
+		elif obj in currentScope().invTree:
 			labels.append("Inventory")
 		elif getattr(obj,"determiner",None):
 			labels.append(obj.determiner)
@@ -98,7 +184,9 @@ def chooseObject(name,objects,verb=None):
 # roomD and playerD are the 'degree' of the query.
 # Look at Core.py objQuery for details on query degree
 def findObject(term,verb=None,queryType="both",filter=None,roomD=0,playerD=2,
-reqSource=None,silent=False,allowRooms=False):
+reqSource=None,silent=False,allowRooms=False,scope=None):
+	if scope is None:
+		scope = currentScope()
 	if term is None and not silent and verb is not None:
 		term = getNoun(f"What will you {verb}?")
 	if term in Data.cancels or term is None or term == "nothing":
@@ -110,11 +198,16 @@ reqSource=None,silent=False,allowRooms=False):
 		term = term[3:]
 		my = True
 
+	# equivalent to player.nameQuery() and surroundings().nameQuery(),
+	# but filters the trees cached for this command
+	term = term.lower()
 	matches = set()
 	if queryType == "player" or queryType == "both":
-		matches |= Core.player.nameQuery(term,d=playerD)
+		matches |= {obj for obj in scope.tree(Core.player,playerD) \
+		if Core.nameMatch(term,obj)}
 	if queryType == "room" or queryType == "both":
-		matches |= Core.player.surroundings().nameQuery(term,d=roomD)
+		matches |= {obj for obj in scope.tree(scope.surroundings,roomD) \
+		if Core.nameMatch(term,obj) and Core.player not in obj.ancestors()}
 	if not allowRooms:
 		matches = {match for match in matches if not isinstance(match,Core.Room)}
 	if queryType == "player" and Core.nameMatch(term,Core.player.carrying):
@@ -163,11 +256,13 @@ reqSource=None,silent=False,allowRooms=False):
 
 
 def enforceVerbScope(verb,obj,permitAnchor=True,permitParent=False,permitSelf=False,
-permitDistance=False,permitOutside=False):
+permitDistance=False,permitOutside=False,scope=None):
 	if obj is None:
 		return True
+	if scope is None:
+		scope = currentScope()
 	parent = Core.player.parent
-	if obj not in parent.objTree(includeSelf=True):
+	if obj not in scope.parentTree:
 		Core.Print(f"You can't {verb} {-obj}, you're {parent.passprep} {-parent}.")
 		return True
 	if not permitAnchor and obj is Core.player.anchor():
@@ -191,16 +286,13 @@ permitDistance=False,permitOutside=False):
 		Core.Print(f"You can't {verb} yourself.")
 		return True
 	if not permitDistance:
-		anchor = Core.player.anchor()
-		if anchor in Core.player.parent.surfaces + (None,):
-			anchor = Core.player.parent
 		rec = f" Try jumping to {obj.pronoun}." if verb == "get on" else ""
-		if obj not in anchor.objTree(includeSelf=True):
+		if obj not in scope.anchorTree:
 			Core.Print(f"You can't {verb} {-obj}, you're {Core.player.position()}.{rec}")
 			return True
 
 	if Core.player.parent.ceiling:
-		if obj in Core.player.parent.ceiling.objTree(includeSelf=True):
+		if obj in scope.ceilingTree:
 			if Core.player.Size() < Core.player.parent.Size() // 2:
 				if not Core.player.hasAnyStatus("clingfast","flying"):
 					Core.Print(f"You can't {verb} {-obj}, it is too high.")
@@ -400,6 +492,8 @@ def dispatchShortCommand(command,verb):
 			return Laugh()
 		elif verb == "quit":
 			return Quit()
+		elif verb == "undo":
+			return Undo()
 		elif verb in Data.abilities:
 			Core.player.printAbility(verb.upper())
 		elif verb in Data.traits:
@@ -416,9 +510,24 @@ def dispatchShortCommand(command,verb):
 # it is called on infinite loop until it returns True
 # it returns True only when the player performs some action
 def interpret():
-	global helpCounter
+	global scope
+	try:
+		# while recording, each command is written to the event transcript, see Transcript.py
+		if Transcript.transcript.enabled:
+			return Transcript.transcript.record(interpretCommand)
+		return interpretCommand()
+	finally:
+		# the trees cached for this command are not used by anything run between commands
+		scope = None
+
+
+def interpretCommand():
+	global helpCounter, scope
 	if not Core.player.isAlive():
 		return True
+	# report any saves finished in the background
+	Menu.saver.report()
+	queued = len(commandQueue) > 0
 	if commandQueue:
 		queuedInput = commandQueue.pop(0)
 		Core.waitInput("\n& " + " ".join(queuedInput),end="")
@@ -429,6 +538,12 @@ def interpret():
 	if len(command) == 0:
 		return promptHelp("Command not understood.")
 	verb = command[0]	# verb is always first word
+	Transcript.transcript.annotate(command=command,verb=verb,queued=queued)
+	# object trees are cached from here until the command is complete
+	scope = ScopeContext()
+	# whatever the command changes around the player is autosaved and checkpointed,
+	# even if it fails or passes no time
+	Core.game.markDirty(*Core.game.renderedRooms())
 
 	# handle cases with special verb commands
 	if verb.startswith("\\") or verb in cheatcodes:
@@ -437,15 +552,28 @@ def interpret():
 			Core.Print(command,color='k')
 			return False
 		Core.Print(verb,color='k')
+		# cheatcodes can change any object in the world
+		Core.game.markAllDirty()
+		if Profiler.profiler.enabled:
+			return Profiler.profiler.measure(verb,"cheatcode",cheatcodes[verb],
+			Core.game.lastRawCommand)
 		return cheatcodes[verb](Core.game.lastRawCommand)
 	elif verb in shortcommands:
+		if Profiler.profiler.enabled:
+			return Profiler.profiler.measure(verb,"statcommand",dispatchShortCommand,
+			command,verb)
 		return dispatchShortCommand(command,verb)
 	elif verb not in actions:
 		return promptHelp(f"'{verb}' is not a valid verb.")
 
 	dobj,iobj,prep = parse(command[1:])
+	Transcript.transcript.annotate(dobj=dobj,iobj=iobj,prep=prep)
 	# this line calls the action function using the 'actions' dict
-	actionCompleted = actions[verb](dobj,iobj,prep)
+	if Profiler.profiler.enabled:
+		actionCompleted = Profiler.profiler.measure(verb,"action",actions[verb],
+		dobj,iobj,prep)
+	else:
+		actionCompleted = actions[verb](dobj,iobj,prep)
 	# if action didn't succeed, return False
 	if not actionCompleted:
 		commandQueue.clear()
@@ -461,35 +589,31 @@ def interpret():
 ##########################################
 
 def Diagnostic(command):
-	gc.collect()
-	sizes = [sys.getsizeof(obj) for obj in Core.game.itemRegistry.values()]
-	sizes.extend([sys.getsizeof(obj) for obj in Core.world.values()])
-	sizes.append(sys.getsizeof(Core.player))
-	sizes.append(sys.getsizeof(Core.world))
-	sizes.append(sys.getsizeof(Core.game))
-	pythonsizes = [sys.getsizeof(obj) for obj in gc.get_objects()]
-
-	objInfo = lambda objects: [(sys.getsizeof(obj),type(obj),repr(obj)[:50]) \
-	for obj in objects]
-
-	gameObjects = list(Core.game.itemRegistry.values()) + list(Core.world.values()) + \
-	[Core.player,Core.world,Core.game]
-	gameObjInfo = objInfo(gameObjects)
-	gameObjSizes = [info[0] for info in gameObjInfo]
-	print(f"Number of objects in registry: {len(Core.game.itemRegistry)}")
-	print(f"Number of rooms in world: {len(Core.world)}")
-	print(f"Game object sizes (min, avg, max): {min(gameObjSizes)}b," \
-	f" {sum(gameObjSizes)//len(gameObjSizes)}b, {max(gameObjSizes)}b")
-	print(f"Largest game object: {max(gameObjInfo,key=lambda x:x[0])}")
-	print(f"Memory used by game objects: {sum(gameObjSizes)}b")
-
-	pyObjInfo = objInfo(gc.get_objects())
-	pyObjSizes = [info[0] for info in pyObjInfo]
-	print(f"Total number of python objects: {len(pyObjSizes)}")
-	print(f"All python object sizes (min, avg, max): {min(pyObjSizes)}b," \
-	f" {sum(pyObjSizes)//len(pyObjSizes)}b, {max(pyObjSizes)}b")
-	print(f"Largest python object: {max(pyObjInfo,key=lambda x:x[0])}")
-	print(f"Approximate total memory usage: {sum(pyObjSizes)}b")
+	tracker = Memory.tracker
+	arg = command[1].lower() if len(command) > 1 else None
+	if arg == "on":
+		tracker.enable()
+		Core.Print("Memory tracing enabled.",color="k")
+	elif arg == "off":
+		tracker.disable()
+		Core.Print("Memory tracing disabled.",color="k")
+	elif arg == "reset":
+		tracker.reset()
+		Core.Print("Memory snapshot cleared.",color="k")
+	elif arg is None or arg == "dump":
+		accounting = tracker.accounting()
+		snapshot = tracker.takeSnapshot() if tracemalloc.is_tracing() else None
+		tracker.report(accounting,snapshot)
+		if snapshot is None:
+			Core.Print("Use '\\dgn on' to trace allocations between diagnostics.",color="k")
+		filename = command[2] if len(command) > 2 else "./logs/memory.json"
+		try:
+			tracker.dump(filename,accounting,snapshot)
+			Core.Print(f"Diagnostics written to {filename}",color="k")
+		except OSError as e:
+			Core.Print(f"Error: Could not write diagnostics: {e}",color="k")
+	else:
+		Core.Print("Error: Expected 'on', 'off', 'reset', or 'dump'",color="k")
 
 
 def Evaluate(command):
@@ -507,6 +631,35 @@ def Evaluate(command):
 		Core.Print(traceback.format_exc(),color="k",delay=0)
 
 
+def Events(command):
+	transcript = Transcript.transcript
+	arg = command[1].lower() if len(command) > 1 else None
+	if arg == "on":
+		try:
+			transcript.enable(command[2] if len(command) > 2 else None)
+		except OSError as e:
+			Core.Print(f"Error: Could not open transcript: {e}",color="k")
+			return
+		Core.Print(f"Recording events to {transcript.path}",color="k")
+	elif arg == "off":
+		if transcript.disable():
+			Core.Print("Event recording stopped.",color="k")
+		else:
+			Core.Print("Events are not being recorded.",color="k")
+	elif arg == "export":
+		filename = command[2] if len(command) > 2 else "./logs/replay.txt"
+		try:
+			n = transcript.export(filename)
+			Core.Print(f"Exported {n} inputs to {filename}",color="k")
+		except (OSError,EOFError) as e:
+			Core.Print(f"Error: Could not export transcript: {e}",color="k")
+	elif arg is None:
+		state = "on" if transcript.enabled else "off"
+		Core.Print(f"Event recording is {state}, transcript at {transcript.path}",color="k")
+	else:
+		Core.Print("Error: Expected 'on', 'off', or 'export'",color="k")
+
+
 def Execute(command):
 	if len(command) < 2:
 		Core.Print("Error: No code given",color="k")
@@ -656,6 +809,23 @@ def Learn(command):
 	# 	Core.Print(f"Error: Value not number {command[1]}",color="k")
 
 
+# reports registered Items which can't be reached from the world, and reachable Items
+# which aren't registered, by class, with a few of each as examples
+def Leaks(command):
+	# Items only waiting for the cycle collector aren't leaked, so collect them first
+	gc.collect()
+	unreachable, unregistered = Core.game.registryLeaks()
+	for label, objects in (("Registered but unreachable",unreachable),
+	("Reachable but unregistered",unregistered)):
+		Core.Print(f"{label}: {len(objects)}",color="k")
+		byClass = {}
+		for obj in objects:
+			byClass.setdefault(type(obj).__name__,[]).append(obj)
+		for className, objs in sorted(byClass.items(),key=lambda item: -len(item[1])):
+			examples = ", ".join(f"{obj.name} ID{obj.id}" for obj in objs[:3])
+			Core.Print(f"  {className}: {len(objs)} ({examples})",color="k")
+
+
 def Lob(command):
 	if len(command) < 2:
 		Core.Print("Error: no object name given",color="k")
@@ -708,6 +878,33 @@ def Mode(command):
 		Core.Print(f"Error: Value not number {command[1]}",color="k")
 
 
+def Profile(command):
+	profiler = Profiler.profiler
+	arg = command[1].lower() if len(command) > 1 else None
+	if arg == "on":
+		profiler.enable()
+		Core.Print("Profiling enabled.",color="k")
+	elif arg == "off":
+		profiler.disable()
+		Core.Print("Profiling disabled.",color="k")
+	elif arg == "reset":
+		profiler.reset()
+		Core.Print("Profile cleared.",color="k")
+	elif arg is None or arg == "dump":
+		if not profiler.enabled and not profiler.samples:
+			Core.Print("Profiling is off. Use '\\prf on' to enable it.",color="k")
+			return
+		profiler.report()
+		filename = command[2] if len(command) > 2 else "./logs/profile.json"
+		try:
+			profiler.dump(filename)
+			Core.Print(f"Profile written to {filename}",color="k")
+		except OSError as e:
+			Core.Print(f"Error: Could not write profile: {e}",color="k")
+	else:
+		Core.Print("Error: Expected 'on', 'off', 'reset', or 'dump'",color="k")
+
+
 def Pypot(command):
 	if len(command) < 2:
 		Core.Print("Error: No money value given",color="k")
@@ -804,6 +1001,21 @@ def Spawn(command):
 	Effects.spawnObject(obj)
 
 
+def Rewind(command):
+	try:
+		n = int(command[1]) if len(command) > 1 else 1
+	except ValueError:
+		Core.Print(f"Error: Value not number {command[1]}",color="k")
+		return False
+	depth = Menu.checkpoints.depth()
+	if not Menu.checkpoints.rewind(n):
+		Core.Print(f"Can't rewind {n} turns, only {depth} can be undone.",color="k")
+		return False
+	Core.Print(f"Rewound {n} turn{'s' if n != 1 else ''}.",color="k")
+	Core.game.currentroom.describe()
+	return True
+
+
 def Teleport(command):
 	if len(command) < 2:
 		Core.Print("Error: no location given",color="k")
@@ -921,6 +1133,11 @@ def Quit(*args):
 		return True
 
 
+# undo the last turn, see Menu.CheckpointRing
+def Undo(*args):
+	return Rewind(["\\rwd",1])
+
+
 def Shout(*args): 
 	Core.Print('"AHHHHHHHHHH"',color="y")
 	Core.player.removeStatus("hidden",-3)
@@ -1746,7 +1963,7 @@ def Go(dobj,iobj,prep):
 	if (dobj,iobj,prep) == (None,None,None):
 		dobj,iobj,prep = parse(tokenize(read("Where will you go?")))
 	if dobj in Data.cancels: return False
-	if dobj in ("back","backward","backwards"): dobj = Core.game.prevroom.name.lower()
+	if dobj in ("back","backward","backwards"): dobj = Core.game.prevroom.worldKey()
 	if dobj in ("ahead","forward","forwards"): dobj = getNoun("In which direction?")
 	if prep in ("behind","below","beneath","under"):
 		return Hide(dobj,iobj,prep)
@@ -2356,7 +2573,7 @@ def Restrain(dobj,iobj,prep):
 
 
 def Return(*args): 
-	return Go(None, Core.game.prevroom.name.lower(), None)
+	return Go(None, Core.game.prevroom.worldKey(), None)
 
 
 def Ring(dobj,iobj,prep):
@@ -2379,8 +2596,7 @@ def Rub(dobj,iobj,prep):
 
 def Save(dobj,iobj,prep,quick=False):
 	if quick:
-		Menu.quickSave("quicksave")
-		Core.waitInput("Quicksaved.",color="k")
+		Menu.quickSave("quicksave",announce=True)
 	else:
 		Menu.saveGame(dobj)
 	return False
@@ -2904,15 +3120,19 @@ def Wave(dobj,iobj,prep):
 cheatcodes = {
 	"\\dgn":Diagnostic,
 	"\\evl":Evaluate,
+	"\\evt":Events,
 	"\\exe":Execute,
 	"\\get":Get,
 	"\\grw":Grow,
 	"\\ing":Honor,
 	"\\lrn":Learn,
+	"\\lks":Leaks,
 	"\\lob":Lob,
 	"\\mbu":Imbue,
 	"\\mod":Mode,
 	"\\pot":Pypot,
+	"\\prf":Profile,
+	"\\rwd":Rewind,
 	"\\set":Set,
 	"\\shk":Shrink,
 	"\\spn":Spawn,
@@ -19,6 +19,8 @@ import Data
 
 
 class Axe(Core.Weapon):
+	__slots__ = ()
+
 	# TODO: do something with this
 	def cut(self):
 		pass
@@ -26,6 +28,8 @@ class Axe(Core.Weapon):
 
 
 class Bed(Core.Item):
+	__slots__ = ()
+
 	def traverse(self,traverser,dir=None,verb=None):
 		if verb == "jump":
 			Core.Print(traverser+f"jumps onto {-self}.")
@@ -49,6 +53,8 @@ class Bed(Core.Item):
 
 
 class Bottle(Core.Item):
+	__slots__ = ()
+
 	def breaks(self):
 		if self.id not in Core.game.itemRegistry:
 			return False
@@ -73,6 +79,8 @@ class Bottle(Core.Item):
 
 # Box is a container that can be opened and closed to hide contents and prevent passage
 class Box(Core.Container):
+	__slots__ = ("closed",)
+
 	def __init__(self,name,desc,weight,durability,composition,items,closed=False,**kwargs):
 		super().__init__(name,desc,weight,durability,composition,items,**kwargs)
 		self.closed = closed
@@ -167,6 +175,8 @@ class Controller(Core.Item):
 
 # Food heals the eater when consumed, then is removed from inventory
 class Food(Core.Item):
+	__slots__ = ("heal",)
+
 	def __init__(self,name,desc,weight,durability,composition,heal,**kwargs):
 		super().__init__(name,desc,weight,durability,composition,**kwargs)
 		self.heal = heal
@@ -187,6 +197,8 @@ class Food(Core.Item):
 
 
 class Foot(Core.Item):
+	__slots__ = ()
+
 	def asWeapon(self):
 		return Core.Weapon(self.name,self.desc,self.weight,self.durability,"",
 		Core.min1(self.weight//4),0,0,0,"b")
@@ -194,6 +206,8 @@ class Foot(Core.Item):
 
 
 class Fountain(Core.Fixture):
+	__slots__ = ()
+
 	def douse():
 		pass
 
@@ -280,6 +294,8 @@ class Timer(Controller):
 
 
 class Hand(Core.Item):
+	__slots__ = ()
+
 	def asWeapon(self):
 		return Core.Weapon(self.name,self.desc,self.weight,self.durability,"",
 		Core.min1(self.weight//4)+1,2,0,0,"b")
@@ -287,6 +303,8 @@ class Hand(Core.Item):
 
 
 class Key(Core.Item):
+	__slots__ = ()
+
 	def lockWith(self,box):
 		pass
 
@@ -297,6 +315,8 @@ class Key(Core.Item):
 
 
 class Lockbox(Box):
+	__slots__ = ("keyids","locked")
+
 	def __init__(self,name,desc,weight,durability,composition,keyids,locked,**kwargs):
 		super().__init__(name,desc,weight,durability,composition,**kwargs)
 		self.keyids = keyids
@@ -361,6 +381,8 @@ class Lockbox(Box):
 
 
 class Mouth(Core.Item):
+	__slots__ = ()
+
 	def asWeapon(self):
 		return Core.Weapon(self.name,self.desc,self.weight,self.durability,"",
 		Core.min1(self.weight//4),0,0,4,"p")
@@ -368,8 +390,11 @@ class Mouth(Core.Item):
 
 
 class Plash(Core.Container):
+	__slots__ = ("depth","finite")
+
+	# durability, fixed, and depth are always derived, so saved values are ignored
 	def __init__(self,name,desc,weight,composition,items,finite=False,occupyprep="on",
-	**kwargs):
+	durability=None,fixed=None,depth=None,**kwargs):
 		assert composition in Data.liquids
 		super().__init__(name,desc,weight,-1,composition,items,fixed=True,**kwargs)
 		self.depth = self.capacity
@@ -591,6 +616,8 @@ class Plash(Core.Container):
 
 
 class Potion(Bottle):
+	__slots__ = ()
+
 	# heals the player hp 1000, replaces potion with an empty bottle
 	def imbibe(self,drinker):
 		drinker.Print(f"You drink {-self}.")
@@ -608,6 +635,8 @@ class Potion(Bottle):
 
 
 class Shard(Core.Item):
+	__slots__ = ()
+
 	#???
 	def Cut(self,P):
 		# TODO: do something here?
@@ -628,6 +657,8 @@ class Shard(Core.Item):
 
 
 class Sign(Core.Item):
+	__slots__ = ("text",)
+
 	def __init__(self,name,desc,weight,durability,composition,text,**kwargs):
 		super().__init__(name,desc,weight,durability,composition,**kwargs)
 		self.text = text
@@ -666,6 +697,8 @@ class Switch(Controller):
 
 
 class Sword(Core.Weapon):
+	__slots__ = ()
+
 	def Cut(self,cutter):
 		# TODO: once again, do something with this?
 		cutter.Print("[you cut something?]")
@@ -673,12 +706,16 @@ class Sword(Core.Weapon):
 
 
 class Table(Core.Item):
+	__slots__ = ()
+
 	def __init__(self,name,desc,weight,durability,composition,**kwargs):
 		super().__init__(name,desc,weight,durability,composition,**kwargs)
 
 
 
 class Wall(Core.Passage):
+	__slots__ = ("difficulty",)
+
 	def __init__(self,name,desc,weight,composition,links,difficulty,passprep=None,
 	**kwargs):
 		super().__init__(name,desc,weight,composition,links,passprep=passprep,**kwargs)
@@ -752,9 +789,13 @@ class Wall(Core.Passage):
 # Windows are passages that can only be opened by breaking them
 # they have a view that looks at the destination when examined
 class Window(Core.Passage):
-	def __init__(self,name,desc,weight,composition,linkKeys,linkPort,closed=True,
-	broken=False,view=None,passprep="through",**kwargs):
-		links = {linkKey: linkPort for linkKey in linkKeys}
+	__slots__ = ("view","closed","broken")
+
+	def __init__(self,name,desc,weight,composition,linkKeys=(),linkPort=None,closed=True,
+	broken=False,view=None,passprep="through",links=None,**kwargs):
+		# saved windows store their links directly
+		if links is None:
+			links = {linkKey: linkPort for linkKey in linkKeys}
 		super().__init__(name,desc,weight,composition,links,passprep=passprep,**kwargs)
 		self.view = view
 		if self.view is not None:
@@ -864,6 +905,8 @@ class Window(Core.Passage):
 
 
 class Door(Window):
+	__slots__ = ()
+
 	def __init__(self,name,desc,weight,durability,composition,links,descname,closed=True,
 	**kwargs):
 		super().__init__(name,desc,weight,durability,composition,links,descname,**kwargs)
@@ -898,7 +941,7 @@ factory = {
 	"compass": lambda: Core.Compass("compass","A plain steel compass with a red needle.",2,10,"steel",rarity=2,plural="compasses"),
 	"green potion": lambda: Potion("green potion", "A bubbling green liquid in a glass bottle.",10,3,"glass",["bottle","glass","potion"],2),
 	"iron ingot": lambda: Core.Item("iron ingot","A solid bar of iron.",20,200,"iron",["ingot","bar","iron"]),
-	"puddle": lambda: Plash("puddle","A small puddle of murky water.",randint(2,10),"water",[],finite=True),
+	"puddle": Core.varies(lambda: Plash("puddle","A small puddle of murky water.",randint(2,10),"water",[],finite=True)),
 	"red potion": lambda: Potion("red potion", "A bubbling red liquid in a glass bottle.",10,3,"glass",["bottle","glass","potion"],2),
 	"shard": lambda: Shard("glass shard","A small glass shard.",2,1,"glass",["shard"])
 }
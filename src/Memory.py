@@ -0,0 +1,178 @@
+# Memory.py
+# This file contains the memory diagnostics reported by the \dgn cheatcode
+# This file is dependent on Core.py and is a dependency of Interpreter.py
+
+# It measures the deep size of every loaded Room and the objects in it, totalled by
+# class and by Room. Each object is counted with the lists, dicts, sets, and strings it
+# holds, but not with other game objects, which are counted on their own, and anything
+# shared, such as the aliases of objects spawned from one Prototype, is counted once.
+# Only loaded Rooms are walked, so it is cheap enough to run every few turns in a long
+# test. When tracing is on, it also takes tracemalloc snapshots, tagged with the game
+# time, and compares each with the one before it, to show where memory is growing.
+
+import json
+import os
+import sys
+import tracemalloc
+
+import Core
+
+
+
+####################
+## MEMORY CLASSES ##
+####################
+
+
+# returns the size of obj and every list, tuple, dict, set, and string within it,
+# not counting game objects other than obj or anything whose id is in seen
+# other objects, such as dialogue trees, are shared game data, so only their own
+# size is counted. The ids of everything counted are added to seen
+def deepSize(obj,seen):
+	size = 0
+	stack = [obj]
+	while stack:
+		value = stack.pop()
+		if id(value) in seen or value is None:
+			continue
+		if isinstance(value,Core.GameObject) and value is not obj:
+			continue
+		seen.add(id(value))
+		size += sys.getsizeof(value)
+		if isinstance(value,(str,int,float,bool)):
+			continue
+		elif isinstance(value,dict):
+			stack.extend(value.keys())
+			stack.extend(value.values())
+		elif isinstance(value,(list,tuple,set,frozenset)):
+			stack.extend(value)
+		elif isinstance(value,Core.GameObject):
+			stack.extend(value.attributes().values())
+	return size
+
+
+class MemoryTracker():
+	def __init__(self,frames=1,top=15):
+		# number of stack frames recorded for each allocation while tracing
+		self.frames = frames
+		# number of lines of each report, and of allocations kept in each snapshot
+		self.top = top
+		# the last tracemalloc snapshot taken and the game time it was taken at
+		self.snapshot = None
+		self.snapshotTime = None
+
+
+	### Operation ###
+
+	def enable(self):
+		if tracemalloc.is_tracing():
+			return False
+		tracemalloc.start(self.frames)
+		return True
+
+
+	def disable(self):
+		if not tracemalloc.is_tracing():
+			return False
+		tracemalloc.stop()
+		self.reset()
+		return True
+
+
+	def reset(self):
+		self.snapshot = None
+		self.snapshotTime = None
+
+
+	# take a tracemalloc snapshot and return the allocations which grew the most since
+	# the last one, or the largest allocations if this is the first
+	def takeSnapshot(self):
+		snapshot = tracemalloc.take_snapshot().filter_traces((
+			tracemalloc.Filter(False,tracemalloc.__file__),
+			tracemalloc.Filter(False,__file__),
+			tracemalloc.Filter(False,"<frozen importlib._bootstrap*>")
+		))
+		if self.snapshot is None:
+			stats = snapshot.statistics("lineno")[:self.top]
+			growth = [{"line": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+			for stat in stats]
+		else:
+			stats = snapshot.compare_to(self.snapshot,"lineno")[:self.top]
+			growth = [{"line": str(stat.traceback), "bytes": stat.size,
+			"growth": stat.size_diff, "count": stat.count, "countGrowth": stat.count_diff}
+			for stat in stats]
+		since = self.snapshotTime
+		self.snapshot = snapshot
+		self.snapshotTime = Core.game.time
+		return {"since": since, "allocations": growth}
+
+
+	### Getters ###
+
+	# returns the number and deep size of the objects of each class and of each loaded
+	# Room with its contents, and the size of the Rooms which are stored unloaded
+	def accounting(self):
+		seen = set()
+		classes = {}
+		def measure(obj):
+			size = deepSize(obj,seen)
+			count, total = classes.get(type(obj).__name__,(0,0))
+			classes[type(obj).__name__] = (count+1,total+size)
+			return size
+
+		rooms = {}
+		unloaded = 0
+		for key, room in Core.world.items():
+			if room.isLoaded():
+				rooms[key] = measure(room) + sum(measure(obj) for obj in room.objTree())
+			else:
+				unloaded += 1
+		# the player and their inventory, if they aren't in a loaded Room
+		for obj in Core.player.objTree(includeSelf=True):
+			if id(obj) not in seen:
+				measure(obj)
+
+		# rooms which aren't loaded are kept on disk, and take no memory of their own
+		storedBytes = Core.roomStore.storedBytes() if Core.roomStore is not None else 0
+		return {
+			"time": Core.game.time,
+			"classes": {name: {"count": count, "bytes": total}
+			for name, (count, total) in sorted(classes.items(),key=lambda kv: -kv[1][1])},
+			"rooms": dict(sorted(rooms.items(),key=lambda kv: -kv[1])),
+			"unloadedRooms": unloaded,
+			"storedBytes": storedBytes,
+			"registered": len(Core.game.itemRegistry)
+		}
+
+
+	### User Output ###
+
+	# print the accounting, and the allocations from the snapshot if one was taken
+	def report(self,accounting,snapshot=None):
+		lines = [f"Game time {accounting['time']}: {accounting['registered']} registered " \
+		f"objects, {accounting['unloadedRooms']} rooms unloaded " \
+		f"({accounting['storedBytes']:,}b on disk)"]
+		lines.append(f"{'class':<20}{'count':>8}{'bytes':>12}")
+		for name, stats in list(accounting["classes"].items())[:self.top]:
+			lines.append(f"{name[:19]:<20}{stats['count']:>8}{stats['bytes']:>12,}")
+		lines.append(f"{'room':<28}{'bytes':>12}")
+		for key, size in list(accounting["rooms"].items())[:self.top]:
+			lines.append(f"{key[:27]:<28}{size:>12,}")
+		if snapshot is not None:
+			if snapshot["since"] is None:
+				lines.append("Largest allocations:")
+			else:
+				lines.append(f"Allocations grown since game time {snapshot['since']}:")
+			for stat in snapshot["allocations"]:
+				growth = f" ({stat['growth']:+,}b)" if "growth" in stat else ""
+				lines.append(f"  {stat['bytes']:>10,}b{growth} {stat['line']}")
+		Core.Print("\n".join(lines),color="k",delay=0)
+
+
+	def dump(self,filename,accounting,snapshot=None):
+		os.makedirs(os.path.dirname(filename) or ".",exist_ok=True)
+		with open(filename,"w") as fd:
+			json.dump({"accounting": accounting, "snapshot": snapshot},fd,indent="\t")
+
+
+tracker = MemoryTracker()
@@ -1,6 +1,6 @@
 # Menu.py
 # This file serves as an API for Interpreter.py to save and load game data with files
-# This file is dependent on Core.py, Items.py, Creatures.py, and Data.py
+# This file is dependent on Core.py, Items.py, Creatures.py, Data.py, and SaveFile.py
 # and is a dependency of Interpreter.py
 
 # It consists of four main parts;
@@ -10,13 +10,21 @@
 # 4. Game Intro functions	(functions to print game intro animation)
 
 from time import sleep
+from datetime import datetime
 from random import randint, choice
-import os, json
+import os, json, ast
+import tempfile
+import zlib, lzma
+import inspect
+import threading, queue
+from collections import deque
+import atexit
 
 import Data
 import Core
 import Creatures
 import Items
+import SaveFile
 
 
 
@@ -25,15 +33,60 @@ import Items
 ##########################
 
 
+# the text of the game file, probably named "game.txt", from a game header
+def gameText(header):
+	lines = (header["mode"], header["currentroom"], header["prevroom"], header["time"],
+	set(header["events"]))
+	return "".join(f"{line}\n" for line in lines)
+
+
 # just writes the game object to a file, probably named "game.txt"
 def writeGame(filename,Game,World):
-	gfd = open(filename,"w")
-	gfd.write(str(Game.mode) + "\n")
-	gfd.write(Core.getRoomKey(Game.currentroom,World) + "\n")
-	gfd.write(Core.getRoomKey(Game.prevroom,World) + "\n")
-	gfd.write(str(Game.time) + "\n")
-	gfd.write(str(Game.events) + "\n")
-	gfd.close()
+	writeAtomic(filename,gameText(gameHeader(Game,World)))
+
+
+# the compressors that save files can be written with (see Data.SAVE_COMPRESSION)
+compressors = {
+	"zlib": lambda: zlib.compressobj(6),
+	"lzma": lambda: lzma.LZMACompressor(lzma.FORMAT_XZ,preset=1)
+}
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+# yields data, which is text, bytes, or an iterable of pieces of either, as bytes in
+# blocks of about blockSize, compressed if compression is given
+# pieces are encoded as they come, so the whole file is never held in memory at once
+def encodeData(data,compression=None,blockSize=1<<16):
+	if isinstance(data,(str,bytes)):
+		data = (data,)
+	compressor = compressors[compression]() if compression else None
+	block, size = [], 0
+	for piece in data:
+		block.append(piece.encode("utf-8") if isinstance(piece,str) else piece)
+		size += len(piece)
+		if size >= blockSize:
+			raw = b"".join(block)
+			block, size = [], 0
+			yield compressor.compress(raw) if compressor else raw
+	raw = b"".join(block)
+	yield compressor.compress(raw) + compressor.flush() if compressor else raw
+
+
+# writes data (see encodeData) to a temporary file beside filename and syncs it to disk
+# returns the temporary file's name, which can then be renamed to filename
+def writeTemp(filename,data,compression=None):
+	tempname = filename + ".tmp"
+	with open(tempname,"wb") as fd:
+		for block in encodeData(data,compression):
+			fd.write(block)
+		fd.flush()
+		os.fsync(fd.fileno())
+	return tempname
+
+
+# replaces filename with data all at once, so a crash can't leave it half written
+def writeAtomic(filename,data,compression=None):
+	os.replace(writeTemp(filename,data,compression),filename)
 
 
 visitedobjects = set()
@@ -56,6 +109,8 @@ class worldEncoder(json.JSONEncoder):
 			for k, v in jsonDict.items():
 				if isinstance(v, (Core.Creature, Core.Item)):
 					jsonDict[k] = v.id
+			if getattr(objToWrite,"prototype",None) is not None:
+				return prototypeOverrides(objToWrite,jsonDict)
 			return jsonDict
 		elif type(objToWrite) is Core.Player:
 			return {"__class__": "Player"}
@@ -111,37 +166,174 @@ def find_problematic_subobject(obj):
 			print(f"Error: {error}")
 
 
-def writeWorld(filename,World):
+# returns how obj, an object spawned from a Prototype, is saved; the name of its
+# Prototype and only the attributes which differ from it, given in jsonDict
+def prototypeOverrides(obj,jsonDict):
+	prototype = Core.prototypes[obj.prototype]
+	if prototype.saved is None:
+		prototype.saved = snapshot(prototype.template)
+	saved = prototype.saved
+	kind = "factoryCreature" if isinstance(obj,Core.Creature) else "factoryItem"
+	overrides = {"__class__": kind, "prototype": prototype.name}
+	for key, value in jsonDict.items():
+		if key in ("__class__","prototype"):
+			continue
+		value = snapshot(value)
+		if key not in saved or value != saved[key]:
+			overrides[key] = value
+	return overrides
+
+
+# returns a copy of obj made only of dicts, lists, and primitives, as worldEncoder
+# would write it. Taking a snapshot is much quicker than encoding and writing it,
+# so the game can continue while the snapshot is written in the background
+def snapshot(obj,encoder=worldEncoder()):
+	if obj is None or isinstance(obj,(str,int,float,bool)):
+		return obj
+	if isinstance(obj,dict):
+		return {key: snapshot(value,encoder) for key, value in obj.items()}
+	if isinstance(obj,(list,tuple)):
+		return [snapshot(value,encoder) for value in obj]
+	return snapshot(encoder.default(obj),encoder)
+
+
+# takes a snapshot of obj, trying to find the part of it that fails if it can't
+def checkedSnapshot(obj):
+	global visitedobjects
+	visitedobjects = set()
 	try:
-		with open(filename, "w") as fd:
-			json.dump(World, fd, cls=worldEncoder, indent="\t")
+		return snapshot(obj)
 	except Exception as e:
 		print("Error while serializing object to JSON:")
 		print(f"Error: {e}")
 
-		# Now we try to isolate the problematic sub-object in World
+		# Now we try to isolate the problematic sub-object
 		print("Attempting to find the problematic sub-object...")
-		find_problematic_subobject(World)
+		find_problematic_subobject(obj)
 
 		raise  # Re-raise the exception for further handling
 
 
+def writeWorld(filename,World):
+	writeAtomic(filename,json.JSONEncoder(indent="\t").iterencode(checkedSnapshot(World)),
+	Data.SAVE_COMPRESSION)
+
+
 def writePlayer(filename,Player):
-	global visitedobjects
-	visitedobjects = set()
+	writeAtomic(filename,json.JSONEncoder(indent="\t").iterencode(
+	checkedSnapshot(Player.convertToJSON())),Data.SAVE_COMPRESSION)
 
-	try:
-		with open(filename, "w") as fd:
-			json.dump(Player.convertToJSON(), fd, cls=worldEncoder, indent="\t")
-	except Exception as e:
-		print("Error while serializing object to JSON:")
-		print(f"Error: {e}")
 
-		# Now we try to isolate the problematic sub-object in World
-		print("Attempting to find the problematic sub-object...")
-		find_problematic_subobject(Player)
+# writes save files on a background thread, so the game never waits on encoding
+# them or on the disk. Each job is a function which writes a snapshot taken by
+# the game thread. Jobs are done in the order they are submitted, and their
+# outcomes are reported by the game thread when it next calls report()
+class SaveWriter():
+	def __init__(self):
+		self.jobs = queue.Queue()
+		self.results = queue.Queue()
+		self.thread = None
 
-		raise  # Re-raise the exception for further handling
+
+	def submit(self,savename,write,announce=False):
+		if self.thread is None or not self.thread.is_alive():
+			self.thread = threading.Thread(target=self.work,name="SaveWriter",daemon=True)
+			self.thread.start()
+		self.jobs.put((savename,write,announce))
+
+
+	def work(self):
+		while True:
+			savename, write, announce = self.jobs.get()
+			try:
+				write()
+				self.results.put((savename,None,announce))
+			except Exception as e:
+				self.results.put((savename,e,announce))
+			finally:
+				self.jobs.task_done()
+
+
+	# block until every submitted save is written
+	def wait(self):
+		self.jobs.join()
+
+
+	# print the outcome of saves finished since the last report
+	def report(self):
+		while not self.results.empty():
+			savename, error, announce = self.results.get()
+			if error is not None:
+				# the save may be incomplete, so the next one to it is written in full
+				if Core.game.journalSave == savename:
+					Core.game.journalSave = None
+				Core.Print(f"Could not save {savename}: {error}",delay=0,color="k")
+			elif announce:
+				Core.Print(f"Game saved as {savename}.",delay=0,color="k")
+
+
+saver = SaveWriter()
+atexit.register(saver.wait)
+
+
+# the state of the game object that the journal records, alongside the rooms
+def gameHeader(Game,World):
+	return {
+		"mode": Game.mode,
+		"currentroom": Game.currentroom.worldKey(),
+		"prevroom": Game.prevroom.worldKey(),
+		"time": Game.time,
+		"events": sorted(Game.events)
+	}
+
+
+# appends one entry to a save's journal, probably named "journal.jsonl"
+# an entry holds the game header, the player, and the given rooms, one per line,
+# and ends with an 'end' line so that an entry cut off by a crash can be ignored
+# the player and rooms (a dict of room names to rooms) are given as snapshots
+def writeJournal(filename,header,player,rooms):
+	encode = lambda data: json.dumps(data,separators=(",",":"))
+	lines = [f"game\t{encode(header)}", f"player\t{encode(player)}"]
+	for roomName, room in rooms.items():
+		lines.append(f"room\t{roomName}\t{encode(room)}")
+	lines.append("end\n")
+	with open(filename,"a") as fd:
+		fd.write("\n".join(lines))
+		fd.flush()
+		os.fsync(fd.fileno())
+
+
+# the details of the game shown when listing saves, kept in each save's meta.json
+# and in saves/index.json for all of them, so saves are listed without reading them
+def saveMeta():
+	return {
+		"name": Core.player.name,
+		"level": Core.player.level(),
+		"room": Core.game.currentroom.name,
+		"time": Core.game.time,
+		"format": Data.SAVE_FORMAT,
+		"version": SaveFile.VERSION if Data.SAVE_FORMAT == "binary" else None
+	}
+
+
+# completes the details of a save once its files are written, and writes them to
+# the save's meta.json and to the index
+def writeMeta(path,savename,meta):
+	meta = {**meta, "saved": datetime.now().isoformat(timespec="seconds"),
+	"size": sum(entry.stat().st_size for entry in os.scandir(path)
+	if entry.is_file() and entry.name != "meta.json")}
+	writeAtomic(os.path.join(path,"meta.json"),json.dumps(meta))
+	indexSave(os.path.dirname(path),savename,meta)
+
+
+# sets the details of a save in the index in the saves directory, or removes them
+def indexSave(savesPath,savename,meta=None):
+	index = readSaveIndex(savesPath)
+	if meta is None:
+		index.pop(savename,None)
+	else:
+		index[savename] = meta
+	writeAtomic(os.path.join(savesPath,"index.json"),json.dumps(index,indent="\t"))
 
 
 
@@ -150,54 +342,130 @@ def writePlayer(filename,Player):
 #########################
 
 
-def objDecoder(jsonDict):
-	# print("==== converting object of type: " + str(type(jsonDict)))
-	if "__class__" in jsonDict:
-		objClassname = jsonDict["__class__"]
-		# print("=== class is " + objClassname)
-		del jsonDict["__class__"]
-		if objClassname == "set":
-			return set(jsonDict["setdata"])
-		if objClassname == "DialogueTree":
-			return jsonDict
-		if objClassname == "factoryCreature":
-			return Creatures.factory[jsonDict["name"]]()
-		elif objClassname == "factoryItem":
-			return Items.factory[jsonDict["name"]]()
-		objClass = Core.strToClass(objClassname,["Core","Creatures","Items"])
-		if objClass == None:
-			raise Exception("Could not find class for classname in world:",objClassname)
-		objAttributes = jsonDict
-		# print("========: " + jsonDict["name"] + " " + str(objAttributes))
-		if objClassname == "Room":
-			return Core.Room(**objAttributes)
-		elif objClass != None:
-			# if Core.hasMethod(objClass,"convertFromJSON"):
-			# 	return objClass.convertFromJSON(jsonDict)
-			try:
-				return objClass(**objAttributes)
-			except TypeError as e:
-				attributeStr = "\n".join(f"{key}: {value}" for \
-				key, value in objAttributes.items())
-				raise TypeError(f"Failed to instantiate object: '{objClassname}'" \
-				f"from JSON with attributes above: {attributeStr}", e)
-		else:
-			raise Exception("ERROR in decoding JSON object class type: " + objClassname)
-	else:
+# returns a dict of the class names in save files to functions which take the
+# attributes of an object as keyword arguments and return the object
+# most are the classes themselves, so decoding an object is one lookup and one call
+def registerDecoders():
+	decoders = {}
+	for module in (Core,Creatures,Items):
+		for className, objClass in vars(module).items():
+			if isinstance(objClass,type) and objClass.__module__ == module.__name__:
+				decoders[className] = objClass
+	decoders.update({
+		"set": lambda setdata: set(setdata),
+		# trees are rebuilt from Dialogue.json, only their state is kept
+		"DialogueTree": lambda **attributes: attributes,
+		"factoryCreature": lambda **attributes: decodePrototype(Creatures.factory,**attributes),
+		"factoryItem": lambda **attributes: decodePrototype(Items.factory,**attributes)
+	})
+	return decoders
+
+
+# makes an object saved as the name of its Prototype and the attributes which differ
+# from it, with the rest read from the Prototype as it is saved. In the world file,
+# objects may be given by only their factory name, and are spawned from it as new
+def decodePrototype(factory,prototype=None,**attributes):
+	if prototype is None:
+		prototype = attributes.pop("name")
+	prototype = Core.getPrototype(prototype,factory)
+	if not attributes:
+		return prototype.instantiate()
+	if prototype.saved is None:
+		prototype.saved = snapshot(prototype.template)
+	jsonDict = {key: decodeSnapshot(value) for key, value in prototype.saved.items()
+	if key not in attributes}
+	jsonDict.update(attributes)
+	obj = objDecoder(jsonDict)
+	obj.prototype = prototype.name
+	return obj
+
+
+# returns a copy of a snapshot with its objects decoded, as json.loads would decode it
+def decodeSnapshot(value):
+	if isinstance(value,dict):
+		return objDecoder({key: decodeSnapshot(elem) for key, elem in value.items()})
+	if isinstance(value,list):
+		return [decodeSnapshot(elem) for elem in value]
+	return value
+
+
+decoders = registerDecoders()
+# in the world, the player is only a placeholder for the player already loaded
+worldDecoders = {**decoders, "Player": lambda **attributes: Core.player}
+# maps class names to the fields their decoder requires and the fields it accepts
+# (None if it accepts any), found when they are first validated
+decoderFields = {}
+
+
+# the fields required and accepted by a decoder's parameters, following **kwargs
+# up through the parent classes that they are passed on to
+def findFields(decoder):
+	inits = [vars(cls)["__init__"] for cls in decoder.__mro__ if "__init__" in vars(cls)] \
+	if isinstance(decoder,type) else [decoder]
+	required, accepted = None, set()
+	for init in inits:
+		params = list(inspect.signature(init).parameters.values())
+		if init is not decoder:
+			params = params[1:] # skip self
+		if required is None:
+			required = {p.name for p in params if p.default is p.empty and
+			p.kind not in (p.VAR_POSITIONAL,p.VAR_KEYWORD)}
+		accepted |= {p.name for p in params if p.kind != p.VAR_KEYWORD}
+		if not any(p.kind == p.VAR_KEYWORD for p in params):
+			return required, accepted
+	return required, None
+
+
+# raises a TypeError if an object's attributes don't match its decoder's fields
+def validateFields(objClassname,decoder,attributes):
+	if objClassname not in decoderFields:
+		decoderFields[objClassname] = findFields(decoder)
+	required, accepted = decoderFields[objClassname]
+	missing = required - attributes.keys()
+	unexpected = attributes.keys() - accepted if accepted is not None else ()
+	if missing or unexpected:
+		raise TypeError(f"'{objClassname}' in save is missing fields {sorted(missing)} " \
+		f"and has unexpected fields {sorted(unexpected)}")
+
+
+def objDecoder(jsonDict,decoders=decoders):
+	objClassname = jsonDict.pop("__class__",None)
+	if objClassname is None:
 		return jsonDict
+	decoder = decoders.get(objClassname)
+	if decoder is None:
+		decoder = Core.strToClass(objClassname,["Core","Creatures","Items"])
+		if decoder is None:
+			raise Exception("Could not find class for classname in world:",objClassname)
+		decoders[objClassname] = decoder
+	if Data.VALIDATE_SAVE_FIELDS:
+		validateFields(objClassname,decoder,jsonDict)
+	try:
+		return decoder(**jsonDict)
+	except TypeError as e:
+		attributeStr = "\n".join(f"{key}: {value}" for key, value in jsonDict.items())
+		raise TypeError(f"Failed to instantiate object: '{objClassname}'" \
+		f"from JSON with attributes above: {attributeStr}", e)
 
 
 def worldDecoder(jsonDict):
-	if jsonDict.get("__class__",None) == "Player":
-		return Core.player
-	else:
-		return objDecoder(jsonDict)
+	return objDecoder(jsonDict,worldDecoders)
+
+
+# the contents of a file, decompressed if it was written with any of the compressors
+def readData(filename):
+	with open(filename,"rb") as fd:
+		data = fd.read()
+	if data.startswith(XZ_MAGIC):
+		return lzma.decompress(data)
+	# zlib streams begin with 0x78 and a check that makes their first two bytes a multiple of 31
+	if len(data) > 1 and data[0] == 0x78 and (data[0]*256 + data[1]) % 31 == 0:
+		return zlib.decompress(data)
+	return data
 
 
 def readJSON(filename,object_hook=None):
-	with open(filename,"r") as fd:
-		JSON = json.load(fd,object_hook=object_hook)
-	return JSON
+	return json.loads(readData(filename),object_hook=object_hook)
 
 
 def readDialogue(filename):
@@ -211,51 +479,601 @@ def readDialogue(filename):
 	return resDict
 
 
+# opens a save file, which is read from as its sections are needed until it is closed
+def readSaveFile(filename):
+	return SaveFile.SaveFile.open(filename)
+
+
+# a RoomStore of the rooms of a world file, such as World.json
+# the world is compiled into a save file with a section for each room, kept at
+# Data.WORLD_CACHE and rebuilt whenever the world file changes, so that starting a
+# game reads only the rooms it needs, however large the world is
+def readWorld(filename):
+	stat = os.stat(filename)
+	source = [os.path.abspath(filename),stat.st_size,stat.st_mtime_ns]
+	try:
+		save = readSaveFile(Data.WORLD_CACHE)
+		if "source" in save and save.read("source") == source:
+			return RoomStore.fromSaveFile(save)
+		save.close()
+	except (OSError,ValueError):
+		pass
+	world = readJSON(filename)
+	sections = {"source": source, "index": worldIndex(world)}
+	for key, room in world.items():
+		sections[f"room:{key}"] = room
+	os.makedirs(os.path.dirname(Data.WORLD_CACHE),exist_ok=True)
+	writeAtomic(Data.WORLD_CACHE,SaveFile.iterdump(sections,Data.SAVE_COMPRESSION))
+	return RoomStore.fromSaveFile(readSaveFile(Data.WORLD_CACHE))
+
+
+# returns the details of each save (see saveMeta) by name, from the index
+# saves missing from the index are read from their meta.json, if they have one
+def readSaveIndex(savesPath="saves"):
+	if not os.path.isdir(savesPath):
+		return {}
+	filename = os.path.join(savesPath,"index.json")
+	try:
+		index = readJSON(filename) if os.path.exists(filename) else {}
+	except ValueError:
+		index = {}
+	saves = {}
+	for entry in os.scandir(savesPath):
+		if not entry.is_dir():
+			continue
+		meta = index.get(entry.name)
+		metaFile = os.path.join(entry.path,"meta.json")
+		if meta is None and os.path.exists(metaFile):
+			meta = readJSON(metaFile)
+		saves[entry.name] = meta or {}
+	return saves
+
+
+# prints each save and its details, most recently saved first
+def printSaves(saves):
+	for savename, meta in sorted(saves.items(),
+	key=lambda item: item[1].get("saved",""),reverse=True):
+		if not meta:
+			Core.Print(f"  {savename}",delay=0,color="k")
+			continue
+		Core.Print(f"  {savename:<16} {meta['name']}, LV {meta['level']}, " \
+		f"{meta['room']}, time {meta['time']}  ({meta['saved'].replace('T',' ')}, " \
+		f"{meta['size']/1024:.0f} KB)",delay=0,color="k")
+
+
+# finds the largest object ID in a room's data, and the Portal link IDs in it
+def scanRoom(data):
+	maxID = -1
+	linkIDs = set()
+	values = [data]
+	while values:
+		value = values.pop()
+		if isinstance(value,dict):
+			if isinstance(value.get("id"),int):
+				maxID = max(maxID,value["id"])
+			# rooms keep the IDs of their surfaces apart from them
+			for id in value.get("surfaceIDs") or ():
+				if isinstance(id,int):
+					maxID = max(maxID,id)
+			if value.get("__class__") != "Room" and isinstance(value.get("links"),dict):
+				linkIDs.update(dest for dest in value["links"].values() if isinstance(dest,int))
+			values.extend(value.values())
+		elif isinstance(value,list):
+			values.extend(value)
+		elif isinstance(value,str) and value.startswith("port:"):
+			linkIDs.add(value)
+	return maxID, sorted(linkIDs,key=str)
+
+
+# the index of a world's rooms that a RoomStore needs before any are loaded
+def worldIndex(world):
+	index = {"links": {}, "maxID": -1, "maxLinkID": -1}
+	for key, data in world.items():
+		maxID, linkIDs = scanRoom(data)
+		index["maxID"] = max(index["maxID"],maxID)
+		if linkIDs:
+			index["links"][key] = linkIDs
+			index["maxLinkID"] = max([index["maxLinkID"]] +
+			[linkID for linkID in linkIDs if isinstance(linkID,int)])
+	return index
+
+
+
+# Rooms are read from a world file or save only when they are first needed.
+# The world dict starts out holding an empty placeholder for each Room (see
+# Core.Room.stored), which is loaded in place by its room() method or by get(),
+# usually as it comes within render distance. Rooms paired by Portals are loaded
+# together, so a Portal is never paired with one in a room which isn't loaded.
+# Stored rooms are kept on disk rather than in memory, and only where each one is
+# kept is remembered. Rooms in the save file, or the compiled world file (see
+# readWorld), are read by seeking to their section. Rooms stored since then, such
+# as those unloaded once too many are loaded, are appended to a temporary file of
+# JSON records, and are read back from there in the same way.
+class RoomStore():
+	def __init__(self,save=None,index=None):
+		# the save file with a 'room:<key>' section for each room, if any
+		self.save = save
+		# the temporary file of rooms stored since, opened when the first is stored,
+		# and the position and length of each room's latest record in it, by key
+		self.recordFile = None
+		self.records = {}
+		index = index or {"links": {}, "maxID": -1, "maxLinkID": -1}
+		# the Portal link IDs in each room which has any
+		self.links = index["links"]
+		# the largest object ID and Portal link ID in any room
+		self.maxID = index["maxID"]
+		self.maxLinkID = index["maxLinkID"]
+		# maps each link ID to the rooms that have it, found when first needed
+		self.linkRooms = None
+		self.opened = False
+
+
+	# a store of the rooms in a save file, which are decoded only when they're loaded
+	@classmethod
+	def fromSaveFile(cls,save):
+		return cls(save,save.read("index"))
+
+
+	# a store of a dict of room keys to room data, such as from a json save
+	@classmethod
+	def fromRooms(cls,rooms):
+		store = cls()
+		for key, data in rooms.items():
+			store.store(key,data)
+		return store
+
+
+	### Storage ###
+
+	def keys(self):
+		keys = [name[5:] for name in self.save.sections if name.startswith("room:")] \
+		if self.save else []
+		saved = set(keys)
+		return keys + [key for key in self.records if key not in saved]
+
+
+	# a world dict of placeholder Rooms for every stored room
+	def world(self):
+		return {key: Core.Room.stored(key,self) for key in self.keys()}
+
+
+	# store a room's data, replacing any stored before
+	def store(self,key,data,text=None):
+		if text is None:
+			text = json.dumps(data,separators=(",",":"))
+		if self.recordFile is None:
+			self.recordFile = tempfile.TemporaryFile()
+		record = text.encode("utf-8")
+		self.recordFile.seek(0,os.SEEK_END)
+		self.records[key] = (self.recordFile.tell(),len(record))
+		self.recordFile.write(record)
+		maxID, linkIDs = scanRoom(data)
+		self.maxID = max(self.maxID,maxID)
+		self.links.pop(key,None)
+		if linkIDs:
+			self.links[key] = linkIDs
+			self.maxLinkID = max([self.maxLinkID] +
+			[linkID for linkID in linkIDs if isinstance(linkID,int)])
+		self.linkRooms = None
+
+
+	# the JSON text of a room's latest record
+	def record(self,key):
+		pos, length = self.records[key]
+		self.recordFile.seek(pos)
+		return self.recordFile.read(length).decode("utf-8")
+
+
+	# the stored text of a room, as JSON
+	def text(self,key):
+		if key in self.records:
+			return self.record(key)
+		return json.dumps(self.save.read(f"room:{key}"),separators=(",",":"))
+
+
+	# the stored data of a room, as dicts, lists, and primitives
+	def data(self,key):
+		if key in self.records:
+			return json.loads(self.record(key))
+		return self.save.read(f"room:{key}")
+
+
+	# the stored room, decoded into objects
+	def decode(self,key):
+		if key in self.records:
+			return json.loads(self.record(key),object_hook=worldDecoder)
+		return self.save.read(f"room:{key}",worldDecoder)
+
+
+	# the bytes on disk of the rooms which aren't loaded
+	def storedBytes(self):
+		return sum(self.records[key][1] if key in self.records else
+		self.save.size(f"room:{key}") for key, room in Core.world.items()
+		if not room.isLoaded())
+
+
+	# copy the unloaded rooms only in the save file to the records and stop reading
+	# it, so that the file can be replaced
+	def release(self):
+		if self.save is None:
+			return
+		for key, room in Core.world.items():
+			if not room.isLoaded() and key not in self.records:
+				self.store(key,self.save.read(f"room:{key}"))
+		self.save.close()
+		self.save = None
+
+
+	# close the files that rooms are read from, once the game is over
+	def close(self):
+		if self.save is not None:
+			self.save.close()
+		if self.recordFile is not None:
+			self.recordFile.close()
+
+
+	# the keys of the rooms paired with the room with key by Portals, including itself
+	def cluster(self,key):
+		if self.linkRooms is None:
+			self.linkRooms = {}
+			for roomKey, linkIDs in self.links.items():
+				for linkID in linkIDs:
+					self.linkRooms.setdefault(linkID,set()).add(roomKey)
+		cluster = {key}
+		keys = [key]
+		while keys:
+			for linkID in self.links.get(keys.pop(),()):
+				for roomKey in self.linkRooms[linkID] - cluster:
+					cluster.add(roomKey)
+					keys.append(roomKey)
+		return cluster
+
+
+	### Loading ###
+
+	# once the game is made, keep new IDs from being taken by stored objects
+	def open(self,game):
+		game.nextObjId = max(game.nextObjId,self.maxID+1)
+		game.portalLinkIds = max(game.portalLinkIds,self.maxLinkID+1)
+		self.opened = True
+
+
+	# load the unloaded room and those paired with it in place, and build them
+	def load(self,room):
+		assert self.opened, f"Room {room.storedAs} used before the world was built"
+		rooms = [Core.world[key] for key in self.cluster(room.storedAs)]
+		rooms = [stored for stored in rooms if not stored.isLoaded()]
+		for stored in rooms:
+			key = stored.storedAs
+			checkpoints.track(key,self)
+			loaded = self.decode(key)
+			stored.__dict__.clear()
+			stored.__dict__.update(loaded.__dict__)
+			# the room will change once loaded, so its record is out of date
+			self.records.pop(key,None)
+		Core.buildRooms(rooms)
+
+
+	def ensureLoaded(self,room):
+		if not room.isLoaded():
+			self.load(room)
+
+
+	# the room with key in the world, loaded if it isn't already
+	def get(self,key):
+		room = Core.world[key]
+		self.ensureLoaded(room)
+		return room
+
+
+	### Unloading ###
+
+	# when more than Data.MAX_LOADED_ROOMS are loaded, unload those which are
+	# further than Data.ROOM_KEEP_DISTANCE from the player, along with their pairs
+	def unloadDistant(self):
+		loaded = [room for room in Core.world.values() if room.isLoaded()]
+		if len(loaded) <= Data.MAX_LOADED_ROOMS:
+			return
+		# only loaded rooms are searched, so that none are loaded by the search
+		near = {Core.game.currentroom}
+		frontier = [Core.game.currentroom]
+		for _ in range(Data.ROOM_KEEP_DISTANCE):
+			frontier = [dest for room in frontier if room.isLoaded()
+			for dest in room.allDests() if isinstance(dest,Core.Room) and dest not in near]
+			near.update(frontier)
+		nearKeys = {room.worldKey() for room in near}
+
+		unloaded = set()
+		for room in loaded:
+			key = room.worldKey()
+			if key in unloaded or key in nearKeys:
+				continue
+			cluster = self.cluster(key)
+			if not cluster & nearKeys:
+				self.unload([Core.world[key] for key in cluster])
+				unloaded |= cluster
+
+
+	# write rooms back to the store's records and empty them, unregistering their objects
+	def unload(self,rooms):
+		rooms = [room for room in rooms if room.isLoaded()]
+		# rooms are all saved before any are emptied, since paired Portals refer to eachother
+		saved = [(room,snapshot(room)) for room in rooms]
+		for room, data in saved:
+			key = room.worldKey()
+			for obj in room.objTree():
+				if obj not in Core.celestials and Core.game.itemRegistry.holds(obj):
+					Core.game.unregisterItem(obj)
+			room.__dict__.clear()
+			room.__dict__.update(storedAs=key,store=self)
+			self.store(key,data)
+
+
+# keeps the last few turns in memory, so that they can be undone without loading a save
+# a checkpoint is recorded at the end of each turn. It holds the game header and the
+# player, and the rooms which changed during the turn as they were before it, so
+# rewinding to a checkpoint restores the rooms changed in any checkpoint after it
+# the state of each room as of the last checkpoint is kept, so only rooms which
+# may have changed (see Game.markDirty) are encoded, and only those which did are kept
+# checkpoints are dropped oldest first once there are more than Data.CHECKPOINTS,
+# or they hold more than Data.CHECKPOINT_MEMORY bytes of text
+class CheckpointRing():
+	def __init__(self):
+		# each checkpoint is (header text, player text, {room key: text}, size)
+		self.ring = deque()
+		self.size = 0
+		# the text of each room known as of the last checkpoint, by key
+		self.states = {}
+		# set when a turn is undone, so the main loop starts the turn over
+		self.rewound = False
+
+
+	def encode(self,obj):
+		return json.dumps(obj,cls=worldEncoder,separators=(",",":"))
+
+
+	# forget all checkpoints and start from the game as it is now
+	def reset(self):
+		self.ring.clear()
+		self.size = 0
+		self.states = {room.worldKey(): self.encode(room)
+		for room in Core.world.values() if room.isLoaded()}
+		Core.game.changedRooms = set()
+		self.record()
+
+
+	# a room is loaded from the store as it was at every checkpoint since it was stored
+	def track(self,key,store):
+		if key not in self.states:
+			self.states[key] = store.text(key)
+
+
+	def record(self):
+		game = Core.game
+		rooms = {}
+		for room in game.changedRooms:
+			key = room.worldKey()
+			text = self.encode(room)
+			if self.states.get(key,text) != text:
+				rooms[key] = self.states[key]
+			self.states[key] = text
+		game.changedRooms = set()
+		header = json.dumps(gameHeader(game,Core.world))
+		player = self.encode(Core.player.convertToJSON())
+		size = len(header) + len(player) + sum(len(text) for text in rooms.values())
+		self.ring.append((header,player,rooms,size))
+		self.size += size
+		while len(self.ring) > max(Data.CHECKPOINTS,1) or \
+		(self.size > Data.CHECKPOINT_MEMORY and len(self.ring) > 1):
+			self.size -= self.ring.popleft()[3]
+
+
+	# the number of turns that can be undone
+	def depth(self):
+		return len(self.ring) - 1
+
+
+	# restore the game as it was n checkpoints before the last one, which undoes
+	# the last n turns and anything done so far this turn, returns False if it can't
+	def rewind(self,n=1):
+		if not 0 < n <= self.depth():
+			return False
+		# changes made since the last checkpoint are undone with the rest
+		self.record()
+		target = len(self.ring) - n - 2
+		header, player, _, _ = self.ring[target]
+		header = json.loads(header)
+		# the earliest text of each room after the target is how it was at the target
+		rooms = {}
+		for _, _, changed, _ in reversed([self.ring[i] for i in range(target+1,len(self.ring))]):
+			rooms.update(changed)
+		# rooms holding the player are replaced with the rest, along with paired rooms
+		store = Core.roomStore
+		keys = set(rooms) | {Core.game.currentroom.worldKey(),header["currentroom"]}
+		for key in keys:
+			for pairedKey in store.cluster(key):
+				if pairedKey not in rooms and pairedKey in self.states:
+					rooms[pairedKey] = self.states[pairedKey]
+
+		# empty the rooms, unregistering their objects, and store them as they were
+		game = Core.game
+		for key, text in rooms.items():
+			room = Core.world[key]
+			if room.isLoaded():
+				for obj in room.objTree():
+					if obj not in Core.celestials and game.itemRegistry.holds(obj):
+						game.unregisterItem(obj)
+				room.__dict__.clear()
+				room.__dict__.update(storedAs=key,store=store)
+			store.store(key,json.loads(text),text)
+			self.states[key] = text
+		# IDs freed since the target may belong to objects restored with it
+		game.freeIDs = []
+		while len(self.ring) > target + 1:
+			self.size -= self.ring.pop()[3]
+
+		# the player is built with the room they're in
+		Core.player = json.loads(player,object_hook=objDecoder)
+		game.time = header["time"]
+		game.events = set(header["events"])
+		game.currentroom = Core.world[header["currentroom"]]
+		game.prevroom = Core.world[header["prevroom"]]
+		game.whoseTurn = None
+		game.clearPronouns()
+		for room in game.renderedRooms():
+			store.ensureLoaded(room)
+		game.checkDaytime(silent=True)
+		game.checkAstrology(silent=True)
+		game.dirtyRooms.update(Core.world[key] for key in rooms)
+		game.changedRooms = set()
+		self.rewound = True
+		return True
+
+
+checkpoints = CheckpointRing()
+
+
 # reads the global game class file, probably named "game.txt"
 # takes the world dict as input, returns the Game object
 def readGame(filename,World,dlogForest):
-	gfd = open(filename,"r")
-	gametext = gfd.readlines()			# split game file into a list of lines
-	mode = int(gametext[0][:-1])		# first line is gamemode int
-	currentroom = gametext[1][:-1]		# second line is name of current room
-	prevroom = gametext[2][:-1]			# third line is name of previous room
-	time = int(gametext[3][:-1])		# fourth line is time int
-	events = eval(gametext[4][:-1])
-	gfd.close()
+	gametext = readData(filename).decode("utf-8").splitlines()	# split game file into lines
+	mode = int(gametext[0])				# first line is gamemode int
+	currentroom = gametext[1]			# second line is name of current room
+	prevroom = gametext[2]				# third line is name of previous room
+	time = int(gametext[3])				# fourth line is time int
+	events = ast.literal_eval(gametext[4])
 	return Core.Game(mode,World[currentroom],World[prevroom],time,events,dlogForest,
 	Creatures.factory,Items.factory)
 
 
 
+# creates the Game object from a header written by writeJournal()
+def readGameHeader(header,World,dlogForest):
+	return Core.Game(header["mode"],World[header["currentroom"]],World[header["prevroom"]],
+	header["time"],set(header["events"]),dlogForest,Creatures.factory,Items.factory)
+
+
+# reads the complete entries of a journal, without decoding them
+# returns the last game header and player text, the last text of each room by name,
+# and the number of entries
+def readJournal(filename):
+	header, playerText, roomTexts = None, None, {}
+	nEntries = 0
+	if not os.path.exists(filename):
+		return header, playerText, roomTexts, nEntries
+	entry = []
+	with open(filename,"r") as fd:
+		for line in fd:
+			# the last entry may have been cut off while it was written
+			if not line.endswith("\n"):
+				break
+			kind, _, data = line[:-1].partition("\t")
+			if kind != "end":
+				entry.append((kind,data))
+				continue
+			for kind, data in entry:
+				if kind == "game":
+					header = json.loads(data)
+				elif kind == "player":
+					playerText = data
+				elif kind == "room":
+					roomName, _, roomText = data.partition("\t")
+					roomTexts[roomName] = roomText
+			entry = []
+			nEntries += 1
+	return header, playerText, roomTexts, nEntries
+
+
+
 ####################
 ## MENU FUNCTIONS ##
 ####################
 
 
-def quickSave(savename):
+# returns the files of a full save, a dict of filenames to iterables of the bytes
+# to write, which are encoded as they are written
+# in the binary format, save.bin has a section for the game, the player, each room,
+# and an index of the rooms, so that rooms can be read as they're needed. Each section
+# is compressed on its own, where the files of the json format are compressed whole
+def saveFiles(header,player,world,format=None,compression=None):
+	if (format or Data.SAVE_FORMAT) == "binary":
+		sections = {"game": header, "player": player, "index": worldIndex(world)}
+		for key, room in world.items():
+			sections[f"room:{key}"] = room
+		return {"save.bin": SaveFile.iterdump(sections,compression)}
+	encoder = json.JSONEncoder(indent="\t")
+	files = {
+		"world.json": encoder.iterencode(world),
+		"player.json": encoder.iterencode(player),
+		"game.txt": gameText(header)
+	}
+	return {filename: encodeData(data,compression) for filename, data in files.items()}
+
+
+# snapshots the world, player, and game to be written in full in the background
+# the files are all written before any are replaced, and the journal and any files
+# of the other save format are removed
+def writeSave(savename,announce=False):
+	path = os.path.abspath(os.path.join("saves",savename))
+	# rooms can't be read from a save file while it is replaced, so those only in it
+	# are copied to the room store's records first
+	store = Core.roomStore
+	if store.save is not None and store.save.filename == os.path.join(path,"save.bin"):
+		store.release()
+	header = gameHeader(Core.game,Core.world)
+	player = checkedSnapshot(Core.player.convertToJSON())
+	world = checkedSnapshot(Core.world)
+	meta = saveMeta()
+
+	def write():
+		os.makedirs(path,exist_ok=True)
+		files = saveFiles(header,player,world,compression=Data.SAVE_COMPRESSION)
+		temps = [(writeTemp(os.path.join(path,filename),data),filename)
+		for filename, data in files.items()]
+		for filename in ("journal.jsonl","save.bin","world.json","player.json","game.txt"):
+			if filename not in files and os.path.exists(os.path.join(path,filename)):
+				os.remove(os.path.join(path,filename))
+		for tempname, filename in temps:
+			os.replace(tempname,os.path.join(path,filename))
+		writeMeta(path,savename,meta)
+
+	saver.submit(savename,write,announce)
+	Core.game.journalSave = savename
+	Core.game.journalLength = 0
+	Core.game.dirtyRooms = set()
+
+
+# if this save already holds the game, only the rooms changed since are journaled to it
+# every so often the journal is compacted by writing the save in full
+def quickSave(savename,announce=False):
 	assert savename not in ("", "all")
-	# create save directory if it doesn't exist
-	os.makedirs(f"saves/{savename}",exist_ok=True)
-	os.chdir(f"saves/{savename}")
-	writeWorld("world.json", Core.world)
-	writePlayer("player.json", Core.player)
-	writeGame("game.txt", Core.game, Core.world)
-	Core.game.lastSave = Core.game.time
-	os.chdir("../..")
+	game = Core.game
+	if game.journalSave != savename or game.journalLength >= Data.JOURNAL_LENGTH:
+		writeSave(savename,announce)
+	else:
+		path = os.path.abspath(os.path.join("saves",savename))
+		header = gameHeader(game,Core.world)
+		player = checkedSnapshot(Core.player.convertToJSON())
+		rooms = {room.worldKey(): checkedSnapshot(room) for room in game.dirtyRooms}
+		meta = saveMeta()
+		def write():
+			writeJournal(os.path.join(path,"journal.jsonl"),header,player,rooms)
+			writeMeta(path,savename,meta)
+		saver.submit(savename,write,announce)
+		game.journalLength += 1
+		game.dirtyRooms = set()
+	game.lastSave = game.time
 
 
 # saves data from player, world, and game objects to respective text files
 def saveGame(savename=None):
 	# create save directory if it doesn't exist
-	if not os.path.exists("saves"):
-		os.mkdir("saves")
-	os.chdir("saves")
+	os.makedirs("saves",exist_ok=True)
 
-	# split existing save names into a list and display them
-	saves = os.listdir()
 	if savename is None:
-		# player names their save
-		Core.columnPrint(saves,10,10,delay=0,color="k")
+		# display the existing saves, then the player names their save
+		saver.wait()
+		printSaves(readSaveIndex())
 		prompt = "\nWhat name will you give this save file?"
 		savename = Core.Input(prompt,delay=0,color="k").lower()
 	if savename in ("", "all", "autosave", "quicksave") or savename in Data.cancels:
@@ -263,40 +1081,35 @@ def saveGame(savename=None):
 			Core.Print(f"Save name cannot be empty.",delay=0,color="k")
 		else:
 			Core.Print(f"Save name cannot be '{savename}'.",delay=0,color="k")
-		os.chdir("..")
 		return
 
 	# if the save name is used, ask to overwrite it
-	if os.path.exists(savename):
+	path = os.path.join("saves",savename)
+	if os.path.exists(path):
 		Core.Print("A save file with this name already exists.",delay=0,color="k")
 		#if dont overwrite, then just return
 		if not Core.yesno("Would you like to overwrite it?",delay=0,color="k"):
-			os.chdir("..")
 			return
 	# if the save name is unused, make a new directory
 	else:
 		try:
-			os.mkdir(savename)
+			os.mkdir(path)
 		except:
 			Core.Print("Invalid save name.",delay=0,color="k")
-			os.chdir("..")
 			return
 
-	# write world, player, and game files
-	os.chdir(savename)
-	writeWorld("world.json", Core.world)
-	writePlayer("player.json", Core.player)
-	writeGame("game.txt", Core.game, Core.world)
-	os.chdir("../..")
-	sleep(1)
-	Core.Print(f"Game saved as {savename}.",delay=0,color="k")
-	Core.game.lastsave = Core.game.time
-	sleep(1)
+	# world, player, and game files are written in the background
+	writeSave(savename,announce=True)
+	Core.Print(f"Saving game as {savename}...",delay=0,color="k")
+	Core.game.lastSave = Core.game.time
 
 
 # load a game from a save directory
 def loadGame(filename=None):
-	if not (os.path.exists("saves")) or len(os.listdir("./saves")) == 0:
+	# let any save in progress finish first
+	saver.wait()
+	saves = readSaveIndex()
+	if len(saves) == 0:
 		Core.Print("\nThere are no save files.\n",delay=0,color="k")
 		Core.waitInput()
 		return False
@@ -304,10 +1117,8 @@ def loadGame(filename=None):
 
 	if filename is None:
 		Core.clearScreen()
-		# split save names into a list and display them
 		Core.Print("Save files: ",delay=0,color="k")
-		saves = os.listdir()
-		Core.columnPrint(saves,10,10,delay=0,color="k")
+		printSaves(saves)
 		savename = Core.Input("\nWhich save file will you load?",delay=0)
 	else:
 		savename = filename
@@ -317,7 +1128,7 @@ def loadGame(filename=None):
 		return False
 
 	# if user inputs a save name that doesn't exist
-	if not os.path.exists(savename):
+	if savename not in saves:
 		Core.Print(f"\nThere is no save file named '{savename}'.",delay=0,color="k")
 		os.chdir("..")
 		Core.waitInput()
@@ -325,10 +1136,33 @@ def loadGame(filename=None):
 	os.chdir(savename)
 	# try to load the player, world, and game objects
 	# try:
-	Core.player = readJSON("player.json",object_hook=objDecoder)
-	Core.world = readJSON("world.json",object_hook=worldDecoder)
+	# rooms and the player in the journal are newer than those in the full save
+	header, playerText, roomTexts, nEntries = readJournal("journal.jsonl")
+	# saves in the binary format are one file, saves in the json format are three
+	save = readSaveFile("save.bin") if os.path.exists("save.bin") else None
+	# the player is read first, so the world can refer to it
+	if playerText:
+		Core.player = json.loads(playerText,object_hook=objDecoder)
+	elif save:
+		Core.player = save.read("player",objDecoder)
+	else:
+		Core.player = readJSON("player.json",object_hook=objDecoder)
+	# rooms are only read from the save as they're needed
+	if save:
+		store = RoomStore.fromSaveFile(save)
+	else:
+		store = RoomStore.fromRooms(readJSON("world.json"))
+	for roomName, roomText in roomTexts.items():
+		store.store(roomName,json.loads(roomText),roomText)
+	Core.roomStore = store
+	Core.world = store.world()
 	dlogForest = readDialogue("../../gamedata/Dialogue.json")
-	Core.game = readGame("game.txt",Core.world,dlogForest)
+	if header is None and save:
+		header = save.read("game")
+	if header:
+		Core.game = readGameHeader(header,Core.world,dlogForest)
+	else:
+		Core.game = readGame("game.txt",Core.world,dlogForest)
 	# hopefully load doesn't fail, that would suck
 	# except:
 	# 	Core.Print("Could not load game, save data corrupted\n",delay=0,color="k")
@@ -338,6 +1172,11 @@ def loadGame(filename=None):
 
 	os.chdir("../..")
 	Core.buildWorld()
+	# the loaded game matches this save, so later autosaves to it can be journaled
+	Core.game.journalSave = savename
+	Core.game.journalLength = nEntries
+	Core.game.dirtyRooms = set()
+	checkpoints.reset()
 
 	# open side panel
 	Core.player.display()
@@ -358,6 +1197,9 @@ def deleteAll():
 		os.chdir("..")
 		return
 	for savename in os.listdir():
+		if not os.path.isdir(savename):
+			os.remove(savename)
+			continue
 		os.chdir(savename)
 		for filename in os.listdir(): os.remove(filename)
 		os.chdir("..")
@@ -369,7 +1211,9 @@ def deleteAll():
 
 # deletes a save file whose name is given by the user
 def delete(filename):
-	if not os.path.exists("saves") or len(os.listdir("./saves")) == 0:
+	saver.wait()
+	saves = readSaveIndex()
+	if len(saves) == 0:
 		Core.Print("\nThere are no save files.\n",delay=0,color="k")
 		Core.waitInput()
 		return
@@ -377,10 +1221,8 @@ def delete(filename):
 
 	if filename is None:
 		Core.clearScreen()
-		# split save names into a list and display them
 		Core.Print("Save files: ",delay=0,color="k")
-		saves = os.listdir()
-		Core.columnPrint(saves,10,10,delay=0,color="k")
+		printSaves(saves)
 		savename = Core.Input("\nWhich save file will you delete?",delay=0)
 	else:
 		savename = filename
@@ -392,7 +1234,7 @@ def delete(filename):
 		return deleteAll()
 
 	# if the user inputs a save name that doesn't exist
-	if not os.path.exists(savename):
+	if savename not in saves:
 		Core.Print(f"\nThere is no save file named '{savename}'.\n",delay=0,color="k")
 		os.chdir("..")
 		Core.waitInput()
@@ -408,6 +1250,7 @@ def delete(filename):
 		os.remove(filename)
 	os.chdir("..")
 	os.rmdir(savename)
+	indexSave(".",savename)
 	os.chdir("..")
 	sleep(1)
 	Core.waitInput("\nDeleted\n",delay=0,color="k")
@@ -432,7 +1275,8 @@ def newGame():
 	# initializes from the character creation screen
 	Core.player = createCharacter()
 	# tries to load a clean new world from initial world file, must be defined after player
-	Core.world = readJSON("./gamedata/World.json",object_hook=worldDecoder)
+	Core.roomStore = readWorld("./gamedata/World.json")
+	Core.world = Core.roomStore.world()
 
 	Core.game.currentroom = Core.world["cave"]
 	Core.game.prevroom = Core.world["cave"]
@@ -448,6 +1292,7 @@ def newGame():
 	Core.flushInput()
 
 	Core.player.changeLocation(Core.game.currentroom)
+	checkpoints.reset()
 	# describe the current room
 	Core.game.startUp()
 
@@ -455,19 +1300,21 @@ def newGame():
 
 # automatically starts a new game with a premade character for easy testing
 def testGame():
-	inv = [Items.factory["compass"]()]
+	inv = [Core.getPrototype("compass",Items.factory).instantiate()]
 	status = []
 	Core.player = Core.Player("Norman","a hero",29,[4]*10,1000,50,inv=inv,love=100,
 	fear=100,spells=[],status=status)
 
 	# world must be defined after player
-	Core.world = readJSON("gamedata/World.json",object_hook=worldDecoder)
+	Core.roomStore = readWorld("gamedata/World.json")
+	Core.world = Core.roomStore.world()
 
 	dlogForest = readDialogue("gamedata/Dialogue.json")
 	Core.game = Core.Game(0,Core.world["cave"],Core.world["tunnel"],0,set(),dlogForest,
 	Creatures.factory,Items.factory)
 
 	Core.buildWorld()
+	checkpoints.reset()
 
 	Core.clearScreen()
 	Core.flushInput()
@@ -495,10 +1342,15 @@ def mainMenu():
 
 	menucmds = ("info","new","load","delete","quit","test")
 	acceptKey = lambda inp: inp.startswith(menucmds)
+	# the last game is over, so the files its rooms were read from can be replaced
+	if Core.roomStore is not None:
+		Core.roomStore.close()
+		Core.roomStore = None
 	while True:
 		Core.clearScreen()
 		Core.flushInput()
-		print(Data.logo)
+		if Core.outputSink.terminal:
+			print(Data.logo)
 		Core.Print(Data.menuinstructions,end="",delay=0,color="k")
 		g = Core.InputLock(delay=0,acceptKey=acceptKey).split()
 
@@ -546,6 +1398,8 @@ def restart():
 
 
 def quit():
+	saver.wait()
+	saver.report()
 	if Core.game.mode != 1:
 		Core.waitInput("Goodbye.",delay=0,color="k")
 		Core.game.quit = 1
@@ -14,15 +14,19 @@ import Interpreter
 
 
 
-def main(testing=False):
+# output selects the OutputSink for the game; 'terminal', 'transcript', 'structured', or 'null'
+# anything other than a terminal runs headless, without the intro or terminal logging
+def main(testing=False,output=None):
 	# sleep(3)
 	# formatting the prompt window
 	# os.system(f"mode con: lines={str(Data.TERMINAL_HEIGHT)} cols={str(Data.TERMINAL_WIDTH)}")
 	os.system("title Potions ^& Pythons")
 	os.system("color 0F")
 	if "src" in os.getcwd(): os.chdir("..")
+	if output is not None:
+		Core.setOutput(output,logFile="./gamedata/transcript.log")
 
-	if not testing:
+	if not testing and Core.outputSink.terminal:
 		# run intro logo animation
 		Menu.gameIntro()
 
@@ -59,14 +63,21 @@ def main(testing=False):
 					# take user input until player successfully performs an action
 					while not Interpreter.interpret(): continue
 					if Core.game.quit: return Menu.quit()
+					# the player undid a turn, so the turn starts over from before it
+					if Menu.checkpoints.rewound: break
 				else:
 					creature.Act()
 
 		if not Core.player.isAlive(): continue
 		# cleanup before looping
 		Core.game.whoseTurn = None
+		if Menu.checkpoints.rewound:
+			Menu.checkpoints.rewound = False
+			continue
 		# pass the time for all rooms and creatures
 		Core.game.passTime()
+		Menu.checkpoints.record()
+		if Data.VALIDATE_REGISTRY: Core.game.validateRegistry()
 
 		if not Core.player.isAlive(): continue
 		# save game every so often just in case
@@ -81,7 +92,7 @@ def main(testing=False):
 
 
 if __name__ == "__main__":
-	main()
+	main(output=os.environ.get("POPY_OUTPUT"))
 
 
 
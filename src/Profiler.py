@@ -0,0 +1,154 @@
+# Profiler.py
+# This file contains a lightweight profiler for the commands dispatched by the interpreter
+# This file is dependent on Core.py and is a dependency of Interpreter.py
+
+# It records the wall time and number of object queries made by each verb, statcommand,
+# and cheatcode into a rolling window of recent samples, from which it reports
+# percentiles. It is toggled with the \prf cheatcode and costs nothing while disabled;
+# the object query counter and input timers are only patched into Core when enabled.
+
+import json
+import os
+from collections import deque
+from time import perf_counter
+
+import Core
+
+
+
+######################
+## PROFILER CLASSES ##
+######################
+
+
+class VerbProfiler():
+	def __init__(self,window=200):
+		self.enabled = False
+		# number of most recent samples kept for each command
+		self.window = window
+		# maps a command name to a deque of (milliseconds, objQueries) samples
+		self.samples = {}
+		# maps a command name to its kind; 'action', 'statcommand', or 'cheatcode'
+		self.kinds = {}
+		# running totals, sampled before and after each command
+		self.queryCount = 0
+		self.inputTime = 0.0
+		# the original Core functions, which are restored when disabled
+		self.originals = {}
+
+
+	### Operation ###
+
+	# wrap Core.objQuery to count queries, and the input functions to time user input
+	# Core functions look these up as globals, so patching the module reaches them too
+	def enable(self):
+		if self.enabled:
+			return False
+		self.enabled = True
+		self.originals = {name: getattr(Core,name) for name in ("objQuery","Input","waitInput")}
+
+		def countedQuery(*args,**kwargs):
+			self.queryCount += 1
+			return self.originals["objQuery"](*args,**kwargs)
+
+		def timedInput(name):
+			def wrapper(*args,**kwargs):
+				start = perf_counter()
+				try:
+					return self.originals[name](*args,**kwargs)
+				finally:
+					self.inputTime += perf_counter() - start
+			return wrapper
+
+		Core.objQuery = countedQuery
+		Core.Input = timedInput("Input")
+		Core.waitInput = timedInput("waitInput")
+		return True
+
+
+	def disable(self):
+		if not self.enabled:
+			return False
+		for name, func in self.originals.items():
+			setattr(Core,name,func)
+		self.originals = {}
+		self.enabled = False
+		return True
+
+
+	def reset(self):
+		self.samples = {}
+		self.kinds = {}
+
+
+	# call func with args, recording its time and object queries under name
+	# time spent waiting on the player (prompts, 'press any key') is excluded
+	def measure(self,name,kind,func,*args):
+		queries = self.queryCount
+		inputTime = self.inputTime
+		start = perf_counter()
+		try:
+			return func(*args)
+		finally:
+			elapsed = perf_counter() - start - (self.inputTime - inputTime)
+			self.record(name,kind,elapsed*1000,self.queryCount-queries)
+
+
+	def record(self,name,kind,ms,queries):
+		if name not in self.samples:
+			self.samples[name] = deque(maxlen=self.window)
+		self.samples[name].append((ms,queries))
+		self.kinds[name] = kind
+
+
+	### Getters ###
+
+	# nearest-rank percentile of a sorted list
+	def percentile(self,values,p):
+		if not values:
+			return 0
+		rank = max(1,-(-len(values)*p // 100))
+		return values[int(rank)-1]
+
+
+	# returns a dict of summary statistics for each command that has samples
+	def summary(self):
+		stats = {}
+		for name, samples in self.samples.items():
+			times = sorted(ms for ms, _ in samples)
+			queries = sorted(q for _, q in samples)
+			stats[name] = {
+				"kind": self.kinds[name],
+				"n": len(samples),
+				"p50_ms": round(self.percentile(times,50),3),
+				"p95_ms": round(self.percentile(times,95),3),
+				"max_ms": round(times[-1],3),
+				"p50_queries": self.percentile(queries,50),
+				"max_queries": queries[-1]
+			}
+		return stats
+
+
+	### User Output ###
+
+	def report(self):
+		stats = self.summary()
+		if not stats:
+			Core.Print("No commands have been profiled.",color="k")
+			return
+		lines = [f"{'command':<14}{'n':>5}{'p50':>10}{'p95':>10}{'max':>10}{'queries':>10}"]
+		# slowest commands first
+		for name, s in sorted(stats.items(),key=lambda kv: -kv[1]["p95_ms"]):
+			lines.append(f"{name[:13]:<14}{s['n']:>5}{s['p50_ms']:>8.1f}ms" \
+			f"{s['p95_ms']:>8.1f}ms{s['max_ms']:>8.1f}ms{s['p50_queries']:>10}")
+		Core.Print("\n".join(lines),color="k",delay=0)
+
+
+	def dump(self,filename):
+		os.makedirs(os.path.dirname(filename) or ".",exist_ok=True)
+		with open(filename,"w") as fd:
+			json.dump({"window": self.window, "time": Core.game.time,
+			"commands": self.summary()},fd,indent="\t")
+
+
+profiler = VerbProfiler()
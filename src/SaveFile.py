@@ -0,0 +1,360 @@
+# SaveFile.py
+# This file contains the compact binary container that saves are written in
+# This file is dependent on no other files and is a dependency of Menu.py
+
+# A save file starts with a magic string, a format version, and the compression its
+# sections are written with. Next is a contents block, written as JSON, which holds a
+# table of the short strings in the save, each written once, a table of the key sets
+# (shapes) of its dicts, and the position and length of each named section, such as
+# 'game', 'player', and 'room:cave'. Each section holds one value made of dicts, lists,
+# and primitives, such as a snapshot from Menu.snapshot(). Short strings are written as
+# their index in the table, so repeated names, class names, compositions, and status
+# names cost a byte or two each. Longer strings, such as descriptions, are rarely
+# repeated, so each section keeps its own, and the table doesn't grow with the text of
+# the world. Dicts are written as the index of their shape followed by their values,
+# so objects of the same class don't repeat their keys. Integers, such as object IDs,
+# are written as variable length integers.
+
+# Only the header and the contents are read when a save file is opened. Each section
+# is compressed on its own, and is read and decoded only when it is needed, by seeking
+# to it in the file, so a save can hold thousands of rooms and only those in play are
+# ever read. Most values are None, True, False, a small integer, or one of the first
+# strings in the table, and these are written as a single literal byte, which the
+# decoder looks up in one table. Lists and dicts end with a closing byte rather than
+# starting with their length, so the decoder is one loop over the bytes of a section.
+
+import io
+import json
+import lzma
+import os
+import struct
+import zlib
+from itertools import islice
+
+
+
+######################
+## SAVE FILE FORMAT ##
+######################
+
+
+MAGIC = b"PoPySave"
+# increment when the layout changes, old versions can then be read separately
+VERSION = 4
+
+# the byte preceding each value which isn't a literal, identifying its type
+# INT and NEGINT are followed by a variable length integer, FLOAT by a double, STR by
+# its index in the string table, TEXT by its index in the section's own strings, and
+# DICT by the index of its shape
+INT, NEGINT, FLOAT, STR, TEXT, LIST, DICT, ENDLIST, ENDDICT, EMPTYLIST = range(10)
+# bytes from LITERAL up are values themselves; the constants, the integers 0 to
+# SMALLINTS-1, then the first strings in the string table
+LITERAL = 16
+CONSTANTS = (None,True,False)
+SMALLINTS = 64
+SHORTSTR = LITERAL + len(CONSTANTS) + SMALLINTS
+# strings longer than this are kept by the section they are in, not the string table
+LONGSTR = 32
+
+# sections and the contents are compressed with one of these, given by its index
+COMPRESSIONS = (None,"zlib","lzma")
+# raw lzma streams, without the headers and checks that would outweigh small sections
+LZMAFILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 1}]
+compressors = {
+	"zlib": lambda data: zlib.compress(data,6),
+	"lzma": lambda data: lzma.compress(data,lzma.FORMAT_RAW,filters=LZMAFILTERS)
+}
+decompressors = {
+	"zlib": zlib.decompress,
+	"lzma": lambda data: lzma.decompress(data,lzma.FORMAT_RAW,filters=LZMAFILTERS)
+}
+
+DOUBLE = struct.Struct("<d")
+HEADER = struct.Struct("<8sHB")
+SECTIONLENGTH = struct.Struct("<I")
+
+
+# appends n to out as a variable length integer, 7 bits per byte
+def writeVarint(out,n):
+	while n >= 0x80:
+		out.append((n & 0x7f) | 0x80)
+		n >>= 7
+	out.append(n)
+
+
+# returns the variable length integer at pos in data and the position after it
+def readVarint(data,pos):
+	n = 0
+	shift = 0
+	while True:
+		byte = data[pos]
+		pos += 1
+		n |= (byte & 0x7f) << shift
+		if byte < 0x80:
+			return n, pos
+		shift += 7
+
+
+# returns the variable length integer starting with byte and continuing in the
+# iterator it, for reading values as the bytes of a section are iterated over
+def nextVarint(byte,it):
+	n = byte & 0x7f
+	shift = 7
+	while byte >= 0x80:
+		byte = next(it)
+		n |= (byte & 0x7f) << shift
+		shift += 7
+	return n
+
+
+# returns a save file holding each section in sections, a dict of names to values
+def dumps(sections,compression=None):
+	return b"".join(iterdump(sections,compression))
+
+
+# yields a save file holding each section in sections in pieces, to be written in turn
+# the contents come before the sections, so they are all encoded before it is
+# yielded, but they are never joined together
+def iterdump(sections,compression=None):
+	strings = {}
+	shapes = {}
+	# the long strings of the section being encoded
+	texts = {}
+	def index(s):
+		i = strings.get(s)
+		if i is None:
+			i = strings[s] = len(strings)
+		return i
+
+	def write(out,value):
+		if isinstance(value,str):
+			if len(value) > LONGSTR:
+				i = texts.get(value)
+				if i is None:
+					i = texts[value] = len(texts)
+				out.append(TEXT)
+				writeVarint(out,i)
+				return
+			i = index(value)
+			if i < 256-SHORTSTR:
+				out.append(SHORTSTR+i)
+			else:
+				out.append(STR)
+				writeVarint(out,i)
+		elif value is None:
+			out.append(LITERAL)
+		elif value is True:
+			out.append(LITERAL+1)
+		elif value is False:
+			out.append(LITERAL+2)
+		elif isinstance(value,int):
+			if 0 <= value < SMALLINTS:
+				out.append(LITERAL+len(CONSTANTS)+value)
+			elif value >= 0:
+				out.append(INT)
+				writeVarint(out,value)
+			else:
+				out.append(NEGINT)
+				writeVarint(out,-value)
+		elif isinstance(value,float):
+			out.append(FLOAT)
+			out += DOUBLE.pack(value)
+		elif isinstance(value,dict):
+			# like JSON, keys which aren't strings are written as strings
+			shape = tuple(key if isinstance(key,str) else json.dumps(key) for key in value)
+			i = shapes.get(shape)
+			if i is None:
+				i = shapes[shape] = len(shapes)
+			out.append(DICT)
+			writeVarint(out,i)
+			for val in value.values():
+				write(out,val)
+			out.append(ENDDICT)
+		elif isinstance(value,(list,tuple)):
+			if not value:
+				out.append(EMPTYLIST)
+				return
+			out.append(LIST)
+			for val in value:
+				write(out,val)
+			out.append(ENDLIST)
+		else:
+			raise TypeError(f"Cannot write {type(value).__name__} to save file: {value}")
+
+	compress = compressors[compression] if compression else bytes
+	# each section is its long strings, as JSON, followed by its value
+	payloads = []
+	positions = {}
+	pos = 0
+	for name, value in sections.items():
+		texts = {}
+		payload = bytearray()
+		write(payload,value)
+		prefix = bytearray()
+		writeVarint(prefix,len(texts))
+		for text in texts:
+			encoded = text.encode("utf-8")
+			writeVarint(prefix,len(encoded))
+			prefix += encoded
+		payload = compress(prefix + payload)
+		payloads.append(payload)
+		positions[name] = (pos,len(payload))
+		pos += len(payload)
+
+	# the contents are written as JSON, which is decoded faster than it could be read
+	# string by string
+	contents = {"strings": list(strings), "shapes": list(shapes), "sections": positions}
+	contents = compress(json.dumps(contents,ensure_ascii=False,separators=(",",":")).encode("utf-8"))
+	yield HEADER.pack(MAGIC,VERSION,COMPRESSIONS.index(compression)) + \
+	SECTIONLENGTH.pack(len(contents)) + contents
+	yield from payloads
+
+
+
+class SaveFile():
+	# reads the header and contents from fd, a binary file open for reading, which
+	# the sections are read from as they're needed
+	def __init__(self,fd,filename=None):
+		self.fd = fd
+		self.filename = filename
+		header = fd.read(HEADER.size + SECTIONLENGTH.size)
+		if len(header) < HEADER.size + SECTIONLENGTH.size:
+			raise ValueError("Save file is truncated")
+		magic, self.version, compression = HEADER.unpack_from(header,0)
+		if magic != MAGIC:
+			raise ValueError("Not a save file")
+		if self.version != VERSION:
+			raise ValueError(f"Unsupported save file version {self.version}")
+		if compression >= len(COMPRESSIONS):
+			raise ValueError(f"Unknown save file compression {compression}")
+		self.compression = COMPRESSIONS[compression]
+		(length,) = SECTIONLENGTH.unpack_from(header,HEADER.size)
+		contents = fd.read(length)
+		if len(contents) < length:
+			raise ValueError("Save file is truncated")
+		try:
+			contents = json.loads(self.decompress(contents))
+		except (ValueError,zlib.error,lzma.LZMAError) as e:
+			raise ValueError("Save file contents are corrupted") from e
+		# sections are positioned from the end of the contents
+		self.start = HEADER.size + SECTIONLENGTH.size + length
+		self.strings = contents["strings"]
+		# the keys of each dict shape
+		self.shapes = contents["shapes"]
+		# the value of each literal byte, see LITERAL
+		self.literals = [None]*LITERAL + list(CONSTANTS) + list(range(SMALLINTS)) + \
+		self.strings[:256-SHORTSTR]
+		# maps section names to the position and length of their value
+		self.sections = contents["sections"]
+
+
+	# a save file read from the file with filename, which is kept open until closed
+	@classmethod
+	def open(cls,filename):
+		fd = open(filename,"rb")
+		try:
+			return cls(fd,os.path.abspath(filename))
+		except:
+			fd.close()
+			raise
+
+
+	# a save file read from data, such as that returned by dumps()
+	@classmethod
+	def loads(cls,data):
+		return cls(io.BytesIO(data))
+
+
+	def close(self):
+		self.fd.close()
+
+
+	def __contains__(self,name):
+		return name in self.sections
+
+
+	def decompress(self,data):
+		if self.compression is None:
+			return data
+		return decompressors[self.compression](data)
+
+
+	# the size of a section in the file
+	def size(self,name):
+		return self.sections[name][1]
+
+
+	# decodes the value of a section, calling objectHook on each dict as json.load does
+	def read(self,name,objectHook=None):
+		pos, length = self.sections[name]
+		self.fd.seek(self.start + pos)
+		data = self.fd.read(length)
+		try:
+			data = self.decompress(data)
+			count, pos = readVarint(data,0)
+			texts = []
+			for _ in range(count):
+				n, pos = readVarint(data,pos)
+				texts.append(str(data[pos:pos+n],"utf-8"))
+				pos += n
+		except (IndexError,ValueError,zlib.error,lzma.LZMAError) as e:
+			raise ValueError(f"Section '{name}' of save file is corrupted") from e
+		strings = self.strings
+		shapes = self.shapes
+		literals = self.literals
+		# the values of the innermost list or dict being decoded, the keys of its shape
+		# if it is a dict, and the values and keys of the lists and dicts it is within
+		values = []
+		append = values.append
+		keys = None
+		stack = []
+		it = iter(memoryview(data)[pos:])
+		try:
+			for tag in it:
+				if tag >= LITERAL:
+					append(literals[tag])
+				elif tag == STR:
+					i = next(it)
+					append(strings[i if i < 0x80 else nextVarint(i,it)])
+				elif tag == TEXT:
+					i = next(it)
+					append(texts[i if i < 0x80 else nextVarint(i,it)])
+				elif tag == EMPTYLIST:
+					append([])
+				elif tag == DICT:
+					stack.append((values,keys))
+					i = next(it)
+					keys = shapes[i if i < 0x80 else nextVarint(i,it)]
+					values = []
+					append = values.append
+				elif tag == ENDDICT:
+					value = dict(zip(keys,values))
+					if objectHook is not None:
+						value = objectHook(value)
+					values, keys = stack.pop()
+					append = values.append
+					append(value)
+				elif tag == LIST:
+					stack.append((values,keys))
+					keys = None
+					values = []
+					append = values.append
+				elif tag == ENDLIST:
+					value = values
+					values, keys = stack.pop()
+					append = values.append
+					append(value)
+				elif tag == INT:
+					i = next(it)
+					append(i if i < 0x80 else nextVarint(i,it))
+				elif tag == NEGINT:
+					append(-nextVarint(next(it),it))
+				elif tag == FLOAT:
+					append(DOUBLE.unpack(bytes(islice(it,DOUBLE.size)))[0])
+				else:
+					raise ValueError(f"Unknown value type {tag} in save file")
+		except (IndexError,StopIteration,struct.error) as e:
+			raise ValueError(f"Section '{name}' of save file is corrupted") from e
+		if stack or len(values) != 1:
+			raise ValueError(f"Section '{name}' of save file is corrupted")
+		return values[0]
@@ -0,0 +1,229 @@
+# Transcript.py
+# This file contains a structured, compressed transcript of the commands the player enters
+# This file is dependent on Core.py and is a dependency of Interpreter.py
+
+# Each command interpreted while the transcript is recording becomes one JSON event,
+# holding the lines the player typed, the parsed verb and objects, the turn, game time,
+# elapsed milliseconds, and the text printed in response. Events are buffered and
+# written in batches to a gzip compressed JSONL file, which is rotated when it grows
+# too large. The inputs of a recorded session can be exported as a test script to
+# replay it. It is toggled with the \evt cheatcode and costs nothing while disabled.
+
+import os
+import sys
+import gzip
+import json
+import atexit
+from time import perf_counter, time
+
+import Core
+
+
+
+########################
+## TRANSCRIPT CLASSES ##
+########################
+
+
+# writes lines of bytes to a gzip file, in batches of bufferSize lines
+# when more than maxBytes (uncompressed) have been written, the file is rotated
+# to path.1, path.2, ... keeping at most backups old files
+class CompressedSink():
+	def __init__(self,path,maxBytes=4*1024*1024,backups=5,bufferSize=32):
+		self.path = path
+		self.maxBytes = maxBytes
+		self.backups = backups
+		self.bufferSize = bufferSize
+		self.buffer = []
+		self.written = 0
+		self.file = None
+
+
+	# the name of the nth old file, such as events.1.jsonl.gz
+	def backupName(self,n):
+		head, tail = os.path.split(self.path)
+		root, dot, ext = tail.partition(".")
+		return os.path.join(head,f"{root}.{n}{dot}{ext}")
+
+
+	# shift old files up by one, discarding the oldest
+	def rotate(self):
+		if self.file:
+			self.file.close()
+			self.file = None
+		for n in range(self.backups,0,-1):
+			src = self.backupName(n-1) if n > 1 else self.path
+			if os.path.exists(src):
+				os.replace(src,self.backupName(n))
+		self.written = 0
+
+
+	# start a new file, rotating out any previous session
+	def open(self):
+		os.makedirs(os.path.dirname(self.path) or ".",exist_ok=True)
+		if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+			self.rotate()
+		self.file = gzip.open(self.path,"wb",compresslevel=6)
+		self.written = 0
+
+
+	def write(self,line):
+		self.buffer.append(line)
+		if len(self.buffer) >= self.bufferSize:
+			self.flush()
+
+
+	def flush(self):
+		if not self.buffer or self.file is None:
+			return
+		data = b"".join(self.buffer)
+		self.buffer = []
+		self.file.write(data)
+		self.written += len(data)
+		if self.written >= self.maxBytes:
+			self.rotate()
+			self.file = gzip.open(self.path,"wb",compresslevel=6)
+
+
+	# write out the buffer and make the compressed stream readable so far
+	def sync(self):
+		self.flush()
+		if self.file:
+			self.file.flush()
+
+
+	def close(self):
+		self.flush()
+		if self.file:
+			self.file.close()
+			self.file = None
+
+
+
+class EventTranscript():
+	def __init__(self,path="./logs/events.jsonl.gz"):
+		self.path = path
+		self.enabled = False
+		self.sink = None
+		# the event of the command currently being interpreted
+		self.event = None
+		# number of commands interpreted and actions completed this session
+		self.seq = 0
+		self.turns = 0
+		self.start = 0
+
+
+	### Operation ###
+
+	# start recording, capturing printed text with an output filter
+	# and typed lines with an input listener
+	def enable(self,path=None):
+		if self.enabled:
+			return False
+		if path is not None:
+			self.path = path
+		self.sink = CompressedSink(self.path)
+		self.sink.open()
+		self.enabled = True
+		self.seq = 0
+		self.turns = 0
+		self.start = perf_counter()
+		Core.outputFilters.register(Core.OutputFilter("transcript",
+			lambda p: self.event is not None,
+			text=self.captureText,static=False,
+			accepts=lambda color, outfile: outfile in (None,sys.stdout)))
+		Core.inputListeners.append(self.captureInput)
+		self.writeEvent({"type": "session", "start": time(), "time": Core.game.time,
+		"player": Core.player.name})
+		return True
+
+
+	def disable(self):
+		if not self.enabled:
+			return False
+		Core.outputFilters.unregister("transcript")
+		Core.inputListeners.remove(self.captureInput)
+		self.event = None
+		self.enabled = False
+		self.sink.close()
+		self.sink = None
+		return True
+
+
+	def writeEvent(self,event):
+		self.sink.write(json.dumps(event,separators=(",",":")).encode("utf-8") + b"\n")
+
+
+	# call func, recording the command it interprets as one event
+	# returns whatever func returns
+	def record(self,func):
+		self.event = {"type": "command", "seq": self.seq, "turn": self.turns,
+		"time": Core.game.time, "inputs": [], "text": []}
+		self.seq += 1
+		event = self.event
+		start = perf_counter()
+		result = None
+		try:
+			result = func()
+			return result
+		except Exception as e:
+			event["error"] = repr(e)
+			raise
+		finally:
+			event["ms"] = round((perf_counter() - start) * 1000,3)
+			event["t"] = round(start - self.start,3)
+			event["result"] = bool(result)
+			if result:
+				self.turns += 1
+			self.event = None
+			# the command may have turned off the transcript itself
+			if self.enabled and (event["inputs"] or "command" in event):
+				self.writeEvent(event)
+
+
+	# add fields to the current event, does nothing outside of record()
+	def annotate(self,**fields):
+		if self.event is not None:
+			self.event.update(fields)
+
+
+	def captureText(self,text):
+		if self.event is not None and text:
+			self.event["text"].append(Core.ANSI_ESCAPE.sub("",text))
+		return text
+
+
+	def captureInput(self,line):
+		if self.event is not None:
+			self.event["inputs"].append(line)
+
+
+	### Replay ###
+
+	# yields each event in a transcript file, stopping quietly at a truncated end
+	def readEvents(self,path=None):
+		with gzip.open(path or self.path,"rb") as fd:
+			try:
+				for line in fd:
+					yield json.loads(line)
+			except (EOFError,json.JSONDecodeError):
+				return
+
+
+	# writes every line typed in a transcript to filename, one per line
+	# the file can be run with sys.stdin.setInputFile() as in test/Test.py
+	def export(self,filename,path=None):
+		if self.enabled:
+			self.sink.sync()
+		n = 0
+		os.makedirs(os.path.dirname(filename) or ".",exist_ok=True)
+		with open(filename,"w") as fd:
+			for event in self.readEvents(path):
+				for line in event.get("inputs",[]):
+					fd.write(line + "\n")
+					n += 1
+		return n
+
+
+transcript = EventTranscript()
+atexit.register(transcript.disable)
@@ -0,0 +1,286 @@
+import os
+import io
+import sys
+import gc
+import json
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+abspath = os.path.abspath(__file__)
+dname = os.path.dirname(abspath)
+os.chdir(dname)
+sys.path.append("../src")
+
+import Core
+import Menu
+import Memory
+import Creatures
+import SaveFile
+
+
+# times n calls of func, returns the average milliseconds per call
+def timeit(func,n):
+	start = perf_counter()
+	for _ in range(n):
+		func()
+	return (perf_counter() - start) * 1000 / n
+
+
+# prints a row of benchmark results to the real terminal
+def report(name,*results):
+	sys.__stdout__.write(f"{name:<40}" + "".join(f"{r:>16}" for r in results) + "\n")
+
+
+# starts the premade test game without printing to the terminal
+def setUp():
+	Core.setOutput("null")
+	try:
+		Menu.testGame()
+	finally:
+		Core.setOutput("terminal")
+	Core.game.mode = 1 # set to test mode so Print doesn't typewrite
+
+
+# measures Print throughput with and without the status text filters active
+def benchPrintFilters(n=2000):
+	text = Core.game.currentroom.desc + " There are 3 doors to the north and 12 to " \
+	"the southwest. The sword lies there, above the window."
+	stdout = sys.stdout
+	sys.stdout = io.StringIO()
+	try:
+		plain = timeit(lambda: Core.Print(text),n)
+		# blindness keeps the player from navigating, which turns on disorientation
+		# insanity and apathy never print together, since apathy turns insanity off
+		statuses = ("blindness","stupidity","insanity","apathy")
+		for status in statuses:
+			Core.player.addStatus(status,-1,silent=True)
+		filtered = timeit(lambda: Core.Print(text),n)
+		for status in statuses:
+			Core.player.removeStatus(status,silent=True)
+	finally:
+		sys.stdout = stdout
+	report("Print (chars/sec)","no filters","all filters")
+	report("",f"{len(text)/plain*1000:,.0f}",f"{len(text)/filtered*1000:,.0f}")
+
+
+# measures Print throughput through each output sink
+def benchPrintSinks(n=5000):
+	text = Core.game.currentroom.desc
+	stdout = sys.stdout
+	sys.stdout = io.StringIO()
+	results = []
+	try:
+		for kind in ("terminal","structured","null"):
+			sink = Core.setOutput(kind)
+			results.append(timeit(lambda: Core.Print(text,color="g"),n))
+			if kind == "structured":
+				sink.drain()
+	finally:
+		Core.setOutput("terminal")
+		sys.stdout = stdout
+	report("Print (calls/sec)","terminal","structured","null")
+	report("",*(f"{1000/ms:,.0f}" for ms in results))
+
+
+
+# measures color formatting and display width on a long room description,
+# with many colored nouns, and the display names of the items around the player
+def benchFormatting(n=2000):
+	nouns = ["<r>goblin<x>","<o>sword<x>","<y>torch<x>","<g>moss<x>","<b>potion<x>"]
+	text = " ".join(f"{Core.game.currentroom.desc} You see a {noun} here."
+	for noun in nouns*4)
+	colored = Core.formatColorCodes(text)
+	items = [obj for obj in Core.objQuery(Core.game.currentroom,d=3)
+	if isinstance(obj,Core.Item)]
+	results = [
+		timeit(lambda: Core.formatColorCodes(text),n),
+		timeit(lambda: Core.displayLength(colored),n),
+		timeit(lambda: Core.tinge("g",text),n),
+		timeit(lambda: [item.displayName() for item in items],n)
+	]
+	report(f"Formatting (calls/sec, {len(text)} chars)","colorCodes","displayLen",
+	"tinge",f"{len(items)} names")
+	report("",*(f"{1000/ms:,.0f}" for ms in results))
+
+
+# measures the size of a full save in each format, and the time to encode it
+# from a snapshot and decode it back into objects, not counting disk access
+def benchSaveFormats(n=50):
+	header = Menu.gameHeader(Core.game,Core.world)
+	player = Menu.snapshot(Core.player.convertToJSON())
+	world = Menu.snapshot(Core.world)
+
+	def decode(files):
+		if "save.bin" in files:
+			save = SaveFile.SaveFile.loads(files["save.bin"])
+			save.read("player",Menu.objDecoder)
+			for name in save.sections:
+				if name.startswith("room:"):
+					save.read(name,Menu.worldDecoder)
+			save.read("game")
+		else:
+			json.loads(files["player.json"],object_hook=Menu.objDecoder)
+			json.loads(files["world.json"],object_hook=Menu.worldDecoder)
+
+	# the files of a save, encoded into bytes
+	def encode():
+		return {filename: b"".join(Menu.encodeData(data)) for filename, data in
+		Menu.saveFiles(header,player,world,format).items()}
+
+	report("Full save","bytes","save ms","load ms")
+	for format in ("json","binary"):
+		files = encode()
+		size = sum(len(data) for data in files.values())
+		save = timeit(encode,n)
+		load = timeit(lambda: decode(files),n)
+		report(f"  {format}",f"{size:,}",f"{save:.2f}",f"{load:.2f}")
+
+
+# measures the memory used by n Items and n Creatures, not counting their names,
+# descriptions and other shared values, and the time to read their attributes
+def benchObjects(n=10000):
+	def make(cls,*args):
+		tracemalloc.start()
+		objects = [cls(*args) for _ in range(n)]
+		size = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+		return objects, size
+
+	items, itemSize = make(Core.Item,"rock","a small rock",1,5,"stone")
+	creatures, creatureSize = make(Core.Creature,"goblin","a goblin",80,[5]*10)
+	read = lambda: [(obj.name,obj.weight,obj.status,obj.parent,obj.platform)
+	for obj in items]
+	ms = timeit(read,20)
+	report(f"Objects ({n:,} each)","Item bytes","Creature bytes","attrs/sec")
+	report("",f"{itemSize/n:,.0f}",f"{creatureSize/n:,.0f}",f"{5*n/ms*1000:,.0f}")
+
+
+# measures spawning and destroying Items, and replacing one Item with another, with
+# nObjects other Items registered
+def benchRegistry(nObjects=10000,n=2000):
+	game = Core.game
+	others = [game.spawn(Core.Item("rock","a small rock",1,5,"stone")) for _ in range(nObjects)]
+	def spawnDestroy():
+		game.releaseID(game.spawn(Core.Item("rock","a small rock",1,5,"stone")))
+	rock = game.spawn(Core.Item("rock","a small rock",1,5,"stone"))
+	def replace():
+		nonlocal rock
+		pebble = game.spawn(Core.Item("pebble","a pebble",1,1,"stone"))
+		game.releaseID(rock)
+		game.replaceID(rock,pebble)
+		rock = pebble
+	results = [timeit(spawnDestroy,n),timeit(replace,n)]
+	game.releaseID(rock)
+	for obj in others:
+		game.releaseID(obj)
+	report(f"Registry ({nObjects:,} Items, calls/sec)","spawn+destroy","replaceID")
+	report("",*(f"{1000/ms:,.0f}" for ms in results))
+
+
+# measures making n goblins by calling their factory function and by copying their
+# prototype, the memory each one uses, and the size of each as it is saved
+def benchPrototypes(n=2000):
+	prototype = Core.getPrototype("goblin",Creatures.factory)
+	results = []
+	for make in (Creatures.factory["goblin"],prototype.instantiate):
+		ms = timeit(make,n)
+		tracemalloc.start()
+		goblins = [make() for _ in range(n)]
+		size = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+		saved = len(json.dumps(Menu.snapshot(goblins)))
+		results.append((1000/ms,size/n,saved/n))
+	report("Goblins","made/sec","bytes","saved bytes")
+	for name, (rate, size, saved) in zip(("  factory","  prototype"),results):
+		report(name,f"{rate:,.0f}",f"{size:,.0f}",f"{saved:,.0f}")
+
+
+# measures the deep size accounting of the loaded rooms, taking a tracemalloc snapshot,
+# and, for comparison, sizing every object tracked by the garbage collector
+def benchDiagnostics(n=5):
+	tracker = Memory.tracker
+	results = [
+		timeit(tracker.accounting,n),
+		timeit(lambda: [sys.getsizeof(obj) for obj in gc.get_objects()],n)
+	]
+	tracker.enable()
+	results.append(timeit(tracker.takeSnapshot,n))
+	tracker.disable()
+	report("Memory diagnostics (ms)","accounting","gc objects","snapshot")
+	report("",*(f"{ms:.2f}" for ms in results))
+
+
+# returns a snapshot of a world of about nObjects objects, made of copies of the
+# rooms of the test game, and the number of objects in it
+def syntheticWorld(nObjects):
+	def countObjects(data):
+		if isinstance(data,dict):
+			return ("__class__" in data) + sum(countObjects(v) for v in data.values())
+		if isinstance(data,list):
+			return sum(countObjects(v) for v in data)
+		return 0
+
+	rooms = [Menu.snapshot(room) for room in Core.world.values()]
+	world = {}
+	count = 0
+	while count < nObjects:
+		room = rooms[len(world) % len(rooms)]
+		world[f"room {len(world)}"] = room
+		count += countObjects(room)
+	return world, count
+
+
+# measures the size on disk of a full save and the time to write it, including
+# encoding and syncing it to disk, as the old uncompressed json files and as
+# save.bin with each compression, for the test game and a synthetic world
+def benchSaveWrites(nObjects=10000,n=10):
+	header = Menu.gameHeader(Core.game,Core.world)
+	player = Menu.snapshot(Core.player.convertToJSON())
+	worlds = [("test game",Menu.snapshot(Core.world)),
+	(f"{nObjects:,} objects",syntheticWorld(nObjects)[0])]
+	kinds = [("json",None),("binary",None),("binary","zlib"),("binary","lzma")]
+
+	with tempfile.TemporaryDirectory() as path:
+		def write(world,format,compression):
+			for filename, data in Menu.saveFiles(header,player,world,format,compression).items():
+				Menu.writeAtomic(os.path.join(path,filename),data)
+
+		report("Full save write","bytes","write ms")
+		for worldName, world in worlds:
+			for format, compression in kinds:
+				for filename in os.listdir(path):
+					os.remove(os.path.join(path,filename))
+				ms = timeit(lambda: write(world,format,compression),n)
+				size = sum(os.path.getsize(os.path.join(path,filename))
+				for filename in os.listdir(path))
+				report(f"  {worldName}, {format} {compression or ''}",f"{size:,}",f"{ms:.2f}")
+
+
+# measures decoding a synthetic world of about nObjects objects into objects,
+# made of copies of the rooms of the test game, from each save format
+def benchLoad(nObjects=10000,n=5):
+	world, count = syntheticWorld(nObjects)
+	text = json.dumps(world)
+	save = SaveFile.SaveFile.loads(SaveFile.dumps({"world": world}))
+	results = [
+		timeit(lambda: json.loads(text,object_hook=Menu.worldDecoder),n),
+		timeit(lambda: save.read("world",Menu.worldDecoder),n)
+	]
+	report(f"Load {count:,} objects (objects/sec)","json","binary")
+	report("",*(f"{count/ms*1000:,.0f}" for ms in results))
+
+
+if __name__ == "__main__":
+	os.chdir("..")
+	setUp()
+	benchPrintFilters()
+	benchPrintSinks()
+	benchFormatting()
+	benchSaveFormats()
+	benchSaveWrites()
+	benchLoad()
+	benchObjects()
+	benchRegistry()
+	benchPrototypes()
+	benchDiagnostics()
@@ -1,6 +1,11 @@
 
+import gc
+import glob
+import gzip
+import json
 import os
 import sys
+import threading
 
 abspath = os.path.abspath(__file__)
 dname = os.path.dirname(abspath)
@@ -9,6 +14,8 @@ sys.path.append("../src")
 
 import PoPy
 import Core
+import Data
+import Menu
 
 
 # test the main menu
@@ -31,6 +38,51 @@ def testCheatcodes():
 	PoPy.main(testing=True)
 
 
+# tests the developer cheatcodes, such as profiling and rewind, and checks their results
+def testTools():
+	sys.stdin.setInputFile("test/testTools.txt")
+	PoPy.main(testing=True)
+	with open("test/profile.json") as fd:
+		profile = json.load(fd)
+	commands = profile["commands"]
+	assert {"time","inv","take"} <= commands.keys(), commands
+	assert commands["take"]["kind"] == "action" and commands["take"]["n"] == 1, commands
+	os.remove("test/profile.json")
+
+	with gzip.open("test/events.jsonl.gz","rt") as fd:
+		events = [json.loads(line) for line in fd]
+	assert events[0]["type"] == "session", events[0]
+	verbs = [event.get("verb") for event in events[1:]]
+	assert verbs[:3] == ["time","inv","take"], verbs
+	with open("test/replay.txt") as fd:
+		assert fd.read().splitlines() == ["time","inv","take compass and inv"]
+	# the transcript, and any rotated out of the way by an earlier run
+	for filename in glob.glob("test/events*.jsonl.gz"):
+		os.remove(filename)
+	os.remove("test/replay.txt")
+
+	# the three turns waited were rewound
+	assert Core.game.time == 1, Core.game.time
+	assert Menu.checkpoints.depth() == 1, Menu.checkpoints.depth()
+	# rewinding must not leave objects from the undone turns in the registry
+	gc.collect()
+	unreachable, unregistered = Core.game.registryLeaks()
+	assert not unreachable and not unregistered, (unreachable, unregistered)
+
+	# the second diagnostic compares its snapshot with the first, the last doesn't trace
+	with open("test/memoryGrowth.json") as fd:
+		snapshot = json.load(fd)["snapshot"]
+	assert snapshot["since"] == 1 and all("growth" in stat for stat in snapshot["allocations"])
+	with open("test/memory.json") as fd:
+		diagnostics = json.load(fd)
+	accounting = diagnostics["accounting"]
+	assert diagnostics["snapshot"] is None
+	assert accounting["registered"] > 0 and "Player" in accounting["classes"], accounting
+	assert Core.game.currentroom.name.lower() in accounting["rooms"], accounting["rooms"]
+	os.remove("test/memoryGrowth.json")
+	os.remove("test/memory.json")
+
+
 # tests look, listen, and actions which don't alter the world state
 def testInfo():
 	sys.stdin.setInputFile("test/testInfo.txt")
@@ -61,6 +113,88 @@ def testCombat():
 	PoPy.main(testing=True)
 
 
+# tests quitting to the main menu and starting another game in the same session
+def testNewGame():
+	sys.stdin.setInputFile("test/testNewGame.txt")
+	PoPy.main(testing=True)
+	PoPy.main(testing=True)
+	PoPy.main(testing=True)
+
+
+# tests that rooms are loaded only when asked for, and unloaded to records on disk
+def testRoomStore():
+	Menu.testGame()
+	store = Core.roomStore
+	far = next(key for key, room in Core.world.items() if
+	not any(Core.world[k].isLoaded() for k in store.cluster(key)))
+	room = Core.world[far]
+	# unloaded rooms don't load themselves when their attributes are used
+	assert not hasattr(room,"name")
+	assert room.room() is room and room.isLoaded() and room.worldKey() == far
+	name = room.name
+
+	keepDistance, maxLoaded = Data.ROOM_KEEP_DISTANCE, Data.MAX_LOADED_ROOMS
+	Data.ROOM_KEEP_DISTANCE, Data.MAX_LOADED_ROOMS = 3, 0
+	try:
+		store.unloadDistant()
+	finally:
+		Data.ROOM_KEEP_DISTANCE, Data.MAX_LOADED_ROOMS = keepDistance, maxLoaded
+	assert not room.isLoaded() and far in store.records
+	assert store.storedBytes() > 0
+	assert store.get(far) is room and room.name == name and far not in store.records
+
+
+# tests that rewinding undoes changes made to a room without passing any time
+def testRewind():
+	sys.stdin.setInputFile("test/testRewind.txt")
+	PoPy.main(testing=True)
+	assert Core.game.time == 0, Core.game.time
+	# the glen isn't changed by passing time, so it is only restored if the change was seen
+	assert Core.world["glen"].room().desc != "A mossy glen.", Core.world["glen"].desc
+
+
+# tests the input reader on a pseudo-terminal, where flushInput() must discard what was
+# typed before it, waitInput() must return on a keypress, and lines are read in order
+def testInputReader():
+	Menu.testGame()
+	master, slave = os.openpty()
+	stream = os.fdopen(slave,"r")
+	reader, mode = Core.inputReader, Core.game.mode
+	Core.inputReader = Core.InputReader()
+	Core.game.mode = 0
+	try:
+		assert Core.inputReader.start(stream)
+		os.write(master,b"stale\n")
+		Core.inputReader.pending.wait(1)
+		Core.flushInput()
+		assert not Core.kbInput() and Core.inputReader.lines.empty()
+
+		key = threading.Timer(0.2,os.write,(master,b"x"))
+		key.start()
+		Core.waitInput()
+		key.join()
+		assert not Core.kbInput()
+
+		os.write(master,b"look\ntake compass\n")
+		assert Core.inputReader.readline() == "look\n"
+		assert Core.inputReader.readline() == "take compass\n"
+		assert not Core.kbInput()
+	finally:
+		Core.inputReader, Core.game.mode = reader, mode
+		os.close(master)
+		stream.close()
+
+
+# tests a real game run headless on the null sink, which must never wait for a keypress
+def testHeadless():
+	sys.stdin.setInputFile("test/testHeadless.txt")
+	Core.setOutput("null")
+	try:
+		PoPy.main(testing=True)
+	finally:
+		Core.setOutput("terminal")
+
+
 # tests crawl, hide, stealth, mount, laying, flying, jump, climb, swim
 def testMobility():
 	pass
@@ -96,9 +230,15 @@ if __name__ == "__main__":
 	testMenu()
 	testInfo()
 	testCheatcodes()
+	testTools()
 	testNavigation()
 	testInventory()
 	testBasicItems()
 	testCombat()
+	testNewGame()
+	testRoomStore()
+	testRewind()
+	testInputReader()
+	testHeadless()
 	testSpells()
 	print("\nAll tests passed without error\n")